@@ -0,0 +1,149 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.preprocessing import StandardScaler
+from sklearn.linear_model import SGDClassifier, Perceptron
+from sklearn.naive_bayes import MultinomialNB
+import os, sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class IncrementalLearning:
+    """
+    Out-of-core counterpart of SupervisedLearning: the training data is read in chunks (CSV path or
+    any iterable of DataFrames, e.g. SQL cursor batches) and the models are trained with partial_fit,
+    so memory is bounded by chunk_size instead of the dataset size.
+
+    Categorical columns are encoded with a stateless FeatureHasher ("col=value" tokens), numerical
+    columns with a StandardScaler updated chunk by chunk. Accuracy is measured with progressive
+    validation (each chunk is scored before the models learn from it).
+    """
+
+    def __init__(self, categorical_cols=[], numerical_cols=[], target_col=None,
+                 n_features=2 ** 18, chunk_size=50000):
+
+        if not categorical_cols and not numerical_cols:
+            raise Exception('Parâmetros categorical_cols e numerical_cols [inválidos]: informe ao menos uma coluna de entrada')
+
+        self.categorical_cols = categorical_cols
+        self.numerical_cols = numerical_cols
+        self.target_col = target_col
+        self.chunk_size = chunk_size
+
+        self.hasher = FeatureHasher(n_features=n_features, input_type='string', alternate_sign=False)
+        self.scaler = StandardScaler()
+
+        # Model name -> (estimator, uses numerical features). MultinomialNB needs non-negative input,
+        # so it only sees the hashed categorical counts.
+        self.models = {
+            'sgd_classifier': (SGDClassifier(loss='log_loss', tol=1e-3, random_state=42), True),
+            'perceptron': (Perceptron(tol=1e-3, random_state=42), True),
+            'multinomial_nb': (MultinomialNB(), False)
+        }
+
+        self.classes = None
+        self.chunk_metrics = []
+
+    def iter_chunks(self, source, usecols=None):
+        # A path is read with pandas chunks; anything else is taken as an iterable of DataFrames
+        if isinstance(source, str):
+            dtype = {col: str for col in self.categorical_cols + [self.target_col]}
+            return pd.read_csv(source, chunksize=self.chunk_size, usecols=usecols, dtype=dtype)
+        return source
+
+    def scan_classes(self, source):
+        """Collect the target classes with a cheap pass that reads only the target column."""
+        classes = set()
+        for chunk in self.iter_chunks(source, usecols=[self.target_col]):
+            classes.update(chunk[self.target_col].dropna().unique())
+        return np.array(sorted(classes))
+
+    def transform(self, chunk, update_scaler=False):
+        """Returns (X_all, X_cat) sparse CSR matrices for a chunk."""
+        if self.categorical_cols:
+            tokens = np.column_stack([
+                (col + '=' + chunk[col].astype(str)).to_numpy() for col in self.categorical_cols
+            ])
+        else:
+            # No categorical features: an all-zero hashed block, so MultinomialNB only learns the class priors
+            tokens = [[] for _ in range(len(chunk))]
+        X_cat = self.hasher.transform(tokens).tocsr()
+
+        if not self.numerical_cols:
+            return X_cat, X_cat
+
+        numeric = chunk[self.numerical_cols].to_numpy(dtype=np.float64)
+        if update_scaler:
+            self.scaler.partial_fit(numeric)
+
+        # Missing numerical values become the running mean (0 after scaling)
+        scaled = np.nan_to_num(self.scaler.transform(numeric), nan=0.0)
+        X_all = sparse.hstack([sparse.csr_matrix(scaled), X_cat], format='csr')
+        return X_all, X_cat
+
+    def fit(self, source, classes=None):
+        """
+        Train all models chunk by chunk. classes is required by partial_fit; when not given and
+        source is a CSV path it is obtained with scan_classes().
+        """
+        if classes is None:
+            if not isinstance(source, str):
+                raise ValueError('classes must be provided when the source is not a CSV path')
+            classes = self.scan_classes(source)
+        self.classes = np.asarray(classes)
+
+        usecols = None
+        if isinstance(source, str):
+            usecols = self.categorical_cols + self.numerical_cols + [self.target_col]
+
+        start_time_main = time.time()
+        total_rows = 0
+        for i, chunk in enumerate(self.iter_chunks(source, usecols=usecols)):
+            start_time = time.time()
+            chunk = chunk.dropna(subset=[self.target_col])
+            if chunk.empty:
+                continue
+
+            X_all, X_cat = self.transform(chunk, update_scaler=True)
+            y = chunk[self.target_col].to_numpy()
+
+            metrics = {'chunk': i, 'rows': len(chunk)}
+            for name, (model, uses_numeric) in self.models.items():
+                X = X_all if uses_numeric else X_cat
+
+                # Progressive validation: score on the chunk before learning from it
+                if hasattr(model, 'classes_'):
+                    metrics[f'{name}_accuracy'] = float((model.predict(X) == y).mean())
+
+                model.partial_fit(X, y, classes=self.classes)
+
+            elapsed = time.time() - start_time
+            metrics['seconds'] = elapsed
+            metrics['rows_per_second'] = len(chunk) / elapsed if elapsed > 0 else float('inf')
+            self.chunk_metrics.append(metrics)
+
+            total_rows += len(chunk)
+            accuracies = ', '.join(f'{k}={v:.3f}' for k, v in metrics.items() if k.endswith('_accuracy'))
+            print(f'# Chunk {i}: {len(chunk)} rows in {elapsed:.2f} seconds ({metrics["rows_per_second"]:.0f} rows/s) {accuracies}')
+
+        print(f'Completed incremental training of {total_rows} rows in {time.time() - start_time_main:.2f} seconds')
+        return self
+
+    def predict(self, source):
+        """Yields one DataFrame of predictions per chunk, indexed like the source chunk."""
+        usecols = None
+        if isinstance(source, str):
+            usecols = self.categorical_cols + self.numerical_cols
+
+        for chunk in self.iter_chunks(source, usecols=usecols):
+            X_all, X_cat = self.transform(chunk)
+            predictions = pd.DataFrame(index=chunk.index)
+            for name, (model, uses_numeric) in self.models.items():
+                predictions[f'{name}_pred'] = model.predict(X_all if uses_numeric else X_cat)
+            yield predictions
+
+    def metrics_frame(self):
+        return pd.DataFrame(self.chunk_metrics)
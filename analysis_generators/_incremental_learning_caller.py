@@ -0,0 +1,26 @@
+import pandas as pd
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis_generators._incremental_learning import IncrementalLearning
+
+# Setting up project root and paths
+project_root = os.getcwd()
+csv_path = os.path.join(project_root, 'analysis_generators', 'results_analysis', 'custo_km-001.csv')
+
+gen_path = os.path.join(project_root, 'analysis_generators', 'results_analysis')
+
+# Parameter setup: same columns as _supervised_learning_caller, one target at a time
+cat_cols = ['tipoequipamento', 'modelo', 'cidade', 'estabelecimento']
+numerical_col = 'custo_km'
+target_col = os.getenv('INCREMENTAL_TARGET_COL', 'tipoequipamento')
+chunk_size = int(os.getenv('INCREMENTAL_CHUNK_SIZE', 50000))
+
+if __name__ == '__main__':
+    # The CSV is never loaded whole: classes come from a target-only pass, training reads chunk_size rows at a time
+    learner = IncrementalLearning(categorical_cols=[c for c in cat_cols if c != target_col],
+                                  numerical_cols=[numerical_col], target_col=target_col, chunk_size=chunk_size)
+    learner.fit(csv_path)
+
+    metrics_file = os.path.join(gen_path, f'ml_incremental_{target_col}_metrics.csv')
+    learner.metrics_frame().to_csv(metrics_file, sep=';', index=False)
+    print(f'Per-chunk metrics saved to {metrics_file}')
@@ -0,0 +1,73 @@
+import os, sys
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis_generators._supervised_learning_consumer import SupervisedLearningConsumer
+
+# Source frame shared by every target run inside a worker process (set once by the pool initializer)
+_source_df = None
+
+def _init_worker(df):
+    global _source_df
+    _source_df = df
+
+def _run_target(target_col, target_cols, numerical_cols, summary_cols, executor):
+    # Leave-one-out: the other categorical columns are the features for this target
+    cat_cols_run = [col for col in target_cols if col != target_col]
+
+    start_time = time.time()
+    print(f'Starting the workflow for target column: {target_col}...')
+
+    # SupervisedLearning already copies the frame before changing it, so the shared source stays read-only
+    consumer = SupervisedLearningConsumer(_source_df, categorical_cols=cat_cols_run,
+                                          numerical_cols=numerical_cols, target_col=target_col)
+    df_interpreted = consumer.run_workflow(executor=executor)
+
+    df_interpreted = df_interpreted[summary_cols].copy()
+    df_interpreted['feature_context'] = '-'.join(cat_cols_run)
+    df_interpreted['target_feature'] = target_col
+
+    print(f'Finished the workflow for target column: {target_col} in {time.time() - start_time:.2f} seconds.\n')
+    return target_col, df_interpreted
+
+
+class MultiTargetRunner:
+    """
+    Runs the leave-one-out supervised workflow for several target columns in parallel worker
+    processes and streams each interpreted frame to a single ';'-separated CSV as it completes.
+    """
+
+    def __init__(self, df, target_cols, numerical_cols, summary_cols, max_workers=None, executor='thread'):
+        self.df = df
+        self.target_cols = target_cols
+        self.numerical_cols = numerical_cols
+        self.summary_cols = summary_cols
+        self.max_workers = max_workers or min(len(target_cols), os.cpu_count())
+        self.executor = executor  # Executor used for the models inside each target run
+
+    def run(self, output_path, sep=';'):
+        """
+        Fans out one run per target column and appends each result to output_path as soon as it is ready.
+        Row order in the file follows completion order. Returns the targets in the order they were written.
+        """
+        start_time_main = time.time()
+        print(f'Starting workflow for all columns...\n')
+
+        completed = []
+        # The source frame is pickled once per worker (initializer), not once per target
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(self.df,)) as pool:
+            futures = [
+                pool.submit(_run_target, target_col, self.target_cols, self.numerical_cols, self.summary_cols, self.executor)
+                for target_col in self.target_cols
+            ]
+
+            with open(output_path, 'w', encoding='utf-8', newline='') as output:
+                for future in as_completed(futures):
+                    target_col, df_interpreted = future.result()
+                    df_interpreted.to_csv(output, index=True, header=not completed, quoting=csv.QUOTE_NONE, sep=sep)
+                    output.flush()
+                    completed.append(target_col)
+
+        print(f'Finished main workflow in {time.time() - start_time_main:.2f} seconds.\n')
+        return completed
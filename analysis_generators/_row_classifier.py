@@ -1,41 +1,60 @@
+import numpy as np
+import pandas as pd
+
 class RowClassifier:
     def __init__(self):
-        # Dictionary with condition lambdas, weight scores, and codes for descriptions
+        # Dictionary with condition lambdas (row-wise), equivalent column-wise masks, weight scores, and codes for descriptions
         self.stat_condition_lookups = [
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] < 0.1 and row['count'] > 50) and 
                                 (abs(row['avg'] - row['median']) < 0.05 * row['avg']),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] < 0.1) & (df['count'] > 50)) &
+                               ((df['avg'] - df['median']).abs() < 0.05 * df['avg']),
             'weight_score': 5, 'description_code': 'cons_good_sym'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] < 0.1 and row['count'] > 50),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] < 0.1) & (df['count'] > 50)),
             'weight_score': 4.5, 'description_code': 'cons_good'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] >= 0.1) and 
                                 (row['stddev'] / row['avg'] > 0.5),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] >= 0.1)) &
+                               (df['stddev'] / df['avg'] > 0.5),
             'weight_score': 4.5, 'description_code': 'pot_risk_high_var'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] >= 0.1) and 
                                 (row['max'] - row['min'] > 0.5 * row['avg']),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] >= 0.1)) &
+                               (df['max'] - df['min'] > 0.5 * df['avg']),
             'weight_score': 4.5, 'description_code': 'pot_risk_high_vol'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] < 0.1 and row['count'] > 50) and 
                                 (row['sum'] > row['avg'] * row['count']),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] < 0.1) & (df['count'] > 50)) &
+                               (df['sum'] > df['avg'] * df['count']),
             'weight_score': -4, 'description_code': 'cons_bad_high_accum'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] < 0.1 and row['count'] > 50),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] < 0.1) & (df['count'] > 50)),
             'weight_score': -3.5, 'description_code': 'cons_bad'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] >= 0.1) and 
                                 (row['max'] > 1.5 * row['avg']),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] >= 0.1)) &
+                               (df['max'] > 1.5 * df['avg']),
             'weight_score': -5, 'description_code': 'vol_high_peaks'},
 
             {'lambda': lambda row: (row['count'] > 5) and 
                                 (row['max'] / (row['min'] + 1e-6) > 5),
+            'mask': lambda df: (df['count'] > 5) &
+                               (df['max'] / (df['min'] + 1e-6) > 5),
             'weight_score': -4, 'description_code': 'range_disp_high'},
 
             {'lambda': lambda row: (row['count'] > 5 and row['stddev'] >= 0.1),
+            'mask': lambda df: ((df['count'] > 5) & (df['stddev'] >= 0.1)),
             'weight_score': -4, 'description_code': 'high_impact_vol'},
 
             {'lambda': lambda row: (row['count'] < 5),
+            'mask': lambda df: (df['count'] < 5),
             'weight_score': 1, 'description_code': 'stat_insig'}
         ]
         
@@ -77,6 +96,10 @@ class RowClassifier:
                                     (row['trend_detected'] == 'Consistent Trend' or row['model_agreement'] >= 2) and
                                     row['relationship'] == 'Clear Relationship' and
                                     row['performance_reliability'] >= 0.7,
+            'mask': lambda df: (df['consensus_count'] >= 2) &
+                               ((df['trend_detected'] == 'Consistent Trend') | (df['model_agreement'] >= 2)) &
+                               (df['relationship'] == 'Clear Relationship') &
+                               (df['performance_reliability'] >= 0.7),
             'ml_weight_score': 5, 'description_code': 'strong_consistent_rel_high_reliability', 'ml_good_or_bad': 'good'},
 
             # Moderate confidence with higher performance reliability
@@ -84,6 +107,10 @@ class RowClassifier:
                                     (row['trend_detected'] == 'Consistent Trend' or row['model_agreement'] >= 2) and
                                     row['relationship'] == 'Clear Relationship' and
                                     row['performance_reliability'] >= 0.5,
+            'mask': lambda df: (df['consensus_count'] >= 2) & (df['consensus_count'] < 2) &
+                               ((df['trend_detected'] == 'Consistent Trend') | (df['model_agreement'] >= 2)) &
+                               (df['relationship'] == 'Clear Relationship') &
+                               (df['performance_reliability'] >= 0.5),
             'ml_weight_score': 4, 'description_code': 'moderate_consistent_rel_good_performance', 'ml_good_or_bad': 'good'},
 
             # Lower confidence, but reliable performance and consistent
@@ -91,17 +118,26 @@ class RowClassifier:
                                     (row['trend_detected'] == 'Consistent Trend' or row['model_agreement'] >= 1) and
                                     row['relationship'] == 'Clear Relationship' and
                                     row['performance_reliability'] >= 0.4,
+            'mask': lambda df: (df['consensus_count'] <= 1) &
+                               ((df['trend_detected'] == 'Consistent Trend') | (df['model_agreement'] >= 1)) &
+                               (df['relationship'] == 'Clear Relationship') &
+                               (df['performance_reliability'] >= 0.4),
             'ml_weight_score': 3, 'description_code': 'weak_consistent_rel_reliable', 'ml_good_or_bad': 'good'},
 
             # Potential anomaly with inconsistent patterns
             {'lambda': lambda row: row['relationship'] == 'Potential Anomaly' or
                                     (row['trend_detected'] == 'Inconsistent Trend' or row['model_agreement'] < 1),
+            'mask': lambda df: (df['relationship'] == 'Potential Anomaly') |
+                               ((df['trend_detected'] == 'Inconsistent Trend') | (df['model_agreement'] < 1)),
             'ml_weight_score': -5, 'description_code': 'potential_anomaly_inconsistent_patterns', 'ml_good_or_bad': 'bad'},
 
             # Inconsistent trends but clear relationships, with moderate model agreement
             {'lambda': lambda row: row['trend_detected'] == 'Inconsistent Trend' and 
                                     row['relationship'] == 'Clear Relationship' and 
                                     row['model_agreement'] >= 2,
+            'mask': lambda df: (df['trend_detected'] == 'Inconsistent Trend') &
+                               (df['relationship'] == 'Clear Relationship') &
+                               (df['model_agreement'] >= 2),
             'ml_weight_score': -3, 'description_code': 'inconsistent_trends_clear_rel', 'ml_good_or_bad': 'bad'},
 
             # Conflicting patterns with low agreement and low reliability
@@ -109,10 +145,15 @@ class RowClassifier:
                                     (row['trend_detected'] == 'Inconsistent Trend' or row['relationship'] == 'Potential Anomaly') and
                                     row['model_agreement'] < 1 and
                                     row['performance_reliability'] < 0.4,
+            'mask': lambda df: (df['consensus_count'] < 1) &
+                               ((df['trend_detected'] == 'Inconsistent Trend') | (df['relationship'] == 'Potential Anomaly')) &
+                               (df['model_agreement'] < 1) &
+                               (df['performance_reliability'] < 0.4),
             'ml_weight_score': -4, 'description_code': 'conflicting_patterns_low_agreement', 'ml_good_or_bad': 'bad'},
 
             # Default unclassified category for cases that don’t match other conditions
             {'lambda': lambda row: True,  
+            'mask': lambda df: pd.Series(True, index=df.index),
             'ml_weight_score': 0, 'description_code': 'unclassified', 'ml_good_or_bad': 'unclassified'}
         ]
 
@@ -187,6 +228,53 @@ class RowClassifier:
             'ml_good_or_bad': 'unclassified'
         }
 
+    def classify_statistical_frame(self, df, lang='pt-BR'):
+        """
+        Vectorized version of classify_statistical_row for a whole DataFrame.
+        Rules are compiled into boolean masks and the first matching rule wins (np.select),
+        so the result matches applying classify_statistical_row row by row.
+        Returns a DataFrame with 'weight_score', 'description' and 'description_code'.
+        """
+        conditions = self._compile_masks(self.stat_condition_lookups, df)
+        codes = np.select(conditions, [c['description_code'] for c in self.stat_condition_lookups], default='no_match')
+        weights = np.select(conditions, [c['weight_score'] for c in self.stat_condition_lookups], default=0)
+
+        descriptions = self._lookup_descriptions(codes, lang, type='stat')
+        descriptions[codes == 'no_match'] = 'Sem classificação estatística'
+
+        return pd.DataFrame({
+            'weight_score': weights,
+            'description': descriptions,
+            'description_code': codes
+        }, index=df.index)
+
+    def classify_ml_frame(self, df, lang='pt-BR'):
+        """
+        Vectorized version of classify_ml_row for a whole DataFrame, keeping its first-match semantics.
+        Returns a DataFrame with 'ml_weight_score', 'description_code', 'ml_good_or_bad' and 'description'.
+        """
+        conditions = self._compile_masks(self.ml_condition_lookups, df)
+        codes = np.select(conditions, [c['description_code'] for c in self.ml_condition_lookups], default='unclassified')
+        weights = np.select(conditions, [c['ml_weight_score'] for c in self.ml_condition_lookups], default=0)
+        good_or_bad = np.select(conditions, [c['ml_good_or_bad'] for c in self.ml_condition_lookups], default='unclassified')
+
+        return pd.DataFrame({
+            'ml_weight_score': weights,
+            'description_code': codes,
+            'ml_good_or_bad': good_or_bad,
+            'description': self._lookup_descriptions(codes, lang, type='ml')
+        }, index=df.index)
+
+    def _compile_masks(self, condition_lookups, df):
+        # One boolean NumPy array per rule, in the same order as the lookup list
+        return [np.asarray(condition['mask'](df), dtype=bool) for condition in condition_lookups]
+
+    def _lookup_descriptions(self, codes, lang, type='stat'):
+        # Resolve each distinct code once and broadcast back to the rows
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        descriptions = np.array([self.get_description(code, lang=lang, type=type) for code in unique_codes], dtype=object)
+        return descriptions[inverse.reshape(-1)]
+
     def get_description(self, description_code, lang='en-US', type='stat'):
         """
         Look up the description based on the provided code and language.
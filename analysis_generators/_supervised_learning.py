@@ -1,8 +1,7 @@
 import pandas as pd
 import numpy as np
-from sklearn.pipeline import Pipeline
+from scipy import sparse
 from lightgbm import LGBMClassifier
-from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler, OneHotEncoder, LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
@@ -12,12 +11,32 @@ from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.linear_model import RidgeClassifier
 from sklearn.linear_model import SGDClassifier
 from concurrent.futures import ThreadPoolExecutor
+from joblib import Parallel, delayed
 from sklearn.metrics import accuracy_score
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from analysis_generators._row_classifier import RowClassifier
 
+# Models trained by the workflow: prediction column, feature set from build_feature_matrix() and estimator factory
+MODEL_SPECS = {
+    'perform_ridge_classifier': {
+        'pred_col': 'ridge_classifier_pred',
+        'features': 'categorical',
+        'factory': lambda: RidgeClassifier()
+    },
+    'perform_sgd_classifier': {
+        'pred_col': 'sgd_classifier_pred',
+        'features': 'categorical',
+        'factory': lambda: SGDClassifier(loss='log_loss', max_iter=1000, tol=1e-3, random_state=42)
+    },
+    'perform_logistic_regression': {
+        'pred_col': 'logistic_regression_pred',
+        'features': 'all',
+        'factory': lambda: LogisticRegression(max_iter=1000, random_state=42)
+    }
+}
+
 class SupervisedLearning:
 
     def __init__(self, df=None, categorical_cols=[], 
@@ -46,82 +65,79 @@ class SupervisedLearning:
         self.numerical_cols = numerical_cols
         self.row_classifier = RowClassifier()
 
-        # Splitting data into training and testing sets
-        self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(self.X, self.y, test_size=0.3, random_state=42)
+        # Splitting data into training and testing sets (positions are kept to slice the feature matrix)
+        self.train_pos, self.test_pos = train_test_split(np.arange(len(self.X)), test_size=0.3, random_state=42)
+        self.X_train, self.X_test = self.X.iloc[self.train_pos], self.X.iloc[self.test_pos]
+        self.y_train, self.y_test = self.y.iloc[self.train_pos], self.y.iloc[self.test_pos]
 
-    def perform_logistic_regression(self, df):
-        # Define the preprocessor
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('num', StandardScaler(), self.numerical_cols),
-                ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), self.categorical_cols)
-            ]
-        )
+        # Sparse feature matrices shared by all models, built once by build_feature_matrix()
+        self.feature_sets = None
 
-        # Set up pipeline with preprocessing and LogisticRegression
-        model = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', LogisticRegression(max_iter=1000, random_state=42))
-        ])
-        
-        # Fit the model
-        model.fit(self.X_train, self.y_train)
-        
-        # Predict on the full dataset
-        df['logistic_regression_pred'] = model.predict(self.X)
-
-        return df
+    def build_feature_matrix(self):
+        """
+        Fits the scaler/encoder once on X_train and caches sparse CSR matrices for train and full X.
+        feature_sets['categorical'] holds only the one-hot columns (ridge and SGD),
+        feature_sets['all'] holds the scaled numerical columns plus the one-hot columns (logistic regression).
+        Each entry is a (X_train, X_full) tuple.
+        """
+        if self.feature_sets is not None:
+            return self.feature_sets
+
+        encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=True)
+        encoder.fit(self.X_train[self.categorical_cols])
+        cat_matrix = sparse.csr_matrix(encoder.transform(self.X[self.categorical_cols]))
+
+        if self.numerical_cols:
+            scaler = StandardScaler().fit(self.X_train[self.numerical_cols])
+            num_matrix = sparse.csr_matrix(scaler.transform(self.X[self.numerical_cols]))
+            all_matrix = sparse.hstack([num_matrix, cat_matrix], format='csr')
+        else:
+            all_matrix = cat_matrix
+
+        self.feature_sets = {
+            'categorical': (cat_matrix[self.train_pos], cat_matrix),
+            'all': (all_matrix[self.train_pos], all_matrix)
+        }
+        return self.feature_sets
 
+    def perform_logistic_regression(self, df):
+        return self.fit_predict(df, 'perform_logistic_regression')
 
     def perform_ridge_classifier(self, df):
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), self.categorical_cols)
-            ]
-        )
+        return self.fit_predict(df, 'perform_ridge_classifier')
+    
+    def perform_sgd_classifier(self, df):
+        return self.fit_predict(df, 'perform_sgd_classifier')
 
-        # Set up pipeline with preprocessing and RidgeClassifier
-        model = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', RidgeClassifier())
-        ])
-        
-        # Fit the model
-        model.fit(self.X_train, self.y_train)
+    def fit_predict(self, df, name):
+        # Fit the model on the train split of its feature set and predict on the full dataset
+        spec = MODEL_SPECS[name]
+        X_train, X_full = self.build_feature_matrix()[spec['features']]
 
-        # Predict on the full dataset
-        df['ridge_classifier_pred'] = model.predict(self.X)
+        model = spec['factory']()
+        model.fit(X_train, self.y_train)
+        df[spec['pred_col']] = model.predict(X_full)
 
         return df
-    
-    def perform_sgd_classifier(self, df):
-        # Define preprocessor for categorical columns
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), self.categorical_cols)
-            ]
-        )
 
-        # Set up pipeline with preprocessor and SGDClassifier
-        model = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', SGDClassifier(loss='log_loss', max_iter=1000, tol=1e-3, random_state=42))
-        ])
+    def prediction_frame(self):
+        # Empty frame aligned with X: models only add their prediction column, no copy of the data
+        return pd.DataFrame(index=self.X.index)
 
-        # Fit the model
-        model.fit(self.X_train, self.y_train)
+    def run_workflow(self, executor='thread'):
+        if executor == 'process':
+            return self.run_workflow_processes()
 
-        # Predict on the full dataset
-        df['sgd_classifier_pred'] = model.predict(self.X)
-
-        return df
+        # Fit the shared preprocessing once before the models run
+        start_time = time.time()
+        self.build_feature_matrix()
+        print(f'# Completed build_feature_matrix in {time.time() - start_time:.2f} seconds')
 
-    def run_workflow(self):
-        # Define each method and create independent copies of df
+        # Define each method with its own (empty) prediction frame
         tasks = [
-            ("perform_ridge_classifier", self.perform_ridge_classifier, self.df.copy()),
-            ("perform_sgd_classifier", self.perform_sgd_classifier, self.df.copy()),
-            ("perform_logistic_regression", self.perform_logistic_regression, self.df.copy())
+            ("perform_ridge_classifier", self.perform_ridge_classifier, self.prediction_frame()),
+            ("perform_sgd_classifier", self.perform_sgd_classifier, self.prediction_frame()),
+            ("perform_logistic_regression", self.perform_logistic_regression, self.prediction_frame())
         ]
 
         # Dictionary to store results and completion times
@@ -148,12 +164,50 @@ class SupervisedLearning:
 
         return df_ridge, df_sgd, df_lr
 
+    def run_workflow_processes(self, n_jobs=None):
+        """
+        Runs the three models in separate processes (joblib/loky) for real CPU parallelism.
+        The shared sparse feature matrices are memory-mapped to the workers instead of pickling
+        DataFrames, and only the prediction vectors come back. Per-model wall/CPU times are
+        printed and kept in self.model_timings.
+        """
+        start_time = time.time()
+        feature_sets = self.build_feature_matrix()
+        print(f'# Completed build_feature_matrix in {time.time() - start_time:.2f} seconds')
+
+        y_train = self.y_train.to_numpy()
+        names = list(MODEL_SPECS.keys())
+
+        # Arrays above max_nbytes are dumped once to a temp folder and opened read-only by every worker
+        parallel = Parallel(n_jobs=n_jobs or len(names), backend='loky', max_nbytes='1M', mmap_mode='r')
+        outputs = parallel(
+            delayed(fit_predict_model)(name, *feature_sets[MODEL_SPECS[name]['features']], y_train)
+            for name in names
+        )
+
+        results = {}
+        self.model_timings = {}
+        for name, pred, wall_time, cpu_time in outputs:
+            df = self.prediction_frame()
+            df[MODEL_SPECS[name]['pred_col']] = pred
+            results[name] = df
+            self.model_timings[name] = {'wall_time': wall_time, 'cpu_time': cpu_time}
+            print(f'# Completed {name} in {wall_time:.2f} seconds (CPU {cpu_time:.2f} seconds)')
+
+        return results["perform_ridge_classifier"], results["perform_sgd_classifier"], results["perform_logistic_regression"]
+
     def run_workflow_sequencial(self):
         
+        # build_feature_matrix
+        start_time = time.time()
+        print('Starting build_feature_matrix...')
+        self.build_feature_matrix()
+        print(f'Completed build_feature_matrix in {time.time() - start_time:.2f} seconds')
+
         # perform_ridge_classifier
         start_time = time.time()
         print('Starting perform_ridge_classifier...')
-        df_ridge = self.perform_ridge_classifier(self.df.copy())
+        df_ridge = self.perform_ridge_classifier(self.prediction_frame())
         print(f'Completed perform_ridge_classifier in {time.time() - start_time:.2f} seconds')
 
         # perform_sgd_classifier
@@ -308,8 +362,119 @@ class SupervisedLearning:
         return combined_df
 
 
+    def interpret_vectorized(self, original_df, report_ridge_df, report_sgd_df, report_logistic_regression_df):
+        """
+        Column-wise version of interpret(): same output columns and values, without per-row apply calls.
+        """
+        combined_df = original_df.copy()
+        combined_df['ridge_pred'] = report_ridge_df['ridge_classifier_pred'].reindex(original_df.index)
+        combined_df['sgd_pred'] = report_sgd_df['sgd_classifier_pred'].reindex(original_df.index)
+        combined_df['logistic_regression_pred'] = report_logistic_regression_df['logistic_regression_pred'].reindex(original_df.index)
+
+        target = combined_df[self.target_col]
+        ridge_pred = combined_df['ridge_pred']
+        sgd_pred = combined_df['sgd_pred']
+        lr_pred = combined_df['logistic_regression_pred']
+
+        # Validate labels: Create columns to compare predictions with actual labels
+        combined_df['ridge_correct'] = target == ridge_pred
+        combined_df['sgd_correct'] = target == sgd_pred
+        combined_df['lr_correct'] = target == lr_pred
+
+        # Calculate consensus: How many models agree on a prediction
+        ridge_sgd = (ridge_pred == sgd_pred).to_numpy()
+        ridge_lr = (ridge_pred == lr_pred).to_numpy()
+        sgd_lr = (sgd_pred == lr_pred).to_numpy()
+        consensus_count = ridge_sgd.astype(int) + ridge_lr.astype(int) + sgd_lr.astype(int)
+        combined_df['consensus_count'] = consensus_count
+
+        # Majority vote size: 3 if all agree, 2 if any pair agrees, otherwise 1
+        combined_df['model_agreement'] = np.where(consensus_count == 3, 3, np.where(consensus_count >= 1, 2, 1))
+
+        # Detect trends and relationships
+        combined_df['trend_detected'] = np.where(consensus_count >= 3, 'Consistent Trend', 'Inconsistent Trend')
+        combined_df['relationship'] = np.where(
+            ~combined_df['ridge_correct'] & ~combined_df['sgd_correct'] & ~combined_df['lr_correct'],
+            'Potential Anomaly', 'Clear Relationship'
+        )
+
+        combined_df = combined_df.dropna(subset=[self.target_col, 'ridge_pred'])
+
+        # Accuracy of a single prediction is just the correctness flag as float
+        combined_df['ridge_accuracy'] = combined_df['ridge_correct'].astype(float)
+        combined_df['sgd_accuracy'] = combined_df['sgd_correct'].astype(float)
+        combined_df['lr_accuracy'] = combined_df['lr_correct'].astype(float)
+
+        # Calculate the average accuracy to represent performance reliability
+        combined_df['performance_reliability'] = combined_df[['ridge_accuracy', 'sgd_accuracy', 'lr_accuracy']].mean(axis=1)
+
+        # Add the `target_col` column to track which feature was the target in each run
+        combined_df['target_col'] = self.target_col
+
+        # ML classification for the whole frame at once
+        classification = self.row_classifier.classify_ml_frame(combined_df, lang='pt-BR')
+        for col in ['ml_weight_score', 'description_code', 'ml_good_or_bad', 'description']:
+            combined_df[col] = classification[col]
+
+        # Recommendation for replacement
+        reliability = combined_df['performance_reliability']
+        inconsistent = combined_df['trend_detected'] == 'Inconsistent Trend'
+        anomaly = combined_df['relationship'] == 'Potential Anomaly'
+        combined_df['recomend_replacement'] = np.where(
+            (reliability < 0.5) | inconsistent | anomaly | (combined_df['ml_weight_score'] < 0), 'yes', 'no'
+        )
+
+        # Round all numerical columns to 2 decimal places
+        numeric_cols = [col for col, dtype in combined_df.dtypes.items()
+                        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+        combined_df[numeric_cols] = combined_df[numeric_cols].round(2)
+
+        # Same decision tree as generate_action_summary in interpret(), evaluated in order
+        reliability = combined_df['performance_reliability']
+        agreement = combined_df['model_agreement']
+        replace = combined_df['recomend_replacement'] == 'yes'
+        bad = combined_df['ml_good_or_bad'] == 'bad'
+        inconsistent_or_anomaly = (combined_df['trend_detected'] == 'Inconsistent Trend') | (combined_df['relationship'] == 'Potential Anomaly')
+
+        conditions = [
+            replace & bad,
+            replace & (reliability < 0.5),
+            replace,
+            inconsistent_or_anomaly & (agreement < 2),
+            inconsistent_or_anomaly,
+            (reliability >= 0.85) & (agreement >= 3),
+            (reliability >= 0.7) & (combined_df['trend_detected'] == 'Consistent Trend'),
+            (reliability >= 0.6) & (reliability < 0.7),
+            bad & (reliability < 0.6)
+        ]
+        choices = [
+            "Sugerir substituição imediata devido a problemas críticos na confiabilidade e anomalias.",
+            "Sugerir substituição devido à baixa confiabilidade, desempenho e tendências inconsistentes.",
+            "Revisar substituição devido a problemas moderados de confiabilidade ou consistência.",
+            "Sugerir investigação devido a potenciais inconsistências.",
+            "Investigar possíveis inconsistências ou anomalias detectadas nas tendências.",
+            "Alta previsibilidade: continuar com a abordagem atual.",
+            "Bom desempenho: continuar com ação mínima. Monitorar para quaisquer mudanças.",
+            "Desempenho satisfatório porém no limite. Monitorar de perto e ajustar se o desempenho piorar.",
+            "Sugerir substituição devido à baixa previsibilidade."
+        ]
+        combined_df['action_summary'] = np.select(conditions, choices, default="Monitorar desempenho e consistência.")
+
+        return combined_df
+
 def run_with_timing(func, df):
     start_time = time.time()
     result = func(df)
     elapsed_time = time.time() - start_time
-    return result, elapsed_time
\ No newline at end of file
+    return result, elapsed_time
+
+def fit_predict_model(name, X_train, X_full, y_train):
+    # Process worker: receives only arrays (memory-mapped) and returns the prediction vector with timings
+    start_wall = time.time()
+    start_cpu = time.process_time()
+
+    model = MODEL_SPECS[name]['factory']()
+    model.fit(X_train, y_train)
+    pred = model.predict(X_full)
+
+    return name, pred, time.time() - start_wall, time.process_time() - start_cpu
@@ -19,11 +19,11 @@ class SupervisedLearningConsumer:
                                                      numerical_cols=self.numerical_cols,
                                                      target_col=self.target_col, id_col=id_col)
 
-    def run_workflow(self):
-        # Run all models and return the final DataFrame with predictions
-        df_ridge, df_sgd, df_lr = self.supervised_learner.run_workflow()
+    def run_workflow(self, executor='thread'):
+        # Run all models and return the final DataFrame with predictions ('thread' or 'process' executor)
+        df_ridge, df_sgd, df_lr = self.supervised_learner.run_workflow(executor=executor)
         start_time = time.time()
         print('Starting ML interpretation...')
-        df_interpreted = self.supervised_learner.interpret(self.df, df_ridge, df_sgd, df_lr)
+        df_interpreted = self.supervised_learner.interpret_vectorized(self.df, df_ridge, df_sgd, df_lr)
         print(f'ML interpretation completed in {time.time() - start_time:.2f} seconds.')
         return df_interpreted
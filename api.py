@@ -1,9 +1,18 @@
 import requests, base64
 import re, json, time, os
+import asyncio, random
+import aiohttp
 from dotenv import load_dotenv
+from services.payload_cache import PayloadCache
 
 load_dotenv()
 
+SERPRO_TOKEN_URL = "https://gateway.apiserpro.serpro.gov.br/token"
+
+# Cache em memória do token (evita reler token.json a cada chamada)
+_token_data = None
+_payload_cache = None
+
 def get_token(client_id, client_secret):
     """
     Obtém o token de autenticação via OAuth2.
@@ -27,7 +36,7 @@ def get_token_with_basic_auth():
     """
     Obtém o token de autenticação via OAuth2 usando Authorization Basic.
     """
-    url = "https://gateway.apiserpro.serpro.gov.br/token"
+    url = SERPRO_TOKEN_URL
     consumer_key = os.getenv('SERPRO_CONSUMER_KEY')
     consumer_secret = os.getenv('SERPRO_CONSUMER_SECRET')
 
@@ -57,41 +66,75 @@ def get_token_with_basic_auth():
     else:
         raise Exception(f"Erro ao obter token: {response.status_code} - {response.text}")
 
-def get_valid_token():
+def get_valid_token(refresh_margin=60):
     """
-    Retorna um token válido. Se expirado ou não existir, obtém um novo token.
+    Retorna um token válido. Se expirado (ou a menos de refresh_margin segundos de expirar)
+    ou não existir, obtém um novo token. O token fica em memória; token.json só é lido na primeira chamada.
     """
+    global _token_data
     token_file = 'token.json'
 
-    if os.path.exists(token_file):
+    if _token_data is None and os.path.exists(token_file):
         try:
             with open(token_file, 'r') as file:
-                token_data = json.load(file)
-                expires_in = token_data.get('expires_in', 0)
-                last_time_request = token_data.get('last_time_request', 0)
-
-                if time.time() - last_time_request < expires_in:
-                    return token_data['access_token']
-                else:
-                    print("Token expirado. Obtendo um novo token...")
+                _token_data = json.load(file)
         except (json.JSONDecodeError, KeyError):
             print("Erro ao ler o arquivo de token. Obtendo um novo token...")
 
+    if _token_data is not None:
+        expires_in = _token_data.get('expires_in', 0)
+        last_time_request = _token_data.get('last_time_request', 0)
+
+        if time.time() - last_time_request < expires_in - refresh_margin and 'access_token' in _token_data:
+            return _token_data['access_token']
+        else:
+            print("Token expirado. Obtendo um novo token...")
+
     # Se o token não existe ou está inválido, obter um novo
-    token_data = get_token_with_basic_auth()
-    return token_data['access_token']
+    _token_data = get_token_with_basic_auth()
+    return _token_data['access_token']
+
+def get_payload_cache():
+    """
+    Cache local (zstd) das respostas da API de NFe, compartilhado pelo processo.
+    SERPRO_CACHE_DIR='' desativa o cache; SERPRO_CACHE_MAX_MB limita o tamanho.
+    """
+    global _payload_cache
+    cache_dir = os.getenv('SERPRO_CACHE_DIR', '.serpro_cache')
+    if not cache_dir:
+        return None
+    if _payload_cache is None:
+        _payload_cache = PayloadCache(cache_dir, max_bytes=int(os.getenv('SERPRO_CACHE_MAX_MB', 512)) * 1024 * 1024)
+    return _payload_cache
+
+def render_nf_url(url, tokenAutorizacao, cnpj, data_inicio=None, data_fim=None):
+    """
+    Preenche os parâmetros da URL da API de NFe por CNPJ (SERPRO_API_NF_POR_CNPJ).
+    """
+    url = url.replace('{tokenAutorizacao}', tokenAutorizacao).replace('{cnpj}', cnpj)
+    if data_inicio is not None:
+        url = url.replace('{dataInicio}', str(data_inicio))
+    if data_fim is not None:
+        url = url.replace('{dataFim}', str(data_fim))
+    return url
 
-def consultar_nfs_por_cnpj(tokenAutorizacao, tokenApiClient, cnpj):
+def consultar_nfs_por_cnpj(tokenAutorizacao, tokenApiClient, cnpj, data_inicio=None, data_fim=None, use_cache=True):
     """
     Consulta várias NFes associadas a um CNPJ na API do Serpro.
+    Respostas já obtidas para o mesmo CNPJ e período vêm do cache local (get_payload_cache()).
     """
     
+    cache = get_payload_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(cnpj, data_inicio, data_fim)
+        if cached is not None:
+            return cached
+
     url = os.getenv('SERPRO_API_NF_POR_CNPJ')
     if url is None:
         raise Exception('URL da API de NFe [SERPRO_API_NF_POR_CNPJ] não informado em consultar_nfs_por_cnpj()')
 
-    url.replace('{tokenAutorizacao}', tokenAutorizacao)
-    url.replace('{cnpj}', cnpj)
+    url = render_nf_url(url, tokenAutorizacao, cnpj, data_inicio, data_fim)
 
     headers = {
         'Authorization': f'Bearer {tokenApiClient}',
@@ -101,10 +144,245 @@ def consultar_nfs_por_cnpj(tokenAutorizacao, tokenApiClient, cnpj):
     response = requests.get(url, headers=headers)
 
     if response.status_code == 200:
-        return response.json()
+        payload = response.json()
+        if cache is not None:
+            cache.put(cnpj, data_inicio, data_fim, payload)
+        return payload
     else:
         raise Exception(f"Erro ao consultar NFes por CNPJ: {response.status_code} - {response.text}")
 
+class AsyncRateLimiter:
+    """
+    Token bucket assíncrono: no máximo rate requisições por segundo, com rajadas de até burst.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncTokenCache:
+    """
+    Token OAuth2 em memória com renovação antecipada (refresh_margin segundos antes de expirar).
+    Um lock garante uma única renovação quando várias requisições encontram o token vencido.
+    """
+
+    def __init__(self, fetch_token, refresh_margin=60, token_file='token.json'):
+        self.fetch_token = fetch_token  # coroutine -> dict com access_token e expires_in
+        self.refresh_margin = refresh_margin
+        self.token_file = token_file
+        self.refresh_count = 0
+
+        self._token = None
+        self._expires_at = 0
+        self._lock = asyncio.Lock()
+        self._load_token_file()
+
+    def _valid(self):
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    async def get_token(self):
+        if self._valid():
+            return self._token
+
+        async with self._lock:
+            # Outra corrotina pode ter renovado enquanto esperávamos o lock
+            if not self._valid():
+                token_data = await self.fetch_token()
+                token_data['last_time_request'] = time.time()
+                self._token = token_data['access_token']
+                self._expires_at = token_data['last_time_request'] + token_data.get('expires_in', 0)
+                self.refresh_count += 1
+                self._save_token_file(token_data)
+            return self._token
+
+    def invalidate(self, token):
+        # Só descarta se ainda for o mesmo token (evita invalidar um token recém-renovado)
+        if token == self._token:
+            self._expires_at = 0
+
+    def _load_token_file(self):
+        if self.token_file is None or not os.path.exists(self.token_file):
+            return
+        try:
+            with open(self.token_file, 'r') as file:
+                token_data = json.load(file)
+            self._token = token_data['access_token']
+            self._expires_at = token_data.get('last_time_request', 0) + token_data.get('expires_in', 0)
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    def _save_token_file(self, token_data):
+        if self.token_file is None:
+            return
+        try:
+            with open(self.token_file, 'w') as file:
+                json.dump(token_data, file)
+        except OSError as e:
+            print(f"Erro ao gravar o arquivo de token: {e}")
+
+class SerproAsyncClient:
+    """
+    Cliente assíncrono da API de NFe do Serpro para consultar vários CNPJs em paralelo.
+
+    Uma única aiohttp.ClientSession (pool de conexões keep-alive) é usada por todas as consultas;
+    a concorrência é limitada por max_concurrency e a taxa por rate_per_second (cota do Serpro).
+    Respostas 429/5xx e erros de rede são repetidos com backoff exponencial com jitter
+    (respeitando Retry-After); um 401 renova o token uma vez. Respostas já obtidas para o mesmo
+    CNPJ e período vêm do cache local (cache, padrão get_payload_cache(); use_cache=False desativa).
+
+    Uso:
+        async with SerproAsyncClient() as client:
+            resultados = await client.consultar_nfs_por_cnpjs(clientes, '2024-10-01', '2024-10-31')
+    """
+
+    def __init__(self, consumer_key=None, consumer_secret=None, token_url=SERPRO_TOKEN_URL, nf_url=None,
+                 max_concurrency=None, rate_per_second=None, max_attempts=5, base_delay=0.5, max_delay=30.0,
+                 timeout=60, token_file='token.json', cache=None, use_cache=True):
+        self.consumer_key = consumer_key or os.getenv('SERPRO_CONSUMER_KEY')
+        self.consumer_secret = consumer_secret or os.getenv('SERPRO_CONSUMER_SECRET')
+        self.token_url = token_url
+        self.nf_url = nf_url or os.getenv('SERPRO_API_NF_POR_CNPJ')
+        self.max_concurrency = int(max_concurrency or os.getenv('SERPRO_MAX_CONCURRENCY', 8))
+        self.rate_per_second = float(rate_per_second or os.getenv('SERPRO_RATE_PER_SECOND', 5))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.token_file = token_file
+        self.cache = (cache or get_payload_cache()) if use_cache else None
+
+        self.session = None
+        self.tokens = None
+        self.limiter = None
+        self.semaphore = None
+        self.stats = {'requests': 0, 'retries': 0, 'errors': 0}
+
+    async def __aenter__(self):
+        if not self.consumer_key or not self.consumer_secret:
+            raise Exception("SERPRO_CONSUMER_KEY ou CONSUMER_SECRET não definidos no arquivo .env")
+        if self.nf_url is None:
+            raise Exception('URL da API de NFe [SERPRO_API_NF_POR_CNPJ] não informado')
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.tokens = AsyncTokenCache(self._fetch_token, token_file=self.token_file)
+        self.limiter = AsyncRateLimiter(self.rate_per_second)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        if self.cache is not None:
+            self.cache.flush()
+
+    async def _fetch_token(self):
+        credentials = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
+        headers = {
+            'Authorization': f'Basic {credentials}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        async with self.session.post(self.token_url, data={'grant_type': 'client_credentials'}, headers=headers) as response:
+            if response.status == 200:
+                return await response.json(content_type=None)
+            raise Exception(f"Erro ao obter token: {response.status} - {await response.text()}")
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        # Backoff exponencial com "full jitter"
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def get_json(self, url):
+        """
+        GET autenticado com limite de taxa/concorrência e retentativas. Retorna o JSON da resposta.
+        """
+        token_refreshed = False
+        last_error = None
+        for attempt in range(self.max_attempts):
+            await self.limiter.acquire()
+            async with self.semaphore:
+                token = await self.tokens.get_token()
+                headers = {
+                    'Authorization': f'Bearer {token}',
+                    'Content-Type': 'application/json'
+                }
+                self.stats['requests'] += 1
+                try:
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+
+                        text = await response.text()
+                        if response.status == 401 and not token_refreshed:
+                            self.tokens.invalidate(token)
+                            token_refreshed = True
+                            continue
+                        if response.status != 429 and response.status < 500:
+                            self.stats['errors'] += 1
+                            raise Exception(f"Erro ao consultar NFes por CNPJ: {response.status} - {text}")
+
+                        last_error = f"{response.status} - {text}"
+                        delay = self._retry_delay(attempt, response.headers.get('Retry-After'))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_error = str(e) or type(e).__name__
+                    delay = self._retry_delay(attempt)
+
+            # Espera fora do semáforo para não bloquear as outras consultas
+            self.stats['retries'] += 1
+            print(f"Erro na consulta ({last_error}), tentativa {attempt + 1} de {self.max_attempts}, aguardando {delay:.1f} segundos...")
+            await asyncio.sleep(delay)
+
+        self.stats['errors'] += 1
+        raise Exception(f"Erro ao consultar NFes por CNPJ após {self.max_attempts} tentativas: {last_error}")
+
+    async def consultar_nfs_por_cnpj(self, tokenAutorizacao, cnpj, data_inicio=None, data_fim=None):
+        cnpj = remove_non_numeric_chars(cnpj)
+        if self.cache is not None:
+            cached = self.cache.get(cnpj, data_inicio, data_fim)
+            if cached is not None:
+                return cached
+
+        url = render_nf_url(self.nf_url, tokenAutorizacao, cnpj, data_inicio, data_fim)
+        payload = await self.get_json(url)
+        if self.cache is not None:
+            self.cache.put(cnpj, data_inicio, data_fim, payload)
+        return payload
+
+    async def consultar_nfs_por_cnpjs(self, clientes, data_inicio=None, data_fim=None):
+        """
+        Consulta todos os clientes ([{'tokenAutorizacao': ..., 'cnpj': ...}]) em paralelo.
+        Retorna {cnpj: resultado}; CNPJs com falha recebem a exceção como resultado.
+        """
+        tasks = [self.consultar_nfs_por_cnpj(c['tokenAutorizacao'], c['cnpj'], data_inicio, data_fim) for c in clientes]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return {remove_non_numeric_chars(c['cnpj']): result for c, result in zip(clientes, results)}
+
+def consultar_nfs_por_cnpjs(clientes, data_inicio=None, data_fim=None, **client_kwargs):
+    """
+    Versão síncrona de SerproAsyncClient.consultar_nfs_por_cnpjs.
+    """
+    async def run():
+        async with SerproAsyncClient(**client_kwargs) as client:
+            return await client.consultar_nfs_por_cnpjs(clientes, data_inicio, data_fim)
+    return asyncio.run(run())
+
 def remove_non_numeric_chars(input_string):
     """
     Remove caracteres não numéricos de uma string.
@@ -126,29 +404,15 @@ if __name__ == "__main__":
             'cnpj': '42194191000110'
         }
     ]
-    
-    autorizacao = cliente_nf[0]['tokenAutorizacao']
-    cnpj = cliente_nf[0]['cnpj']
-    
-    # Substitua pelas credenciais da API do Serpro
-    consumer_key = os.getenv('CONSUMER_KEY')
-    consumer_secret = os.getenv('CONSUMER_SECRET')
 
     try:
-        print("Obtendo token válido...")
-        token = get_valid_token()
-        print(f"Token obtido")
-
-        # Remover caracteres não numéricos do CNPJ
-        cnpj_clean = remove_non_numeric_chars(cnpj)
-        print(f"CNPJ após limpeza: {cnpj_clean}")
-
         print("Consultando NFes por CNPJ...")
         
         # Criar tabela de associação (ou alterar tabela de clientes no sistema) tokenAutorizacao do CNPJ
-        resultado = consultar_nfs_por_cnpj(autorizacao, token, cnpj_clean, '2024-10-01', '2024-10-31')
+        resultados = consultar_nfs_por_cnpjs(cliente_nf, '2024-10-01', '2024-10-31')
 
-        print("Resultado da consulta:")
-        print(resultado)
+        for cnpj, resultado in resultados.items():
+            print(f"Resultado da consulta do CNPJ {cnpj}:")
+            print(resultado)
     except Exception as e:
         print(f"Erro: {e}")
@@ -17,13 +17,21 @@ try:
         'sql_query': os.getenv('TRN_BUSCA_NF_SQL', 'trn_ml_busca_nf.sql'),
         'sample_size': 1000,
         'save_results_to_db': True,
-        'refresh_source': 'sql', # sql, azure_csv     
+        'refresh_source': 'sql', # sql, sql_incremental, azure_csv, azure_parquet, local_parquet
         'csv_remote_name': f'trn_{experiment_name}.csv',
+        'parquet_remote_name': f'trn_{experiment_name}.parquet',
+        'cache_format': 'parquet', # csv, parquet
+        'use_snapshot': False, # opt-in: reuse the local snapshot of the same SQL/sample_size/database (data up to snapshot_ttl old)
+        'snapshot_ttl': 6 * 3600, # seconds; 'refresh_snapshot': True forces a new extraction
+        'watermark_column': 't.data_hora_transacao_inicio', # sql_incremental: only rows after the persisted watermark
+        'watermark_lookback': 1, # days re-read on each refresh to pick up changed rows
+        'parse_json_features': True, # json_* columns parsed from complemento_json (cached by content hash)
+        'geohash_precision': 6, # adds geohash / geo_cell columns from latitude/longitude (~1.2km x 0.6km cells)
     }
 
     runner.initialize(params)
 
-    runner.df_analysis.to_csv(os.path.join(gen_path, params['csv_remote_name']), index=True)
+    runner.file_service.write_local_parquet(runner.df_analysis, os.path.join(gen_path, params['parquet_remote_name']))
 
     if runner.df_analysis is not None:
         print(f'Returned {len(runner.df_analysis)}')
@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
 
 import os, sys
 from populator import Populator
@@ -8,39 +7,62 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from services.file_services import FileServices
+from services.geo_services import calculate_closest_distances
+from services.json_feature_parser import JsonFeatureParser
+from services.bssid_index import BssidIndex
+from services.spatial_buckets import CellIndex
 
 def clean_coordinates(df):
     return df.dropna(subset=['latitude', 'longitude'])
 
 # Function to calculate distances
-def calculate_distances(df1, df2):
-    closest_distances_df1 = []
-    closest_distances_df2 = []
-    
-    # Iterate over rows in df1
-    for _, row1 in df1.iterrows():
-        distances = df2.apply(
-            lambda row2: geodesic((row1['latitude'], row1['longitude']), 
-                                  (row2['latitude'], row2['longitude'])).km, axis=1)
-        closest_distances_df1.append(distances.min())
-    
-    # Iterate over rows in df2
-    for _, row2 in df2.iterrows():
-        distances = df1.apply(
-            lambda row1: geodesic((row2['latitude'], row2['longitude']), 
-                                  (row1['latitude'], row1['longitude'])).km, axis=1)
-        closest_distances_df2.append(distances.min())
-    
-    # Add distances as new columns
-    df1['closest_distance'] = closest_distances_df1
-    df2['closest_distance'] = closest_distances_df2
-    
+def calculate_distances(df1, df2, refine_k=None):
+    # Nearest neighbour via BallTree (haversine) in both directions; refine_k re-ranks the
+    # k best candidates with geodesic distance
+    dist_1, idx_1, dist_2, idx_2 = calculate_closest_distances(df1, df2, refine_k=refine_k)
+
+    # Add distances and closest index as new columns
+    df1['closest_distance'] = dist_1
+    df1['closest_index'] = idx_1
+    df2['closest_distance'] = dist_2
+    df2['closest_index'] = idx_2
+
     return df1, df2
 
+# Closest credenciado within max_km: only credenciados in neighbouring geohash cells are compared.
+# The credenciado cell index is persisted and rebuilt only when the credenciado points change.
+def calculate_distances_grid(df_trn, df_creds, index_path, max_km=5, precision=5, id_column=None):
+    if id_column is None:
+        df_creds = df_creds.rename_axis('cred_index').reset_index()
+        id_column = 'cred_index'
+    index = CellIndex.load_or_build(index_path, df_creds, id_column, precision=precision)
+
+    distances, ids = index.nearest(df_trn['latitude'].to_numpy(), df_trn['longitude'].to_numpy(), max_km)
+    df_trn['closest_distance'] = distances
+    df_trn['closest_index'] = ids
+    return df_trn
+
+# Wi-Fi fingerprint match: merchant whose known BSSIDs best overlap each new transaction's scan.
+# The index is built from historical transactions only, so a new scan is matched against fingerprints it is not part of.
+def calculate_bssid_matches(df_history, df_new, label_column='credenciado_id', metric='jaccard'):
+    parser = JsonFeatureParser()
+    history = parser.transform(df_history)
+    history[label_column] = df_history[label_column]
+
+    index = BssidIndex()
+    index.add_frame(history, label_column=label_column)
+    index.compact()
+
+    matches = index.query_frame(parser.transform(df_new), metric=metric)
+    if label_column in df_new.columns:
+        matches['bssid_match_correct'] = matches['bssid_match_label'].notna() & (matches['bssid_match_label'] == df_new[label_column])
+    return matches, index
+
 project_root = os.getcwd()
 experiment_name = 'ml_creds-2'
 p1 = os.path.join(project_root, 'experiments', 'data', 'trn_ml_creds-2.csv')
 p2 = os.path.join(project_root, 'experiments', 'data', 'trn_ml_busca_nf_v3_large.csv')
+p3 = os.path.join(project_root, 'experiments', 'data', 'trn_ml_geofence-01.csv')
 
 files = FileServices()
 
@@ -51,13 +73,28 @@ c2 = files.count_csv_rows(p2)
 print(f'TRN: {c2} rows')
 
 # Call the function
-df1 = pd.read_csv(p1, nrows=100)
-df1 = clean_coordinates(df1[['latitude', 'longitude']])
-df2 = pd.read_csv(p2, nrows=100)
-df2 = clean_coordinates(df2[['latitude', 'longitude']])
+df1 = pd.read_csv(p1, usecols=['latitude', 'longitude'])
+df1 = clean_coordinates(df1)
+df2 = pd.read_csv(p2, usecols=['latitude', 'longitude'])
+df2 = clean_coordinates(df2)
+# Vectorized haversine distances; refine_k (per-row geodesic re-ranking) is only meant for small inputs
 df1, df2 = calculate_distances(df1, df2)
 
-print(df1[['closest_distance']].head())
-print(df2[['closest_distance']].head())
+print(df1[['closest_distance', 'closest_index']].head())
+print(df2[['closest_distance', 'closest_index']].head())
 
+# Persisted credenciado cell index lives in a local cache dir, outside the tracked experiments/data
+geo_cache_dir = os.getenv('GEO_CACHE_DIR', os.path.join(project_root, '.geo_cache'))
+df2 = calculate_distances_grid(df2, df1, os.path.join(geo_cache_dir, 'credenciado_cells.parquet'))
+print(df2[['closest_distance', 'closest_index']].head())
 
+df3 = pd.read_csv(p3, usecols=['credenciado_id', 'data_hora_transacao_inicio', 'complemento_json', 'retorno_json'])
+# Oldest 80% of the transactions build the fingerprints, the newest 20% are matched against them
+df3 = df3.sort_values('data_hora_transacao_inicio', kind='stable')
+split = int(len(df3) * 0.8)
+matches, bssid_index = calculate_bssid_matches(df3.iloc[:split], df3.iloc[split:])
+matched = matches[matches['bssid_match_label'].notna()]
+print(f'BSSID index: {len(bssid_index)} credenciados, {len(bssid_index.docs)} postings')
+print(f'BSSID matches: {len(matched)} of {len(matches)} new transactions, '
+      f'{matched["bssid_match_correct"].mean():.1%} matched their own credenciado')
+print(matched.head())
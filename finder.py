@@ -1,11 +1,19 @@
+import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from sklearn.cluster import DBSCAN
 from geopy.distance import geodesic
+from services.geo_services import EARTH_RADIUS_KM, encode_geohash, to_radians
+from services.spatial_buckets import CellIndex
 
 # Configurações de hiperparâmetros
 DBSCAN_EPS = 0.05  # Distância máxima em graus (~5km dependendo da geolocalização)
+DBSCAN_EPS_KM = 0.5  # Distância máxima em km para o modo haversine
 DBSCAN_MIN_SAMPLES = 2  # Mínimo de transações por cluster
+GEOHASH_PRECISION = 5  # Células de ~4.9km x 4.9km ao particionar por geohash
+NF_MAX_DISTANCE_KM = 5  # Distância máxima entre transação e nota fiscal candidata
 
 # Função para carregar os dados
 def load_data():
@@ -31,40 +39,104 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     return geodesic((lat1, lon1), (lat2, lon2)).km
 
 # Clusterização das transações
-def cluster_transactions(transacoes):
-    coords = transacoes[["Latitude", "Longitude"]].values
-    clustering = DBSCAN(eps=DBSCAN_EPS, min_samples=DBSCAN_MIN_SAMPLES, metric="euclidean").fit(coords)
-    
-    transacoes["ClusterID"] = clustering.labels_
+def cluster_transactions(transacoes, metric="euclidean", eps_km=DBSCAN_EPS_KM, partition_by=None,
+                         geohash_precision=GEOHASH_PRECISION, max_workers=None):
+    """
+    metric="euclidean" mantém o comportamento original (graus, DBSCAN_EPS).
+    metric="haversine" usa ball tree com eps em km e, opcionalmente, particiona a carga por uma
+    coluna (ex.: "ChaveID") ou por célula geohash (partition_by="geohash"), clusterizando as
+    partições em paralelo num pool de processos. Os rótulos são renumerados para ClusterIDs
+    globalmente únicos; ruído continua -1.
+    Obs.: com partition_by="geohash", clusters que cruzam a borda de uma célula são divididos.
+    """
+    if metric == "euclidean":
+        coords = transacoes[["Latitude", "Longitude"]].values
+        clustering = DBSCAN(eps=DBSCAN_EPS, min_samples=DBSCAN_MIN_SAMPLES, metric="euclidean").fit(coords)
+
+        transacoes["ClusterID"] = clustering.labels_
+        return transacoes
+
+    if metric != "haversine":
+        raise ValueError(f'Parâmetro metric [inválido]: {metric}, deve ser "euclidean" ou "haversine"')
+
+    coords = to_radians(transacoes, "Latitude", "Longitude")
+    eps_rad = eps_km / EARTH_RADIUS_KM
+
+    if partition_by is None:
+        particoes = [np.arange(len(transacoes))]
+    else:
+        if partition_by == "geohash":
+            chaves = encode_geohash(transacoes["Latitude"].to_numpy(), transacoes["Longitude"].to_numpy(), geohash_precision)
+        else:
+            chaves = transacoes[partition_by].to_numpy()
+        particoes = list(pd.Series(chaves).groupby(chaves, sort=True).indices.values())
+
+    # Partições menores que min_samples só podem ser ruído: não vão para o pool
+    particoes = [pos for pos in particoes if len(pos) >= DBSCAN_MIN_SAMPLES]
+    tarefas = [coords[pos] for pos in particoes]
+
+    if max_workers == 1 or len(tarefas) <= 1:
+        resultados = [_dbscan_haversine(tarefa, eps_rad) for tarefa in tarefas]
+    else:
+        workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(tarefas) // (workers * 4))
+            resultados = list(executor.map(_dbscan_haversine, tarefas, repeat(eps_rad), chunksize=chunksize))
+
+    # Junta os rótulos locais em ClusterIDs globais
+    labels = np.full(len(transacoes), -1, dtype=np.int64)
+    deslocamento = 0
+    for pos, rotulos in zip(particoes, resultados):
+        em_cluster = rotulos >= 0
+        labels[pos[em_cluster]] = rotulos[em_cluster] + deslocamento
+        if em_cluster.any():
+            deslocamento += rotulos.max() + 1
+
+    transacoes["ClusterID"] = labels
     return transacoes
 
+def _dbscan_haversine(coords_rad, eps_rad):
+    clustering = DBSCAN(eps=eps_rad, min_samples=DBSCAN_MIN_SAMPLES, metric="haversine",
+                        algorithm="ball_tree").fit(coords_rad)
+    return clustering.labels_
+
 # Associação de notas fiscais às transações
 def associate_invoices(transacoes, notas_fiscais):
     transacoes["NotaFiscalID"] = None
     transacoes["DistanciaNF"] = None
 
-    for idx, transacao in transacoes.iterrows():
-        cluster_id = transacao["ClusterID"]
-        if cluster_id == -1:  # Ignorar transações fora de clusters
-            continue
-        
-        # Filtrar notas fiscais próximas geograficamente
-        notas_candidatas = notas_fiscais.copy()
-        notas_candidatas["Distancia"] = notas_candidatas.apply(
-            lambda nf: calculate_distance(
-                transacao["Latitude"], transacao["Longitude"],
-                nf["Latitude"], nf["Longitude"]
-            ),
-            axis=1
-        )
-        notas_candidatas = notas_candidatas[notas_candidatas["Distancia"] < 5]  # Limite de 5 km
-        
-        # Procurar nota fiscal com o valor mais próximo
-        if not notas_candidatas.empty:
-            notas_candidatas["ErroValor"] = abs(notas_candidatas["Valor"] - transacao["Valor"])
-            melhor_nota = notas_candidatas.sort_values(["ErroValor", "Distancia"]).iloc[0]
-            transacoes.loc[idx, "NotaFiscalID"] = melhor_nota["NotaFiscalID"]
-            transacoes.loc[idx, "DistanciaNF"] = melhor_nota["Distancia"]
+    if notas_fiscais.empty:
+        return transacoes
+
+    # Notas ordenadas por valor e indexadas por célula geohash com a posição no array ordenado
+    # como id: só notas em células vizinhas são comparadas, num único merge vetorizado
+    notas_ordenadas = notas_fiscais.sort_values("Valor", kind="stable")
+    valores_nf = notas_ordenadas["Valor"].to_numpy(dtype=np.float64)
+    ids_nf = notas_ordenadas["NotaFiscalID"].to_numpy()
+    indice_nf = CellIndex(np.arange(len(notas_ordenadas)), notas_ordenadas["Latitude"].to_numpy(),
+                          notas_ordenadas["Longitude"].to_numpy(), precision=GEOHASH_PRECISION)
+
+    # Ignorar transações fora de clusters
+    em_cluster = transacoes[transacoes["ClusterID"] != -1]
+    pos_trn, pos_ref, dist = indice_nf.candidate_pairs(
+        em_cluster["Latitude"].to_numpy(), em_cluster["Longitude"].to_numpy(), NF_MAX_DISTANCE_KM
+    )
+    dentro = dist < NF_MAX_DISTANCE_KM
+    pos_trn, dist = pos_trn[dentro], dist[dentro]
+    posicoes_nf = indice_nf.ids[pos_ref[dentro]].astype(np.int64)
+
+    # Por transação, a nota de valor mais próximo vence; empates pela menor distância e depois pela
+    # menor posição (ordem por valor). Um único lexsort escolhe o primeiro par de cada transação
+    indices_trn = em_cluster.index.to_numpy()
+    valores_trn = em_cluster["Valor"].to_numpy(dtype=np.float64)
+    erro = np.abs(valores_nf[posicoes_nf] - valores_trn[pos_trn])
+    ordem = np.lexsort((posicoes_nf, dist, erro, pos_trn))
+    pos_trn, posicoes_nf, dist = pos_trn[ordem], posicoes_nf[ordem], dist[ordem]
+    melhores = np.flatnonzero(np.r_[True, pos_trn[1:] != pos_trn[:-1]]) if len(pos_trn) else np.empty(0, dtype=np.int64)
+
+    # Uma única atribuição para todas as transações associadas
+    transacoes.loc[indices_trn[pos_trn[melhores]], "NotaFiscalID"] = ids_nf[posicoes_nf[melhores]]
+    transacoes.loc[indices_trn[pos_trn[melhores]], "DistanciaNF"] = dist[melhores]
 
     return transacoes
 
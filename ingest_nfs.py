@@ -0,0 +1,47 @@
+import os
+import json
+import asyncio
+import datetime
+from dotenv import load_dotenv
+from api import SerproAsyncClient
+from services.sql_storage import ConnectionType, SqlStorage
+from services.nfe_ingestion import NfeIngestionPipeline
+load_dotenv()
+
+days = int(os.getenv('NFE_INGESTION_DAYS', 30))
+data_fim = datetime.date.today()
+data_inicio = data_fim - datetime.timedelta(days=days)
+
+def create_sql_storage():
+    return SqlStorage(
+        connection_type=ConnectionType.SQL_SERVER,
+        host=os.getenv('RESOURCE_SQL_HOSTNAME'),
+        port=os.getenv('RESOURCE_SQL_PORT', 1433),
+        database=os.getenv('RESOURCE_SQL_DATABASE'),
+        username=os.getenv('RESOURCE_SQL_USERNAME'),
+        password=os.getenv('RESOURCE_SQL_PASSWORD'),
+        pooled=True)
+
+def load_tokens():
+    # tokenAutorizacao is issued per CNPJ: SERPRO_TOKENS_FILE is a JSON {cnpj: token}, else rec_ml_token_autorizacao is read
+    tokens_file = os.getenv('SERPRO_TOKENS_FILE')
+    if not tokens_file:
+        return None
+    with open(tokens_file, 'r', encoding='utf-8') as file:
+        return {str(cnpj).strip(): token for cnpj, token in json.load(file).items()}
+
+async def main():
+    async with SerproAsyncClient() as client:
+        pipeline = NfeIngestionPipeline(
+            client,
+            target_factory=create_sql_storage,
+            tokens_autorizacao=load_tokens(),
+            window_days=int(os.getenv('NFE_INGESTION_WINDOW_DAYS', 7)),
+            batch_size=int(os.getenv('NFE_INGESTION_BATCH_SIZE', 500)),
+            max_workers=int(os.getenv('NFE_INGESTION_MAX_WORKERS', 8)))
+        metrics = await pipeline.run(data_inicio, data_fim)
+        print(metrics)
+        print(f'SERPRO requests: {client.stats}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -3,8 +3,15 @@ import pandas as pd
 import os, sys 
 from services.sql_storage import ConnectionType, SqlStorage
 from services.file_services import FileServices
+from services.snapshot_cache import SnapshotCache
+from services.incremental_dataset import IncrementalDataset, WatermarkStore
+from services.json_feature_parser import JSON_COLUMNS, CACHE_DIR as JSON_FEATURES_CACHE_DIR, JsonFeatureParser
+from services.spatial_buckets import assign_cells
+import json
+import re
 
 import time 
+from concurrent.futures import ThreadPoolExecutor
 
 class Populator:
     def __init__(self):
@@ -14,6 +21,18 @@ class Populator:
         self.file_service.blob_container_name = os.getenv('BLOB_CONTAINER')
         self.blob_dir = os.getenv('BLOB_DIR')
         self.blob_dir_sql = os.getenv('BLOB_DIR_SQL')
+
+        # Local blob cache (ETag revalidated); BLOB_CACHE_DIR='' disables it, BLOB_CACHE_OFFLINE=1 never calls Azure
+        blob_cache_dir = os.getenv('BLOB_CACHE_DIR', '.blob_cache')
+        if blob_cache_dir:
+            self.file_service.enable_blob_cache(
+                blob_cache_dir,
+                max_bytes=int(os.getenv('BLOB_CACHE_MAX_MB', 2048)) * 1024 * 1024,
+                offline=os.getenv('BLOB_CACHE_OFFLINE', '0').lower() in ('1', 'true', 'yes'))
+
+        # Local snapshots of SQL results, so repeated experiment runs do not re-execute the same query
+        self.snapshot_cache = SnapshotCache(os.getenv('SNAPSHOT_CACHE_DIR', '.snapshot_cache'), self.file_service,
+                                            default_ttl=int(os.getenv('SNAPSHOT_TTL_SECONDS', 86400)))
     
     def initialize(self, df_params=None):
         
@@ -24,6 +43,11 @@ class Populator:
             self.save_results_to_db = df_params['save_results_to_db']
             self.experiment_name = df_params['experiment_name']
             self.gen_path = df_params['gen_path']
+            # Parquet options: file name (defaults to csv_remote_name with .parquet), column projection and row-group filters
+            self.parquet_remote_name = df_params.get('parquet_remote_name') or os.path.splitext(self.csv_remote_name)[0] + '.parquet'
+            self.columns = df_params.get('columns')
+            self.filters = df_params.get('filters')
+            self.cache_format = df_params.get('cache_format', 'csv')
             
             if self.save_results_to_db is None: 
                 self.save_results_to_db = False
@@ -33,28 +57,112 @@ class Populator:
                 start_time = time.time()
                 self.df_analysis = self.read_df_from_azure(self.blob_dir + self.csv_remote_name)
                 self.log_status(f'Generating dataframe from Azure Blob CSV file completed in {time.time() - start_time:.2f} seconds.\n')
-            elif self.refresh_source == 'sql':
+            elif self.refresh_source == 'azure_parquet':
+                self.log_status(f'\nGenerating dataframe from Azure Blob Parquet file...')
+                start_time = time.time()
+                self.df_analysis = self.read_df_from_azure_parquet(self.blob_dir + self.parquet_remote_name, self.columns, self.filters)
+                self.log_status(f'Generating dataframe from Azure Blob Parquet file completed in {time.time() - start_time:.2f} seconds.\n')
+            elif self.refresh_source == 'local_parquet':
+                self.log_status(f'\nGenerating dataframe from local Parquet file...')
+                start_time = time.time()
+                self.df_analysis = self.file_service.read_local_parquet(os.path.join(self.gen_path, self.parquet_remote_name), self.columns, self.filters)
+                self.log_status(f'Generating dataframe from local Parquet file completed in {time.time() - start_time:.2f} seconds.\n')
+            elif self.refresh_source == 'sql_incremental':
                 if self.sql_query is None or self.sql_query == '': 
                     raise Exception('Cannot refresh dataframe because SQL query was not provided.')   
-                
+
                 start_time = time.time()
-                self.log_status(f'\nGenerating dataframe from SQL query...')
-                self.df_analysis = self.read_df_from_sql(df_params)
-                self.log_status(f'Generating dataframe from SQL Query completed in {time.time() - start_time:.2f} seconds.\n')
-                
-                try:
-                    start_time = time.time()
-                    self.log_status(f'\nWriting dataframe generated from SQL Query to CSV into Azure Blob...')
-                    self.file_service.write_azure_blob_dataframe(self.df_analysis, self.blob_dir + self.csv_remote_name)
-                    self.log_status(f'Writing dataframe generated from SQL Query to CSV into Azure Blob completed in {time.time() - start_time:.2f} seconds.\n')    
-                except Exception as e:
-                    self.log_status(f'Error writing dataframe as CSV to Azure: {e}')    
-                    
+                self.df_analysis = self.read_df_from_sql_incremental(df_params)
+                self.log_status(f'Incremental refresh completed in {time.time() - start_time:.2f} seconds.\n')
+            elif self.refresh_source == 'sql':
+                self.refresh_from_sql(df_params)
             else:
                 self.df_analysis = None
+
+            if df_params.get('parse_json_features') and self.df_analysis is not None:
+                self.add_json_features(df_params)
+
+            # Geohash cell of every row (geohash, geo_cell) for bucketed distance joins, see services/spatial_buckets
+            if df_params.get('geohash_precision') and self.df_analysis is not None and {'latitude', 'longitude'} <= set(self.df_analysis.columns):
+                assign_cells(self.df_analysis, precision=df_params['geohash_precision'])
         
         if self.df_analysis is None:
             raise Exception('Cannot process with empty dataframe.')
+
+    def refresh_from_sql(self, df_params):
+        """
+        SQL source: extracted and cached in the blob. With use_snapshot (opt-in), served from the local
+        snapshot while younger than snapshot_ttl, otherwise extracted and snapshotted.
+        """
+        if self.sql_query is None or self.sql_query == '': 
+            raise Exception('Cannot refresh dataframe because SQL query was not provided.')   
+        
+        sql_query = self.load_sql_query(self.sql_query)
+        if sql_query is None:
+            raise Exception(f'Cannot refresh dataframe because SQL file {self.sql_query} could not be read.')
+
+        snapshot_key = None
+        if df_params.get('use_snapshot', False):
+            snapshot_key = self.snapshot_key(sql_query, df_params)
+            if df_params.get('refresh_snapshot', False):
+                self.snapshot_cache.invalidate(snapshot_key)
+            start_time = time.time()
+            self.df_analysis = self.snapshot_cache.get(snapshot_key, ttl=df_params.get('snapshot_ttl'))
+            if self.df_analysis is not None:
+                meta = self.snapshot_cache.get_metadata(snapshot_key) or {}
+                age = (time.time() - meta['created_at']) / 60 if 'created_at' in meta else float('nan')
+                self.log_status(f'\nDataframe served from local snapshot {snapshot_key[:12]} '
+                                f'({len(self.df_analysis)} rows, {age:.0f} minutes old) in {time.time() - start_time:.2f} seconds.\n')
+                return self.df_analysis
+
+        start_time = time.time()
+        self.log_status(f'\nGenerating dataframe from SQL query...')
+        if df_params.get('partition_column'):
+            self.df_analysis = self.read_df_from_sql_partitioned(df_params, sql_query=sql_query)
+        else:
+            self.df_analysis = self.read_df_from_sql(df_params, sql_query=sql_query)
+        self.log_status(f'Generating dataframe from SQL Query completed in {time.time() - start_time:.2f} seconds.\n')
+
+        if snapshot_key is not None and self.df_analysis is not None:
+            # The snapshot stores unique column names ("t.*, cr.*" repeats become col.1), so a miss returns the same frame as a hit
+            self.df_analysis = self.file_service.deduplicate_columns(self.df_analysis)
+            try:
+                self.snapshot_cache.put(snapshot_key, self.df_analysis, sql_file=self.sql_query,
+                                        database=self.snapshot_database())
+            except Exception as e:
+                self.log_status(f'Error writing local snapshot: {e}')
+        
+        try:
+            start_time = time.time()
+            if self.cache_format == 'parquet':
+                self.log_status(f'\nWriting dataframe generated from SQL Query to Parquet into Azure Blob...')
+                self.file_service.write_azure_blob_parquet(self.df_analysis, self.blob_dir + self.parquet_remote_name)
+            else:
+                self.log_status(f'\nWriting dataframe generated from SQL Query to CSV into Azure Blob...')
+                self.file_service.write_azure_blob_dataframe(self.df_analysis, self.blob_dir + self.csv_remote_name)
+            self.log_status(f'Writing dataframe generated from SQL Query into Azure Blob completed in {time.time() - start_time:.2f} seconds.\n')    
+        except Exception as e:
+            self.log_status(f'Error writing dataframe to Azure: {e}')
+
+        return self.df_analysis
+
+    def add_json_features(self, df_params):
+        """
+        Adds the json_* features parsed from the mobile JSON payload (see JsonFeatureParser) to df_analysis.
+        Parsed features are cached as Parquet under JSON_FEATURES_CACHE_DIR (default .json_features_cache);
+        drop_json_columns removes the raw JSON text afterwards.
+        """
+        parser = JsonFeatureParser(
+            json_columns=df_params.get('json_columns') or JSON_COLUMNS,
+            cache_dir=os.getenv('JSON_FEATURES_CACHE_DIR', JSON_FEATURES_CACHE_DIR),
+            max_workers=df_params.get('max_workers'))
+        features = parser.transform(self.df_analysis)
+        # Same index object on both sides, so concat aligns by position even with a non-unique index
+        self.df_analysis = pd.concat([self.df_analysis, features], axis=1)
+
+        if df_params.get('drop_json_columns', False):
+            self.df_analysis = self.df_analysis.drop(columns=[c for c in parser.json_columns if c in self.df_analysis.columns])
+        return self.df_analysis
     
     def log_status(self, msg, raise_exception=False):
         print(msg)
@@ -72,6 +180,16 @@ class Populator:
         self.df_analysis = df
         return self.df_analysis
     
+    def read_df_from_azure_parquet(self, remote_parquet=None, columns=None, filters=None):
+        df = None
+        if remote_parquet is not None:
+            try:
+                df = self.file_service.read_azure_blob_parquet(remote_parquet, columns=columns, filters=filters)
+            except Exception as e:  
+                self.log_status(f'Error reading Parquet from Azure: {e}')
+        self.df_analysis = df
+        return self.df_analysis
+    
     def read_sql_from_azure(self, remote_sql=None):
         sql = None
         if remote_sql is not None:
@@ -81,16 +199,7 @@ class Populator:
                 self.log_status(f'Error reading SQL file from Azure: {e}')
         return sql
     
-    def read_df_from_sql(self, params=None):
-        
-        host = os.getenv('RESOURCE_SQL_HOSTNAME')
-        port = os.getenv('RESOURCE_SQL_PORT', 1433)
-        user_name = os.getenv('RESOURCE_SQL_USERNAME')
-        user_pwd = os.getenv('RESOURCE_SQL_PASSWORD')
-        database = os.getenv('RESOURCE_SQL_DATABASE')
-        sample_size = str(params['sample_size'])
-        sql_file = params['sql_query']
-        
+    def load_sql_query(self, sql_file):
         sql_query = None
         try:
             start_time = time.time()
@@ -99,33 +208,73 @@ class Populator:
             self.log_status(f'Reading SQL text file from Azure completed in {time.time() - start_time:.2f} seconds.\n')
         except Exception as e:
             self.log_status(f"\nError reading SQL file from Azure: {e}, exit.", True)
+        return sql_query
+
+    def create_sql_storage(self):
+        # Pooled connection: reused across runs, health-checked and reconnected with exponential backoff
+        return SqlStorage(
+            connection_type=ConnectionType.SQL_SERVER, 
+            host=os.getenv('RESOURCE_SQL_HOSTNAME'), 
+            port=os.getenv('RESOURCE_SQL_PORT', 1433), 
+            database=os.getenv('RESOURCE_SQL_DATABASE'), 
+            username=os.getenv('RESOURCE_SQL_USERNAME'), 
+            password=os.getenv('RESOURCE_SQL_PASSWORD'),
+            pooled=True)
+
+    def snapshot_database(self):
+        return f"{os.getenv('RESOURCE_SQL_HOSTNAME')}/{os.getenv('RESOURCE_SQL_DATABASE')}"
+
+    def snapshot_key(self, sql_query, params):
+        """
+        Snapshot key: rendered SQL ({sample_size} substituted), server/database and freshness.
+        Freshness is params['snapshot_watermark'] when given (e.g. the max date already loaded) and/or
+        params['snapshot_window'] (pandas frequency such as 'D' or 'h': one snapshot per window).
+        Partitioned runs also key on the partition spec.
+        """
+        rendered_sql = sql_query.replace('{sample_size}', str(params['sample_size']))
+        if params.get('partition_column'):
+            partition_spec = {k: params.get(k) for k in ('partition_column', 'partition_kind', 'partition_start',
+                                                         'partition_end', 'partition_step')}
+            rendered_sql += '\n-- partitions: ' + json.dumps(partition_spec, sort_keys=True, default=str)
+
+        freshness = {}
+        if params.get('snapshot_watermark') is not None:
+            freshness['watermark'] = params['snapshot_watermark']
+        if params.get('snapshot_window'):
+            freshness['window'] = pd.Timestamp.now().floor(params['snapshot_window']).isoformat()
+
+        return self.snapshot_cache.make_key(rendered_sql, self.snapshot_database(), freshness or None)
+
+    def invalidate_snapshots(self, params=None):
+        """Drops the snapshot for params (or every local snapshot when params is None)."""
+        if params is None:
+            self.snapshot_cache.invalidate()
+            return
+        sql_query = self.load_sql_query(params['sql_query'])
+        self.snapshot_cache.invalidate(self.snapshot_key(sql_query, params))
+
+    def read_df_from_sql(self, params=None, sql_query=None):
+        
+        sample_size = str(params['sample_size'])
+        sql_file = params['sql_query']
+        
+        if sql_query is None:
+            sql_query = self.load_sql_query(sql_file)
         
         executor = None
         error = False
-        max_attempts = 3
         exception = None
-        for i in range(max_attempts):
-            try:
-                executor = SqlStorage(
-                    connection_type=ConnectionType.SQL_SERVER, 
-                    host=host, 
-                    port=port, 
-                    database=database, 
-                    username=user_name, 
-                    password=user_pwd)
-                error = False
-                break
-            except Exception as e:
-                error = True
-                exception = e
-                self.log_status(f"\nError connecting to SQL: {e}, retry attempt {i} of {max_attempts}...")
-                time.sleep(3)
+        try:
+            executor = self.create_sql_storage()
+        except Exception as e:
+            error = True
+            exception = e
         
         if error:
             self.log_status(f"\nError connecting to SQL: {exception}, exit.", True)
         
         if not error:
-            sql_query = sql_query.replace('{sample_size}', sample_size)
+            sql_query = sql_query.replace('{sample_size}', sample_size).replace('{partition_filter}', '')
             try:
                 start = time.time()
                 print('Starting executiing query...')
@@ -135,9 +284,228 @@ class Populator:
             except Exception as e:
                 self.df_analysis = None
                 self.log_status(f'Error executing SQL Query {e}', True) 
+            finally:
+                executor.close()
         else:
             self.df_analysis = None
         
         return self.df_analysis
 
-    
\ No newline at end of file
+    def read_df_from_sql_partitioned(self, params=None, sql_query=None):
+        """
+        Partitioned extraction: the query is split on params['partition_column'] into date ranges
+        (partition_kind='date', partition_step in days) or id ranges (partition_kind='id',
+        partition_step ids) between partition_start and partition_end, and the partitions run
+        concurrently on pooled connections (max_workers). Results are concatenated in partition order.
+        Note: {sample_size} (TOP) applies to each partition.
+        """
+        frames = list(self.iter_df_from_sql_partitioned(params, sql_query=sql_query))
+        self.df_analysis = pd.concat(frames, ignore_index=True) if frames else None
+        return self.df_analysis
+
+    def iter_df_from_sql_partitioned(self, params=None, sql_query=None):
+        """Same as read_df_from_sql_partitioned, but yields each partition DataFrame in order as soon as it is ready."""
+        if sql_query is None:
+            sql_query = self.load_sql_query(params['sql_query'])
+        sql_query = sql_query.replace('{sample_size}', str(params['sample_size']))
+
+        partitions = self.build_partitions(params)
+        max_workers = params.get('max_workers', 4)
+        max_attempts = params.get('max_attempts', 3)
+        total = len(partitions)
+        completed = []
+
+        def run_partition(i, lower, upper):
+            query = self.render_partition_query(sql_query, params['partition_column'], lower, upper)
+            for attempt in range(max_attempts):
+                executor = None
+                try:
+                    start_time = time.time()
+                    executor = self.create_sql_storage()
+                    df = executor.execute_query(query)
+                    completed.append(i)
+                    self.log_status(f'Partition {i + 1} of {total} [{lower}, {upper}) returned {len(df)} rows '
+                                    f'in {time.time() - start_time:.2f} seconds ({len(completed)}/{total} completed).')
+                    return df
+                except Exception as e:
+                    if attempt == max_attempts - 1:
+                        self.log_status(f'Error on partition {i + 1} of {total} [{lower}, {upper}): {e}')
+                        break
+                    delay = 2 ** attempt
+                    self.log_status(f'Error on partition {i + 1} of {total} [{lower}, {upper}): {e}, '
+                                    f'retry attempt {attempt + 1} of {max_attempts} in {delay} seconds...')
+                    time.sleep(delay)
+                finally:
+                    if executor is not None:
+                        executor.close()
+            self.log_status(f'Partition {i + 1} of {total} [{lower}, {upper}) failed after {max_attempts} attempts, exit.', True)
+
+        start_time_main = time.time()
+        self.log_status(f'\nStarting partitioned extraction of {total} partitions with {max_workers} workers...')
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(run_partition, i, lower, upper) for i, (lower, upper) in enumerate(partitions)]
+            for future in futures:
+                yield future.result()
+        self.log_status(f'Partitioned extraction completed in {time.time() - start_time_main:.2f} seconds.\n')
+
+    def read_df_from_sql_incremental(self, params=None, sql_query=None):
+        """
+        Incremental extraction: only rows with params['watermark_column'] above the dataset's persisted
+        high-water mark are fetched, appended to a day-partitioned local Parquet dataset
+        (INCREMENTAL_DATA_DIR, default .incremental_data) and, with incremental_upload, to the blob
+        directory. Returns the merged view of the whole dataset.
+
+        params: incremental_dataset (name, default experiment_name), watermark_column (e.g.
+        't.data_hora_transacao_inicio' or 't.id'), watermark_kind ('date' or 'id'), initial_watermark
+        (first run), watermark_lookback (days or ids re-read to pick up changed rows), dedup_key
+        (default 'id'; the latest pull wins in the merged view).
+        With TOP {sample_size}, the query is re-ordered by the watermark column (oldest first) and read in
+        pages until a page comes back short, so no row above the watermark is ever skipped.
+        """
+        dataset_name = params.get('incremental_dataset') or params['experiment_name']
+        watermark_column = params['watermark_column']
+        kind = params.get('watermark_kind', 'date')
+        if kind not in ('date', 'id'):
+            raise Exception(f'Parâmetro watermark_kind [inválido]: {kind}, deve ser "date" ou "id"')
+
+        root_dir = os.getenv('INCREMENTAL_DATA_DIR', '.incremental_data')
+        os.makedirs(root_dir, exist_ok=True)
+        watermarks = WatermarkStore(os.path.join(root_dir, '_watermarks.json'))
+        dataset = IncrementalDataset(root_dir, dataset_name, self.file_service, dedup_key=params.get('dedup_key', 'id'))
+
+        if sql_query is None:
+            sql_query = self.load_sql_query(params['sql_query'])
+        sample_size = int(params['sample_size'])
+        # A TOP {sample_size} query only returns a complete range when it is read oldest first
+        capped = '{sample_size}' in sql_query
+        if capped and '{partition_filter}' not in sql_query:
+            raise Exception('Queries with TOP {sample_size} need a {partition_filter} placeholder for incremental extraction.')
+        sql_query = sql_query.replace('{sample_size}', str(sample_size))
+        if capped:
+            sql_query = self.order_by_column(sql_query, watermark_column)
+
+        watermark = watermarks.get(dataset_name)
+        if watermark is None:
+            watermark = params.get('initial_watermark')
+
+        lower = watermark
+        lookback = params.get('watermark_lookback')
+        if watermark is not None and lookback:
+            if kind == 'date':
+                lower = (pd.Timestamp(watermark) - pd.Timedelta(days=lookback)).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            else:
+                lower = int(watermark) - int(lookback)
+
+        def format_watermark(value):
+            return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if kind == 'date' else int(value)
+
+        column = watermark_column.split('.')[-1]
+        upload_prefix = self.blob_dir if params.get('incremental_upload', False) else None
+        start_time = time.time()
+        self.log_status(f'\nStarting incremental extraction of {dataset_name} from {watermark_column} > {lower}...')
+
+        # Pages of up to sample_size rows in watermark order. A full page may have cut rows sharing its last
+        # value, so only the rows strictly below it are kept and the next page starts after the kept range:
+        # the watermark always covers a complete, contiguous range.
+        total_rows = 0
+        executor = self.create_sql_storage()
+        try:
+            while True:
+                if lower is None:
+                    query = sql_query.replace('{partition_filter}', '')
+                else:
+                    query = self.render_filter_query(sql_query, watermark_column, [('>', lower if kind == 'date' else int(lower))])
+
+                try:
+                    df_page = executor.execute_query(query)
+                except Exception as e:
+                    self.log_status(f'Error executing incremental SQL Query {e}', True)
+                df_page = self.file_service.deduplicate_columns(df_page)
+
+                full_page = capped and len(df_page) >= sample_size
+                if full_page:
+                    page_max = df_page[column].max()
+                    df_page = df_page[df_page[column] < page_max]
+                    if df_page.empty:
+                        raise Exception(f'Parâmetro sample_size [inválido]: {sample_size} linhas com {column} = {page_max}, '
+                                        f'aumente sample_size para avançar o watermark.')
+
+                if not df_page.empty:
+                    # Day partitions follow the transaction date; id watermarks are partitioned by load date
+                    partition_values = df_page[column] if kind == 'date' else pd.Timestamp.now()
+                    written = dataset.append(df_page, partition_values, upload_prefix=upload_prefix)
+
+                    new_watermark = format_watermark(df_page[column].max())
+                    if watermark is not None:
+                        new_watermark = max(new_watermark, format_watermark(watermark))
+                    watermarks.set(dataset_name, watermark_column, new_watermark, rows=len(df_page))
+                    watermark = new_watermark
+                    lower = format_watermark(df_page[column].max())
+                    total_rows += len(df_page)
+                    self.log_status(f'Appended {len(df_page)} rows to {len(written)} partitions of {dataset_name}, watermark is now {new_watermark}.')
+
+                if not full_page:
+                    break
+        finally:
+            executor.close()
+
+        self.log_status(f'Incremental extraction returned {total_rows} rows in {time.time() - start_time:.2f} seconds.')
+
+        self.df_analysis = dataset.read(columns=params.get('columns'))
+        return self.df_analysis
+
+    def build_partitions(self, params):
+        # Half-open [lower, upper) ranges covering partition_start..partition_end
+        kind = params.get('partition_kind', 'date')
+        start = params['partition_start']
+        end = params['partition_end']
+        step = params.get('partition_step', 1)
+
+        if kind == 'date':
+            bounds = list(pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq=f'{step}D'))
+            if bounds[-1] < pd.Timestamp(end):
+                bounds.append(pd.Timestamp(end))
+            bounds = [b.strftime('%Y-%m-%d %H:%M:%S') for b in bounds]
+        elif kind == 'id':
+            bounds = list(range(int(start), int(end), int(step))) + [int(end)]
+        else:
+            raise Exception(f'Parâmetro partition_kind [inválido]: {kind}, deve ser "date" ou "id"')
+
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def render_partition_query(self, sql_query, partition_column, lower, upper):
+        """
+        The filter goes into the {partition_filter} placeholder when the SQL file has one
+        (e.g. right after "WHERE 1 = 1"); otherwise the query is wrapped as a derived table.
+        A derived table needs unique column names, so queries with CTEs or several "alias.*"
+        selections (e.g. "t.*, cr.*") must use the placeholder.
+        """
+        return self.render_filter_query(sql_query, partition_column, [('>=', lower), ('<', upper)])
+
+    def order_by_column(self, sql_query, column):
+        """Replaces the query's final ORDER BY (or appends one) with ORDER BY column ASC."""
+        query = sql_query.strip().rstrip(';')
+        match = list(re.finditer(r'\bORDER\s+BY\b', query, flags=re.IGNORECASE))
+        if match:
+            query = query[:match[-1].start()].rstrip()
+        return f'{query}\nORDER BY {column} ASC'
+
+    def render_filter_query(self, sql_query, column, conditions):
+        """Applies [(operator, value), ...] on column through {partition_filter} or a derived-table wrapper."""
+        def literal(value):
+            return f"'{value}'" if isinstance(value, str) else str(value)
+
+        if '{partition_filter}' in sql_query:
+            return sql_query.replace('{partition_filter}',
+                                     ' '.join(f'AND {column} {op} {literal(value)}' for op, value in conditions))
+
+        if sql_query.lstrip().upper().startswith('WITH'):
+            raise Exception('Queries with CTE need a {partition_filter} placeholder for partitioned extraction.')
+        # SQL Server rejects a derived table with repeated column names, as "t.*, cr.*" returns
+        if len(re.findall(r'\b\w+\.\*', sql_query)) > 1:
+            raise Exception('Queries selecting several "alias.*" need a {partition_filter} placeholder for partitioned extraction.')
+
+        column = column.split('.')[-1]
+        inner_query = sql_query.strip().rstrip(';')
+        where = ' AND '.join(f'p.{column} {op} {literal(value)}' for op, value in conditions)
+        return f'SELECT * FROM ({inner_query}) AS p WHERE {where}'
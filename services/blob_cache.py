@@ -0,0 +1,141 @@
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class BlobCache:
+    """
+    Local on-disk cache for Azure blob reads.
+
+    Blobs are stored content-addressed (objects/<sha256>) and indexed by blob name with the
+    ETag/last-modified seen at download time. A cached blob is revalidated with a conditional
+    GET (If-None-Match); a 304 serves the local copy without downloading it again. A parsed
+    frame (Parquet) can be kept next to each object. The cache is size-bounded with LRU eviction,
+    and offline mode serves whatever is cached without touching Azure.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, offline=False):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def fetch(self, blob_client, blob_name):
+        """Returns the local path of an up-to-date copy of the blob."""
+        with self._lock:
+            entry = self.index.get(blob_name)
+
+        if self.offline:
+            if entry is None:
+                raise FileNotFoundError(f"Blob '{blob_name}' is not in the local cache (offline mode)")
+            return self._touch(blob_name)
+
+        try:
+            if entry is not None:
+                downloader = blob_client.download_blob(etag=entry['etag'], match_condition=MatchConditions.IfModified)
+            else:
+                downloader = blob_client.download_blob()
+        except ResourceNotModifiedError:
+            return self._touch(blob_name)
+
+        return self._store(blob_name, downloader)
+
+    def parsed_path(self, blob_name):
+        """Path of the parsed-frame (Parquet) cache for the current version of the blob."""
+        with self._lock:
+            entry = self.index[blob_name]
+            return os.path.join(self.objects_dir, entry['object'] + '.parquet')
+
+    def invalidate(self, blob_name=None):
+        """Drops one blob (or the whole cache when blob_name is None)."""
+        with self._lock:
+            names = [blob_name] if blob_name is not None else list(self.index.keys())
+            for name in names:
+                entry = self.index.pop(name, None)
+                if entry is not None:
+                    self._remove_object(entry['object'])
+            self._save_index()
+
+    def _store(self, blob_name, downloader):
+        # Stream to a temporary file while hashing, then move it to its content address
+        temp_path = os.path.join(self.objects_dir, f'.download-{os.getpid()}-{threading.get_ident()}')
+        digest = hashlib.sha256()
+        size = 0
+        with open(temp_path, 'wb') as file:
+            for chunk in downloader.chunks():
+                digest.update(chunk)
+                file.write(chunk)
+                size += len(chunk)
+
+        object_name = digest.hexdigest()
+        os.replace(temp_path, os.path.join(self.objects_dir, object_name))
+
+        properties = downloader.properties
+        with self._lock:
+            previous = self.index.get(blob_name)
+            self.index[blob_name] = {
+                'object': object_name,
+                'etag': properties.etag,
+                'last_modified': str(properties.last_modified),
+                'size': size,
+                'last_access': time.time()
+            }
+            if previous is not None and previous['object'] != object_name:
+                self._remove_object(previous['object'])
+            self._evict(keep=blob_name)
+            self._save_index()
+
+        return os.path.join(self.objects_dir, object_name)
+
+    def _touch(self, blob_name):
+        with self._lock:
+            entry = self.index[blob_name]
+            entry['last_access'] = time.time()
+            self._save_index()
+            return os.path.join(self.objects_dir, entry['object'])
+
+    def _entry_size(self, entry):
+        parsed = os.path.join(self.objects_dir, entry['object'] + '.parquet')
+        return entry['size'] + (os.path.getsize(parsed) if os.path.exists(parsed) else 0)
+
+    def _evict(self, keep=None):
+        # Least recently used first, until the cache fits in max_bytes (the blob just stored is kept)
+        total = sum(self._entry_size(entry) for entry in self.index.values())
+        for name, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._entry_size(entry)
+            del self.index[name]
+            self._remove_object(entry['object'])
+
+    def _remove_object(self, object_name):
+        # Objects are shared by content: keep the file while another blob name points to it
+        if any(entry['object'] == object_name for entry in self.index.values()):
+            return
+        for path in (os.path.join(self.objects_dir, object_name), os.path.join(self.objects_dir, object_name + '.parquet')):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.index, file)
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,206 @@
+import pandas as pd
+import numpy as np
+import os
+from services.json_feature_parser import BSSID_COLUMN
+
+
+class BssidIndex:
+    """
+    Inverted index BSSID id -> documents (merchants or transactions), for Wi-Fi fingerprint matching.
+
+    BSSIDs are the interned int32 ids of JsonFeatureParser (json_bssid_ids). Postings are kept in CSR
+    layout: one int32 array of document ids sorted by (bssid, doc) plus per-BSSID offsets, so a query
+    only touches the postings of the ~10 BSSIDs of a scan and scores them with one np.unique.
+
+    A document is the union of the BSSIDs seen for its label: indexing transactions by credenciado_id
+    builds a merchant fingerprint. New pairs go to a small delta buffer that is queried alongside the
+    CSR arrays and merged into them once it holds compact_threshold pairs.
+
+    BSSIDs present in more than max_posting_size documents (shared/mobile hotspots) can be ignored
+    at query time; they carry little location information and dominate query cost.
+    """
+
+    def __init__(self, compact_threshold=100000, max_posting_size=None):
+        self.compact_threshold = compact_threshold
+        self.max_posting_size = max_posting_size
+
+        self.offsets = np.zeros(1, dtype=np.int64)  # Postings of bssid b: docs[offsets[b]:offsets[b + 1]]
+        self.docs = np.empty(0, dtype=np.int32)
+        self.doc_sizes = np.empty(0, dtype=np.int32)
+        self.labels = []
+        self.label_ids = {}
+
+        self._keys = np.empty(0, dtype=np.int64)  # Same pairs as (bssid << 32) | doc, sorted, for membership tests
+
+        self._delta = {}  # bssid -> list of doc ids not yet merged into the CSR arrays
+        self._delta_keys = set()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, labels, bssid_lists):
+        """
+        Adds (label, BSSID ids) pairs; repeated labels accumulate into the same document.
+        Returns the number of new (label, BSSID) pairs.
+        """
+        doc_ids = []
+        lists = []
+        for label, bssids in zip(labels, bssid_lists):
+            if bssids is None or len(bssids) == 0:
+                continue
+            doc = self.label_ids.get(label)
+            if doc is None:
+                doc = len(self.labels)
+                self.label_ids[label] = doc
+                self.labels.append(label)
+            doc_ids.append(doc)
+            lists.append(np.asarray(bssids, dtype=np.int64))
+        if not lists:
+            return 0
+
+        if len(self.labels) > len(self.doc_sizes):
+            # Grown geometrically so adding documents one scan at a time stays amortized O(1)
+            sizes = np.zeros(max(len(self.labels), 2 * len(self.doc_sizes)), dtype=np.int32)
+            sizes[:len(self.doc_sizes)] = self.doc_sizes
+            self.doc_sizes = sizes
+
+        lengths = [len(bssids) for bssids in lists]
+        keys = np.unique((np.concatenate(lists) << 32) | np.repeat(np.asarray(doc_ids, dtype=np.int64), lengths))
+
+        # Pairs already merged (binary search on the sorted CSR keys) or pending in the delta are skipped
+        position = np.searchsorted(self._keys, keys)
+        merged = position < len(self._keys)
+        merged[merged] = self._keys[position[merged]] == keys[merged]
+        new_keys = [key for key in keys[~merged].tolist() if key not in self._delta_keys]
+        if not new_keys:
+            return 0
+
+        self._delta_keys.update(new_keys)
+        new_keys = np.asarray(new_keys, dtype=np.int64)
+        new_docs = (new_keys & 0xFFFFFFFF).astype(np.int32)
+        np.add.at(self.doc_sizes, new_docs, 1)
+
+        new_bssids = new_keys >> 32
+        bssids, starts = np.unique(new_bssids, return_index=True)
+        for bssid, start, stop in zip(bssids.tolist(), starts, list(starts[1:]) + [len(new_keys)]):
+            self._delta.setdefault(bssid, []).extend(new_docs[start:stop].tolist())
+
+        if len(self._delta_keys) >= self.compact_threshold:
+            self.compact()
+        return len(new_keys)
+
+    def add_frame(self, df, label_column='credenciado_id', bssid_column=BSSID_COLUMN):
+        """Adds the rows of a frame of parsed JSON features (see JsonFeatureParser.transform)."""
+        valid = df[label_column].notna()
+        return self.add(df.loc[valid, label_column].tolist(), df.loc[valid, bssid_column].tolist())
+
+    def compact(self):
+        # Merges the delta into the CSR arrays: one sort over (bssid, doc) keys
+        if not self._delta:
+            return
+
+        delta_keys = np.fromiter(self._delta_keys, dtype=np.int64, count=len(self._delta_keys))
+        keys = np.concatenate([self._keys, delta_keys])
+        keys.sort()
+        bssids = keys >> 32
+
+        n_bssids = int(bssids[-1]) + 1 if len(bssids) else 0
+        self.offsets = np.zeros(n_bssids + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bssids, minlength=n_bssids), out=self.offsets[1:])
+        self.docs = (keys & 0xFFFFFFFF).astype(np.int32)
+        self._keys = keys
+
+        self._delta = {}
+        self._delta_keys = set()
+
+    def query(self, bssid_ids, k=5, metric='jaccard', min_overlap=1):
+        """
+        Top-k documents for one Wi-Fi scan.
+
+        :param bssid_ids: BSSID ids of the scan (a json_bssid_ids value).
+        :param metric: 'jaccard' (|A∩B| / |A∪B|) or 'overlap' (|A∩B| / min(|A|, |B|)).
+        :return: List of (label, score, overlap) sorted by score, then overlap.
+        """
+        docs, overlap, query_size = self._candidates(bssid_ids)
+        if len(docs) == 0:
+            return []
+
+        keep = overlap >= min_overlap
+        docs, overlap = docs[keep], overlap[keep]
+        scores = self._score(overlap, self.doc_sizes[docs], query_size, metric)
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, overlap, scores = docs[top], overlap[top], scores[top]
+        order = np.lexsort((-overlap, -scores))
+        return [(self.labels[docs[i]], float(scores[i]), int(overlap[i])) for i in order]
+
+    def query_frame(self, df, bssid_column=BSSID_COLUMN, metric='jaccard', min_overlap=1, exclude_label_column=None):
+        """
+        Best match of every row of df: bssid_match_label, bssid_match_score and bssid_match_overlap,
+        aligned with df. exclude_label_column skips the row's own label, i.e. returns the closest other
+        document (e.g. merchants sharing a location); to identify a scan's merchant, query transactions
+        that were not indexed and leave it unset.
+        """
+        k = 2 if exclude_label_column else 1
+        own_labels = df[exclude_label_column].tolist() if exclude_label_column else [None] * len(df)
+
+        best_labels, best_scores, best_overlaps = [], [], []
+        for bssids, own_label in zip(df[bssid_column].tolist(), own_labels):
+            matches = [m for m in self.query(bssids, k=k, metric=metric, min_overlap=min_overlap) if m[0] != own_label or own_label is None]
+            label, score, overlap = matches[0] if matches else (None, np.nan, 0)
+            best_labels.append(label)
+            best_scores.append(score)
+            best_overlaps.append(overlap)
+
+        return pd.DataFrame({
+            'bssid_match_label': best_labels,
+            'bssid_match_score': best_scores,
+            'bssid_match_overlap': best_overlaps
+        }, index=df.index)
+
+    def postings(self, bssid):
+        """Sorted document ids (CSR part) plus pending delta ids of one BSSID."""
+        base = self.docs[self.offsets[bssid]:self.offsets[bssid + 1]] if bssid < len(self.offsets) - 1 else self.docs[:0]
+        delta = self._delta.get(bssid)
+        return np.concatenate([base, np.asarray(delta, dtype=np.int32)]) if delta else base
+
+    def save(self, path):
+        self.compact()
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, offsets=self.offsets, docs=self.docs, doc_sizes=self.doc_sizes[:len(self.labels)],
+                 labels=np.asarray(self.labels, dtype=object))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, compact_threshold=100000, max_posting_size=None):
+        index = cls(compact_threshold=compact_threshold, max_posting_size=max_posting_size)
+        with np.load(path, allow_pickle=True) as data:
+            index.offsets = data['offsets']
+            index.docs = data['docs']
+            index.doc_sizes = data['doc_sizes']
+            index.labels = data['labels'].tolist()
+        index._keys = (np.repeat(np.arange(len(index.offsets) - 1, dtype=np.int64), np.diff(index.offsets)) << 32) | index.docs
+        index.label_ids = {label: doc for doc, label in enumerate(index.labels)}
+        return index
+
+    def _candidates(self, bssid_ids):
+        query = np.unique(np.asarray(bssid_ids if bssid_ids is not None else [], dtype=np.int32))
+        lists = []
+        for bssid in query:
+            posting = self.postings(int(bssid))
+            if self.max_posting_size is not None and len(posting) > self.max_posting_size:
+                continue
+            lists.append(posting)
+
+        if not lists:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64), len(query)
+        docs, overlap = np.unique(np.concatenate(lists), return_counts=True)
+        return docs, overlap, len(query)
+
+    def _score(self, overlap, doc_sizes, query_size, metric):
+        if metric == 'jaccard':
+            return overlap / (query_size + doc_sizes - overlap)
+        if metric == 'overlap':
+            return overlap / np.minimum(query_size, doc_sizes)
+        raise Exception(f'Parâmetro metric [inválido]: {metric}')
@@ -1,11 +1,19 @@
 import pandas as pd
-from azure.storage.blob import BlobServiceClient 
-from io import StringIO 
+from azure.storage.blob import BlobServiceClient, BlobBlock
+from io import StringIO, BytesIO
+import io
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pickle
 from joblib import dump, load
 import yaml
 import importlib
 import os 
+import shutil
+from services.blob_cache import BlobCache
 
 class FileServices:
 
@@ -18,6 +26,7 @@ class FileServices:
         self._blob_name = None
         self._blob_service_client = None
         self._container_client = None    
+        self._blob_cache = None
 
     def get_name(self):
         return self.name
@@ -46,6 +55,27 @@ class FileServices:
     def blob_container_name(self, value):
         self._blob_container_name = value
         
+    @property
+    def blob_cache(self):
+        return self._blob_cache
+
+    @blob_cache.setter
+    def blob_cache(self, value):
+        self._blob_cache = value
+
+    def enable_blob_cache(self, cache_dir: str = '.blob_cache', max_bytes: int = 2 * 1024 ** 3, offline: bool = False) -> BlobCache:
+        """
+        Serves blob reads from a local content-addressed cache revalidated by ETag.
+        In offline mode only the cached copies are used.
+        """
+        self._blob_cache = BlobCache(cache_dir, max_bytes=max_bytes, offline=offline)
+        return self._blob_cache
+
+    def fetch_cached_blob(self, blob_name: str) -> str:
+        """Returns the local path of an up-to-date cached copy of the blob."""
+        blob_client = None if self.blob_cache.offline else self.container_client.get_blob_client(blob_name)
+        return self.blob_cache.fetch(blob_client, blob_name)
+
     @property
     def blob_service_client(self):
         # Create the BlobServiceClient object
@@ -144,9 +174,12 @@ class FileServices:
         else:  # No arguments
             return cls() 
 
-    def read_local(self, path: str) -> pd.DataFrame:
+    def read_local(self, path: str, format: str = 'csv', columns: list = None, filters: list = None) -> pd.DataFrame:
         try:
-            df = pd.read_csv(path)
+            if format == 'parquet':
+                return self.read_local_parquet(path, columns=columns, filters=filters)
+
+            df = pd.read_csv(path, usecols=columns)
             return df
         except FileNotFoundError as e:
             raise
@@ -155,6 +188,35 @@ class FileServices:
         except Exception as e:
             raise
 
+    def read_local_parquet(self, path: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+        """
+        Reads a Parquet file reading only the requested columns; filters (pyarrow DNF, e.g.
+        [('valor', '>', 100)]) skip whole row groups using their min/max statistics.
+        """
+        table = pq.read_table(path, columns=columns, filters=filters)
+        return table.to_pandas()
+
+    def write_local_parquet(self, df: pd.DataFrame, path: str, row_group_size: int = 100000) -> None:
+        # Smaller row groups give finer-grained predicate pushdown at read time
+        table = pa.Table.from_pandas(self.deduplicate_columns(df), preserve_index=False)
+        pq.write_table(table, path, row_group_size=row_group_size, compression='snappy')
+
+    def deduplicate_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Parquet needs unique column names; repeated names from queries like "t.*, cr.*"
+        get the same ".1", ".2" suffixes that pd.read_csv gives them.
+        """
+        if df.columns.is_unique:
+            return df
+
+        seen = {}
+        columns = []
+        for col in df.columns:
+            count = seen.get(col, 0)
+            columns.append(col if count == 0 else f'{col}.{count}')
+            seen[col] = count + 1
+        return df.set_axis(columns, axis=1)
+
     def save_model(self, model: any, local_path: str, format: str = 'pickle') -> None:
         try:
             if format == 'joblib':
@@ -184,14 +246,11 @@ class FileServices:
 
     def read_azure_blob_dataframe(self, blob_name: str) -> pd.DataFrame:
         try:
-            
-            # Download the blob as a string
-            blob_client = self.container_client.get_blob_client(blob_name)
-            blob_data = blob_client.download_blob().content_as_text()
+            if self.blob_cache is not None:
+                return self._read_cached_blob_dataframe(blob_name)
 
-            # Convert the string data into a pandas DataFrame
-            csv_data = StringIO(blob_data)
-            df = pd.read_csv(csv_data)
+            # Parse the blob while it downloads (no full text copy in memory)
+            df = pd.read_csv(self.open_azure_blob_stream(blob_name))
             return df
         except FileNotFoundError as e:
             raise
@@ -199,32 +258,141 @@ class FileServices:
             raise
         except Exception as e:
             raise
+
+    def read_azure_blob_dataframe_chunks(self, blob_name: str, chunksize: int = 100000, **read_csv_kwargs):
+        """
+        Streams a CSV blob into a chunked pd.read_csv iterator: blob download chunks feed the
+        parser directly, so memory is bounded by chunksize rows plus one download chunk.
         
+        :param blob_name: Name of the CSV blob.
+        :param chunksize: Rows per yielded DataFrame.
+        """
+        try:
+            if self.blob_cache is not None:
+                return pd.read_csv(self.fetch_cached_blob(blob_name), chunksize=chunksize, **read_csv_kwargs)
+            return pd.read_csv(self.open_azure_blob_stream(blob_name), chunksize=chunksize, **read_csv_kwargs)
+        except Exception as e:
+            raise
+
+    def _read_cached_blob_dataframe(self, blob_name: str) -> pd.DataFrame:
+        # The parsed frame is kept as Parquet next to the cached object, so an unchanged blob skips the CSV parse
+        local_path = self.fetch_cached_blob(blob_name)
+        parsed_path = self.blob_cache.parsed_path(blob_name)
+        if os.path.exists(parsed_path):
+            return self.read_local_parquet(parsed_path)
+
+        df = pd.read_csv(local_path)
+        try:
+            self.write_local_parquet(df, parsed_path + '.tmp')
+            os.replace(parsed_path + '.tmp', parsed_path)
+        except Exception as e:
+            print(f"Could not cache parsed frame for blob {blob_name}: {e}")
+        return df
+
+    def open_azure_blob_stream(self, blob_name: str, max_concurrency: int = 4) -> io.BufferedReader:
+        # Binary file object over the blob download chunks
+        blob_client = self.container_client.get_blob_client(blob_name)
+        downloader = blob_client.download_blob(max_concurrency=max_concurrency)
+        return io.BufferedReader(BlobChunkStream(downloader.chunks()), buffer_size=4 * 1024 * 1024)
+
     def write_azure_blob_dataframe(self, df: pd.DataFrame, blob_name: str) -> None:
         """
         Writes a Pandas DataFrame directly to Azure Blob Storage as a CSV file.
+        The CSV is serialised and uploaded block by block (see write_azure_blob_dataframe_blocks).
         
         :param df: DataFrame to upload.
         :param blob_name: Name of the blob where the CSV will be stored.
         """
         try:
-            # Convert DataFrame to CSV format in-memory
-            csv_buffer = StringIO()
-            df.to_csv(csv_buffer, index=False)
-            csv_buffer.seek(0)  # Move cursor to the start of the stream
-            
-            # Get the blob client
-            blob_client = self.container_client.get_blob_client(blob_name)
-            
-            # Upload the CSV data from the buffer
-            blob_client.upload_blob(csv_buffer.getvalue(), overwrite=True)
+            self.write_azure_blob_dataframe_blocks(df, blob_name)
         
         except Exception as e:
             print(f"Failed to write DataFrame to Azure Blob: {e}")
             raise
 
+    def write_azure_blob_dataframe_blocks(self, data, blob_name: str, rows_per_block: int = 100000,
+                                          max_concurrency: int = 4, sep: str = ',') -> int:
+        """
+        Writes a DataFrame, or an iterable of DataFrames (e.g. SqlStorage.iter_query), as one CSV blob
+        using staged block uploads: each chunk is serialised to a block, up to max_concurrency blocks
+        are uploaded in parallel and the block list is committed at the end. Only the blocks in flight
+        are held in memory.
+        
+        :param data: DataFrame or iterable of DataFrames with the same columns.
+        :param blob_name: Name of the blob where the CSV will be stored.
+        :param rows_per_block: Rows serialised per block when data is a single DataFrame.
+        :return: Number of rows written.
+        """
+        if isinstance(data, pd.DataFrame):
+            df = data
+            data = (df.iloc[start:start + rows_per_block] for start in range(0, max(len(df), 1), rows_per_block))
+
+        blob_client = self.container_client.get_blob_client(blob_name)
+        block_ids = []
+        total_rows = 0
+        in_flight = threading.Semaphore(max_concurrency)
+
+        def stage(block_id, payload):
+            try:
+                blob_client.stage_block(block_id=block_id, data=payload)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = []
+            for i, chunk in enumerate(data):
+                payload = chunk.to_csv(index=False, header=(i == 0), sep=sep).encode('utf-8')
+                block_id = base64.b64encode(f'{i:08d}'.encode()).decode()
+                block_ids.append(block_id)
+                total_rows += len(chunk)
+
+                in_flight.acquire()
+                futures.append(executor.submit(stage, block_id, payload))
+
+            for future in futures:
+                future.result()
+
+        blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids])
+        return total_rows
+
+    def read_azure_blob_parquet(self, blob_name: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+        """
+        Reads a Parquet blob with column projection and row-group predicate pushdown.
+        The blob is accessed through ranged reads, so only the footer and the selected
+        column chunks of the matching row groups are downloaded.
+        """
+        try:
+            if self.blob_cache is not None:
+                return self.read_local_parquet(self.fetch_cached_blob(blob_name), columns=columns, filters=filters)
+
+            blob_client = self.container_client.get_blob_client(blob_name)
+            source = BlobRangeReader(blob_client)
+            table = pq.read_table(source, columns=columns, filters=filters)
+            return table.to_pandas()
+        except Exception as e:
+            raise
+
+    def write_azure_blob_parquet(self, df: pd.DataFrame, blob_name: str, row_group_size: int = 100000) -> None:
+        """
+        Writes a Pandas DataFrame to Azure Blob Storage as a Parquet file.
+        """
+        try:
+            buffer = BytesIO()
+            table = pa.Table.from_pandas(self.deduplicate_columns(df), preserve_index=False)
+            pq.write_table(table, buffer, row_group_size=row_group_size, compression='snappy')
+
+            blob_client = self.container_client.get_blob_client(blob_name)
+            blob_client.upload_blob(buffer.getvalue(), overwrite=True)
+
+        except Exception as e:
+            print(f"Failed to write DataFrame as Parquet to Azure Blob: {e}")
+            raise
+
     def read_azure_blob_text(self, blob_name: str) -> str:
         try:
+            if self.blob_cache is not None:
+                with open(self.fetch_cached_blob(blob_name), 'r', encoding='utf-8') as file:
+                    return file.read()
             
             # Download the blob as a string
             blob_client = self.container_client.get_blob_client(blob_name)
@@ -240,6 +408,10 @@ class FileServices:
 
     def read_azure_blob_file(self, blob_name: str, local_file_path: str) -> None:
         try:
+            if self.blob_cache is not None:
+                shutil.copyfile(self.fetch_cached_blob(blob_name), local_file_path)
+                return
+
             # Download the blob as a string
             blob_client = self.container_client.get_blob_client(blob_name)
 
@@ -255,6 +427,9 @@ class FileServices:
     
     def read_azure_blob_binary(self, blob_name: str) -> bytes:
         try:
+            if self.blob_cache is not None:
+                with open(self.fetch_cached_blob(blob_name), 'rb') as file:
+                    return file.read()
             
             # Download the blob as a string
             blob_client = self.container_client.get_blob_client(blob_name)
@@ -280,4 +455,75 @@ class FileServices:
                 blob_client.upload_blob(data, overwrite=True)  
 
         except Exception as e:
-            raise
\ No newline at end of file
+            raise
+
+
+class BlobRangeReader:
+    """
+    Minimal read-only, seekable file object over a blob using ranged downloads,
+    which lets pyarrow fetch only the byte ranges it needs from a Parquet blob.
+    """
+
+    def __init__(self, blob_client):
+        self.blob_client = blob_client
+        self.size = blob_client.get_blob_properties().size
+        self.position = 0
+        self.closed = False
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.position = offset
+        elif whence == 1:
+            self.position += offset
+        elif whence == 2:
+            self.position = self.size + offset
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b''
+
+        data = self.blob_client.download_blob(offset=self.position, length=size).readall()
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+class BlobChunkStream(io.RawIOBase):
+    """
+    Read-only raw stream over an iterator of byte chunks (StorageStreamDownloader.chunks()),
+    so parsers can consume a blob while it downloads.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
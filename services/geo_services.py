@@ -0,0 +1,165 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+from geopy.distance import geodesic
+
+# Raio médio da Terra em km (usado para converter radianos <-> km na métrica haversine)
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_radians(df, lat_col='latitude', lon_col='longitude'):
+    """
+    Returns an (n, 2) float array of [lat, lon] in radians, the layout expected by the haversine metric.
+    """
+    return np.radians(df[[lat_col, lon_col]].to_numpy(dtype=np.float64))
+
+
+def build_haversine_tree(coords_rad, leaf_size=40):
+    """
+    Builds a BallTree with the haversine metric over coordinates already in radians.
+    """
+    return BallTree(coords_rad, leaf_size=leaf_size, metric='haversine')
+
+
+class NearestNeighbourEngine:
+    """
+    Nearest-neighbour distance engine between two lat/long frames.
+
+    A haversine BallTree is built once over the reference frame and the query frame is
+    searched in vectorized batches, so the cost is O((n + m) log m) instead of one geodesic
+    call per pair. Distances are returned in km; indices are the index labels of the
+    reference frame.
+    """
+
+    def __init__(self, lat_col='latitude', lon_col='longitude', leaf_size=40, batch_size=50000):
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.leaf_size = leaf_size
+        self.batch_size = batch_size
+
+        self._tree = None
+        self._ref_coords = None
+        self._ref_index = None
+
+    def fit(self, df_ref):
+        self._ref_coords = to_radians(df_ref, self.lat_col, self.lon_col)
+        self._ref_index = df_ref.index.to_numpy()
+        self._tree = build_haversine_tree(self._ref_coords, leaf_size=self.leaf_size)
+        return self
+
+    def query(self, df, refine_k=None):
+        """
+        Find the closest reference point for every row of df.
+
+        :param df: Frame with the lat/long columns to query.
+        :param refine_k: When set, the refine_k best haversine candidates of each row are
+                         re-ranked with geopy's geodesic distance (WGS-84 ellipsoid).
+        :return: Tuple (distances_km, reference index labels), both aligned with df.
+        """
+        if self._tree is None:
+            raise Exception('NearestNeighbourEngine.fit() must be called before query()')
+
+        coords = to_radians(df, self.lat_col, self.lon_col)
+        n = len(coords)
+        distances = np.empty(n, dtype=np.float64)
+        positions = np.empty(n, dtype=np.int64)
+
+        k = 1 if not refine_k else min(int(refine_k), len(self._ref_coords))
+        for start in range(0, n, self.batch_size):
+            stop = min(start + self.batch_size, n)
+            dist, idx = self._tree.query(coords[start:stop], k=k)
+
+            if k == 1:
+                distances[start:stop] = dist[:, 0] * EARTH_RADIUS_KM
+                positions[start:stop] = idx[:, 0]
+            else:
+                best_dist, best_pos = self._refine_geodesic(coords[start:stop], idx)
+                distances[start:stop] = best_dist
+                positions[start:stop] = best_pos
+
+        return distances, self._ref_index[positions]
+
+    def _refine_geodesic(self, coords, candidates):
+        # Only the k candidates pre-selected by the tree are measured with geodesic
+        query_deg = np.degrees(coords)
+        ref_deg = np.degrees(self._ref_coords)
+
+        best_dist = np.empty(len(coords), dtype=np.float64)
+        best_pos = np.empty(len(coords), dtype=np.int64)
+        for i, row_candidates in enumerate(candidates):
+            point = (query_deg[i, 0], query_deg[i, 1])
+            dists = [geodesic(point, (ref_deg[j, 0], ref_deg[j, 1])).km for j in row_candidates]
+            best = int(np.argmin(dists))
+            best_dist[i] = dists[best]
+            best_pos[i] = row_candidates[best]
+
+        return best_dist, best_pos
+
+
+def calculate_closest_distances(df1, df2, lat_col='latitude', lon_col='longitude',
+                                refine_k=None, batch_size=50000):
+    """
+    Closest distance (km) and closest index label in both directions: df1 -> df2 and df2 -> df1.
+
+    Returns a tuple (dist_1, idx_1, dist_2, idx_2) where dist_1/idx_1 are aligned with df1
+    (pointing into df2) and dist_2/idx_2 are aligned with df2 (pointing into df1).
+    """
+    engine_2 = NearestNeighbourEngine(lat_col, lon_col, batch_size=batch_size).fit(df2)
+    dist_1, idx_1 = engine_2.query(df1, refine_k=refine_k)
+
+    engine_1 = NearestNeighbourEngine(lat_col, lon_col, batch_size=batch_size).fit(df1)
+    dist_2, idx_2 = engine_1.query(df2, refine_k=refine_k)
+
+    return dist_1, idx_1, dist_2, idx_2
+
+
+_GEOHASH_BASE32 = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+
+
+def geohash_grid(lat, lon, precision=6):
+    """
+    Integer position of lat/long arrays (degrees) in the geohash grid of the given precision.
+    Returns (lat_int, lon_int, lat_bits, lon_bits); the grid has 2^lat_bits rows and 2^lon_bits columns.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+
+    # Bisecção do geohash == posição inteira do ponto numa grade de 2^bits células
+    lon_int = np.clip(np.floor((lon + 180.0) / 360.0 * (1 << lon_bits)), 0, (1 << lon_bits) - 1).astype(np.int64)
+    lat_int = np.clip(np.floor((lat + 90.0) / 180.0 * (1 << lat_bits)), 0, (1 << lat_bits) - 1).astype(np.int64)
+    return lat_int, lon_int, lat_bits, lon_bits
+
+
+def encode_geohash(lat, lon, precision=6):
+    """
+    Vectorized geohash encoding of lat/long arrays (degrees). Returns an array of strings.
+    """
+    lat_int, lon_int, lat_bits, lon_bits = geohash_grid(lat, lon, precision)
+    total_bits = lat_bits + lon_bits
+
+    # Intercala os bits começando pela longitude
+    code = np.zeros(lat_int.shape, dtype=np.int64)
+    for bit in range(total_bits):
+        if bit % 2 == 0:
+            value = (lon_int >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_int >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+
+    chars = np.empty(lat_int.shape + (precision,), dtype=np.uint8)
+    for i in range(precision):
+        chars[..., precision - 1 - i] = _GEOHASH_BASE32[(code >> (5 * i)) & 31]
+
+    return chars.view(f'S{precision}').reshape(lat_int.shape).astype(str)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Vectorized great-circle distance in km between lat/long arrays (degrees).
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
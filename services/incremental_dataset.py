@@ -0,0 +1,137 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import json
+import os
+import threading
+import time
+
+PARTITION_COLUMN = 'partition_date'
+
+
+class WatermarkStore:
+    """
+    Persisted high-water marks, one per dataset, in a small JSON file.
+    A watermark only moves forward and is saved atomically after the rows it covers are written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get(self, dataset):
+        entry = self._load().get(dataset)
+        return entry['value'] if entry else None
+
+    def get_entry(self, dataset):
+        return self._load().get(dataset)
+
+    def set(self, dataset, column, value, rows=0):
+        with self._lock:
+            watermarks = self._load()
+            watermarks[dataset] = {
+                'column': column,
+                'value': value,
+                'rows': rows,
+                'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self._save(watermarks)
+
+    def reset(self, dataset):
+        with self._lock:
+            watermarks = self._load()
+            if watermarks.pop(dataset, None) is not None:
+                self._save(watermarks)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, watermarks):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(watermarks, file, indent=2, default=str)
+        os.replace(temp_path, self.path)
+
+
+class IncrementalDataset:
+    """
+    Append-only Parquet dataset partitioned by day (<root>/<name>/partition_date=YYYY-MM-DD/part-<run>.parquet).
+
+    Each incremental pull is appended as new part files; read() is the merged view: all parts in
+    load order, with rows re-read by a later pull (same dedup_key) keeping their latest version.
+    """
+
+    def __init__(self, root_dir, name, file_service, dedup_key=None):
+        self.root_dir = root_dir
+        self.name = name
+        self.path = os.path.join(root_dir, name)
+        self.file_service = file_service
+        self.dedup_key = dedup_key
+
+    def append(self, df, partition_values, upload_prefix=None):
+        """
+        Writes df split by partition_values (a date-like Series aligned with df, or one value for
+        all rows). Returns the relative paths of the written part files.
+        """
+        if df.empty:
+            return []
+
+        run_id = time.strftime('%Y%m%d%H%M%S') + f'{int(time.time() * 1000) % 1000:03d}'
+        if isinstance(partition_values, pd.Series):
+            dates = pd.to_datetime(partition_values, errors='coerce')
+        else:
+            dates = pd.Series(pd.Timestamp(partition_values), index=df.index)
+        dates = dates.dt.strftime('%Y-%m-%d').fillna('unknown')
+
+        written = []
+        for partition, part in df.groupby(dates, sort=True):
+            relative_path = f'{PARTITION_COLUMN}={partition}/part-{run_id}.parquet'
+            local_path = os.path.join(self.path, relative_path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+            temp_path = local_path + '.tmp'
+            self.file_service.write_local_parquet(part, temp_path)
+            os.replace(temp_path, local_path)
+
+            if upload_prefix is not None:
+                self.file_service.write_azure_blob_parquet(part, f'{upload_prefix}{self.name}/{relative_path}')
+            written.append(relative_path)
+
+        return written
+
+    def part_files(self):
+        # Load order = run id in the file name, independent of the partition directory
+        files = []
+        if os.path.isdir(self.path):
+            for directory, _, names in os.walk(self.path):
+                files.extend(os.path.join(directory, n) for n in names if n.startswith('part-') and n.endswith('.parquet'))
+        return sorted(files, key=lambda f: (os.path.basename(f), f))
+
+    def read(self, columns=None, filter=None):
+        """
+        Merged view of the dataset. filter is a pyarrow.dataset expression, e.g.
+        ds.field('partition_date') >= '2024-10-01', and prunes whole partitions.
+        """
+        files = self.part_files()
+        if not files:
+            return None
+
+        # Parts from different pulls may type an all-null column differently; unify permissively
+        schemas = [pq.read_schema(f) for f in files]
+        schema = pa.unify_schemas(schemas, promote_options='permissive')
+        partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor='hive')
+        schema = schema.append(pa.field(PARTITION_COLUMN, pa.string())) if PARTITION_COLUMN not in schema.names else schema
+
+        dataset = ds.dataset(files, schema=schema, format='parquet', partitioning=partitioning, partition_base_dir=self.path)
+        if columns is not None and self.dedup_key and self.dedup_key not in columns:
+            columns = list(columns) + [self.dedup_key]
+
+        df = dataset.to_table(columns=columns, filter=filter).to_pandas()
+        if self.dedup_key and self.dedup_key in df.columns:
+            df = df.drop_duplicates(subset=[self.dedup_key], keep='last').reset_index(drop=True)
+        return df
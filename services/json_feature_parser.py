@@ -0,0 +1,229 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import orjson
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+PARSER_VERSION = 1
+FEATURE_PREFIX = 'json_'
+BSSID_COLUMN = FEATURE_PREFIX + 'bssid_ids'
+JSON_COLUMNS = ('complemento_json', 'retorno_json')
+CACHE_DIR = '.json_features_cache'
+
+# Scalar features: output name -> path inside the mobile JSON document
+SCALAR_FEATURES = {
+    'versao_mobile': ('versaoMobile',),
+    'rede_tipo': ('rede', 'tipo'),
+    'rede_conectada': ('rede', 'redeConectada'),
+    'bssid_rede_conectada': ('rede', 'bssidRedeConectada'),
+    'lat': ('localizacao', 'lat'),
+    'lng': ('localizacao', 'lng'),
+    'acuracia': ('localizacao', 'acuracia'),
+    'suspeita_fake_gps': ('localizacao', 'suspeitaFakeGps'),
+    'velocidade': ('velocidade',),
+    'plataforma': ('celular', 'plataforma'),
+    'marca': ('celular', 'marca'),
+    'modelo': ('celular', 'modelo'),
+    'ip_country': ('ipInfo', 'country'),
+    'ip_city': ('ipInfo', 'city'),
+    'ip_vpn': ('ipInfo', 'privacy', 'vpn'),
+    'ip_proxy': ('ipInfo', 'privacy', 'proxy'),
+}
+CATEGORICAL_FEATURES = ['rede_tipo', 'rede_conectada', 'bssid_rede_conectada', 'plataforma', 'marca', 'modelo',
+                        'operadora', 'ip_country', 'ip_city']
+
+
+def _get_path(document, path):
+    for key in path:
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def _parse_chunk(values):
+    """
+    Worker: decodes one chunk of JSON strings with orjson. Returns the scalar feature columns and the
+    nearby-network BSSIDs flattened (strings + per-row counts); encoding to ids is done by the caller.
+    """
+    columns = {name: [] for name in SCALAR_FEATURES}
+    columns.update({'operadora': [], 'wifi_count': [], 'ssid_unique_count': [], 'parse_error': []})
+    bssids = []
+    bssid_counts = []
+
+    for value in values:
+        document = None
+        if isinstance(value, str) and value:
+            try:
+                document = orjson.loads(value)
+            except orjson.JSONDecodeError:
+                pass
+        columns['parse_error'].append(document is None and isinstance(value, str) and bool(value))
+        document = document if isinstance(document, dict) else {}
+
+        for name, path in SCALAR_FEATURES.items():
+            columns[name].append(_get_path(document, path))
+
+        operadoras = _get_path(document, ('celular', 'operadora'))
+        columns['operadora'].append(operadoras[0] if isinstance(operadoras, list) and operadoras else None)
+
+        ssids = _get_path(document, ('rede', 'redesProximas')) or []
+        columns['wifi_count'].append(len(ssids))
+        columns['ssid_unique_count'].append(len(set(ssids)))
+
+        # Lower-case so the same access point always maps to the same id
+        row_bssids = [b.lower() for b in (_get_path(document, ('rede', 'bssidRedesProximas')) or []) if b]
+        bssids.extend(row_bssids)
+        bssid_counts.append(len(row_bssids))
+
+    return columns, bssids, bssid_counts
+
+
+class JsonFeatureParser:
+    """
+    Parses the mobile JSON payload of transactions (complemento_json / retorno_json) into compact
+    columnar features: app version, location, device and IP info, network counts and the nearby
+    BSSIDs as a list of dictionary-encoded int32 ids.
+
+    Rows are decoded with orjson, in chunks spread over a process pool for large frames. The BSSID
+    vocabulary is persisted (bssid_vocab.parquet) so ids are stable across runs, and the parsed
+    features are cached as Parquet keyed by a hash of the JSON text, so an unchanged dataset is
+    never parsed twice.
+    """
+
+    def __init__(self, json_columns=JSON_COLUMNS, cache_dir=CACHE_DIR,
+                 max_workers=None, chunk_size=20000, min_rows_for_pool=50000):
+        self.json_columns = list(json_columns)
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.min_rows_for_pool = min_rows_for_pool  # Below this, pickling to workers costs more than parsing
+        self.vocab_path = os.path.join(cache_dir, 'bssid_vocab.parquet')
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vocab = self.load_vocab()
+
+    def select_json_column(self, df):
+        # First configured column with any content (retorno_json is empty in the current extracts)
+        for col in self.json_columns:
+            if col in df.columns and df[col].notna().any():
+                return col
+        return None
+
+    def content_hash(self, values):
+        digest = hashlib.sha256(f'v{PARSER_VERSION}'.encode())
+        for value in values:
+            digest.update(value.encode('utf-8') if isinstance(value, str) else b'\x00')
+            digest.update(b'\x1e')
+        return digest.hexdigest()
+
+    def transform(self, df, use_cache=True):
+        """
+        Returns a DataFrame of json_* features aligned with df (same index). BSSIDs are in
+        json_bssid_ids as int32 arrays (ids into bssid_vocab()).
+        """
+        col = self.select_json_column(df)
+        if col is None:
+            return pd.DataFrame(index=df.index)
+
+        values = df[col].tolist()
+        cache_path = os.path.join(self.cache_dir, f'features_{self.content_hash(values)}.parquet')
+        if use_cache and os.path.exists(cache_path):
+            start_time = time.time()
+            features = self.read_features(cache_path)
+            features.index = df.index
+            print(f'Loaded {len(features)} parsed {col} rows from cache in {time.time() - start_time:.2f} seconds')
+            return features
+
+        start_time = time.time()
+        table = self.parse(values)
+        pq.write_table(table, cache_path, compression='zstd')
+        features = self.table_to_frame(table)
+        features.index = df.index
+        print(f'Parsed {len(features)} {col} rows in {time.time() - start_time:.2f} seconds')
+        return features
+
+    def parse(self, values):
+        """Parses a list of JSON strings into an Arrow table of features."""
+        chunks = [values[i:i + self.chunk_size] for i in range(0, len(values), self.chunk_size)]
+        if len(values) >= self.min_rows_for_pool and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                results = list(pool.map(_parse_chunk, chunks))
+        else:
+            results = [_parse_chunk(chunk) for chunk in chunks]
+
+        columns = {name: [] for name in results[0][0]} if results else {}
+        bssids, bssid_counts = [], []
+        for chunk_columns, chunk_bssids, chunk_counts in results:
+            for name, column in chunk_columns.items():
+                columns[name].extend(column)
+            bssids.extend(chunk_bssids)
+            bssid_counts.extend(chunk_counts)
+
+        codes = self.encode_bssids(bssids)
+        offsets = np.zeros(len(bssid_counts) + 1, dtype=np.int32)
+        np.cumsum(bssid_counts, out=offsets[1:])
+
+        arrays = {}
+        versao = pd.to_numeric(pd.Series(columns['versao_mobile'], dtype=object), errors='coerce')
+        arrays['versao_mobile'] = pa.array(versao.astype('Int32'), type=pa.int32())
+        for name in ['lat', 'lng', 'acuracia', 'velocidade']:
+            arrays[name] = pa.array(pd.to_numeric(pd.Series(columns[name], dtype=object), errors='coerce'), type=pa.float64())
+        arrays['suspeita_fake_gps'] = pa.array(pd.to_numeric(pd.Series(columns['suspeita_fake_gps'], dtype=object), errors='coerce').astype('Int8'), type=pa.int8())
+        for name in ['ip_vpn', 'ip_proxy', 'parse_error']:
+            arrays[name] = pa.array(columns[name], type=pa.bool_())
+        for name in ['wifi_count', 'ssid_unique_count']:
+            arrays[name] = pa.array(columns[name], type=pa.int16())
+        for name in CATEGORICAL_FEATURES:
+            # Dictionary-encoded strings: repeated values are stored once
+            arrays[name] = pa.array([None if v is None else str(v) for v in columns[name]], type=pa.string()).dictionary_encode()
+        arrays['bssid_ids'] = pa.ListArray.from_arrays(pa.array(offsets), pa.array(codes, type=pa.int32()))
+
+        return pa.table({FEATURE_PREFIX + name: array for name, array in arrays.items()})
+
+    def encode_bssids(self, bssids):
+        # Known BSSIDs keep their id; new ones are appended to the vocabulary in first-seen order
+        if not bssids:
+            return np.empty(0, dtype=np.int32)
+
+        flat = pd.Index(bssids)
+        codes = self.vocab.get_indexer(flat)
+        missing = codes < 0
+        if missing.any():
+            new_bssids = pd.unique(flat[missing])
+            self.vocab = self.vocab.append(pd.Index(new_bssids))
+            self.save_vocab()
+            codes = self.vocab.get_indexer(flat)
+        return codes.astype(np.int32)
+
+    def bssid_vocab(self):
+        """BSSID strings indexed by their id."""
+        return self.vocab
+
+    def load_vocab(self):
+        if os.path.exists(self.vocab_path):
+            return pd.Index(pq.read_table(self.vocab_path).column('bssid').to_pylist(), dtype=object)
+        return pd.Index([], dtype=object)
+
+    def save_vocab(self):
+        temp_path = self.vocab_path + '.tmp'
+        pq.write_table(pa.table({'bssid': pa.array(self.vocab.tolist(), type=pa.string())}), temp_path)
+        os.replace(temp_path, self.vocab_path)
+
+    def read_features(self, path):
+        return self.table_to_frame(pq.read_table(path))
+
+    def table_to_frame(self, table):
+        # Lists come back as numpy int32 arrays, dictionary columns as categoricals, ints/bools as nullable dtypes
+        bssid_ids = table.column(BSSID_COLUMN).combine_chunks()
+        nullable_types = {pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+                          pa.bool_(): pd.BooleanDtype()}
+        features = table.drop_columns([BSSID_COLUMN]).to_pandas(types_mapper=nullable_types.get)
+        offsets = bssid_ids.offsets.to_numpy()
+        codes = bssid_ids.values.to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+        features[BSSID_COLUMN] = [codes[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return features
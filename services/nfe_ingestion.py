@@ -0,0 +1,386 @@
+import pandas as pd
+import numpy as np
+import asyncio
+import datetime
+import hashlib
+import time
+
+CHECKPOINT_TABLE = 'rec_ml_ingestao_checkpoint'
+CNPJ_QUERY = 'SELECT DISTINCT cnpj FROM rec_ml_chave_busca_cred WHERE cnpj IS NOT NULL'
+TOKEN_QUERY = 'SELECT cnpj, token_autorizacao FROM rec_ml_token_autorizacao'
+
+NOTA_COLUMNS = ['id', 'chave_nf', 'cnpj_fornecedor', 'data_emissao', 'valor_total']
+ITEM_COLUMNS = ['id', 'nota_fiscal_ml_id', 'ncm', 'descricao', 'quantidade', 'valor_unitario',
+                'desconto', 'aliq_icms', 'valor_icms', 'valor_total']
+
+
+def stable_id(key):
+    """Positive 63-bit id derived from a natural key, so re-ingesting a chave_nf always maps to the same row."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') & 0x7FFFFFFFFFFFFFFF
+
+
+def iter_nfe_documents(payload):
+    # The response may be a list of documents, a dict wrapping that list, or a single document
+    if isinstance(payload, list):
+        for doc in payload:
+            yield from iter_nfe_documents(doc)
+    elif isinstance(payload, dict):
+        if is_nfe_document(payload):
+            yield payload
+        else:
+            for value in payload.values():
+                if isinstance(value, (list, dict)):
+                    yield from iter_nfe_documents(value)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _inf_nfe(doc):
+    proc = doc.get('nfeProc', doc)
+    inf = proc.get('NFe', proc)
+    return inf.get('infNFe', inf)
+
+
+def nfe_access_key(doc):
+    """Access key (chave) of an NF-e document: protNFe/infProt/chNFe, else the infNFe Id without the 'NFe' prefix."""
+    proc = doc.get('nfeProc', doc)
+    chave = (proc.get('protNFe') or {}).get('infProt', {}).get('chNFe')
+    if not chave:
+        inf = _inf_nfe(doc)
+        chave = str(inf.get('@Id') or inf.get('Id') or '').replace('NFe', '')
+    return chave or None
+
+
+def is_nfe_document(value):
+    return isinstance(value, dict) and any(k in value for k in ('nfeProc', 'NFe', 'infNFe'))
+
+
+def parse_nfe(doc):
+    """
+    Flattens one NF-e document (SEFAZ layout: nfeProc/NFe/infNFe) into a header dict and item dicts.
+    Returns (None, []) when the document has no access key.
+    """
+    inf = _inf_nfe(doc)
+    chave = nfe_access_key(doc)
+    if not chave:
+        return None, []
+
+    ide = inf.get('ide', {})
+    nota_id = stable_id(chave)
+    header = {
+        'id': nota_id,
+        'chave_nf': chave,
+        'cnpj_fornecedor': inf.get('emit', {}).get('CNPJ'),
+        'data_emissao': ide.get('dhEmi') or ide.get('dEmi'),
+        'valor_total': inf.get('total', {}).get('ICMSTot', {}).get('vNF')
+    }
+
+    items = []
+    for position, det in enumerate(_as_list(inf.get('det')), start=1):
+        prod = det.get('prod', {})
+        icms_groups = det.get('imposto', {}).get('ICMS', {})
+        # ICMS comes wrapped in its CST group (ICMS00, ICMS20, ICMSSN102, ...)
+        icms = next(iter(icms_groups.values()), {}) if isinstance(icms_groups, dict) else {}
+        item_number = det.get('@nItem') or det.get('nItem') or position
+        items.append({
+            'id': stable_id(f'{chave}:{item_number}'),
+            'nota_fiscal_ml_id': nota_id,
+            'ncm': prod.get('NCM'),
+            'descricao': (prod.get('xProd') or '')[:100] or None,
+            'quantidade': prod.get('qCom'),
+            'valor_unitario': prod.get('vUnCom'),
+            'desconto': prod.get('vDesc'),
+            'aliq_icms': icms.get('pICMS') if isinstance(icms, dict) else None,
+            'valor_icms': icms.get('vICMS') if isinstance(icms, dict) else None,
+            'valor_total': prod.get('vProd')
+        })
+
+    return header, items
+
+
+def to_typed_frames(headers, items):
+    """
+    Column-typed frames (int64 ids, datetime, float64 money) ready for the batched inserts.
+    Notes that would violate the NOT NULL columns of rec_ml_nota_fiscal (e.g. an emitter with CPF
+    instead of CNPJ, or an unparseable emission date) are left out with their items and returned
+    as a third frame (chave_nf, cnpj_fornecedor, motivo).
+    """
+    notas = pd.DataFrame(headers, columns=NOTA_COLUMNS)
+    notas['id'] = notas['id'].astype(np.int64)
+    # dhEmi carries the UTC offset (-03:00); the table stores local time without offset
+    notas['data_emissao'] = pd.to_datetime(notas['data_emissao'].astype(str).str[:19], errors='coerce')
+    notas['valor_total'] = pd.to_numeric(notas['valor_total'], errors='coerce')
+
+    motivo = pd.Series(None, index=notas.index, dtype=object)
+    motivo[notas['data_emissao'].isna()] = 'data_emissao ausente ou inválida'
+    motivo[notas['cnpj_fornecedor'].isna() | (notas['cnpj_fornecedor'].astype(str).str.strip() == '')] = 'emitente sem CNPJ'
+    invalid = motivo.notna()
+    rejected = notas.loc[invalid, ['chave_nf', 'cnpj_fornecedor']].assign(motivo=motivo[invalid])
+    notas = notas[~invalid]
+
+    itens = pd.DataFrame(items, columns=ITEM_COLUMNS)
+    itens[['id', 'nota_fiscal_ml_id']] = itens[['id', 'nota_fiscal_ml_id']].astype(np.int64)
+    itens = itens[itens['nota_fiscal_ml_id'].isin(notas['id'])]
+    for col in ['quantidade', 'valor_unitario', 'desconto', 'aliq_icms', 'valor_icms', 'valor_total']:
+        itens[col] = pd.to_numeric(itens[col], errors='coerce')
+
+    # Dedup on chave_nf: a note returned by two windows/CNPJs is written once (last wins)
+    notas = notas.drop_duplicates(subset=['chave_nf'], keep='last')
+    itens = itens.drop_duplicates(subset=['id'], keep='last')
+    return notas, itens, rejected
+
+
+def to_parameters(df):
+    # NaN/NaT -> None and numpy scalars -> Python values for the DB-API driver
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            columns.append([None if pd.isna(v) else v.to_pydatetime() for v in series])
+        else:
+            columns.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+class NfeIngestionPipeline:
+    """
+    Fetches the NF-e of every CNPJ in rec_ml_chave_busca_cred per date window and upserts them into
+    rec_ml_nota_fiscal / rec_ml_nota_fiscal_item.
+
+    Each CNPJ is queried with its own tokenAutorizacao (tokens_autorizacao {cnpj: token}, default read
+    from rec_ml_token_autorizacao); CNPJs without a token are skipped and counted in metrics['cnpjs_sem_token'].
+
+    Windows are fetched by max_workers concurrent workers through the async SERPRO client (its own
+    rate/concurrency limits apply) into a queue of at most queue_size windows, so fetching never runs
+    far ahead of writing; a single writer accumulates the flattened notes and writes them in batches
+    of batch_size notes.
+    Each batch deletes the existing rows of its ids (ids derive from chave_nf) and inserts the new
+    ones, together with the checkpoints of the (cnpj, window) pairs it completes, in one transaction:
+    a rerun skips finished windows and never duplicates a note. Windows ending today or later are
+    written but not checkpointed, since notes issued later in the day would be missed.
+
+    Notes that cannot be stored (see to_typed_frames) are skipped, counted in metrics['notas_rejeitadas']
+    and kept in self.rejected, so one bad document never fails its batch.
+    """
+
+    def __init__(self, client, target_factory, tokens_autorizacao=None, window_days=7, batch_size=500,
+                 max_workers=8, queue_size=16, delete_chunk_size=500, cnpj_query=CNPJ_QUERY, token_query=TOKEN_QUERY):
+        self.client = client  # Entered SerproAsyncClient (or any object with async consultar_nfs_por_cnpj)
+        self.target_factory = target_factory  # () -> SqlStorage-like object (conn, close())
+        self.tokens_autorizacao = tokens_autorizacao  # {cnpj: tokenAutorizacao}; None reads token_query
+        self.window_days = window_days
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.delete_chunk_size = delete_chunk_size  # SQL Server accepts at most 2100 parameters per statement
+        self.cnpj_query = cnpj_query
+        self.token_query = token_query
+
+        self.metrics = {}
+        self.rejected = []  # {'chave_nf', 'cnpj_fornecedor', 'motivo'} of the skipped notes
+
+    def read_cnpjs(self):
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            cursor.execute(self.cnpj_query)
+            return [str(row[0]).strip() for row in cursor.fetchall() if row[0]]
+        finally:
+            target.close()
+
+    def read_tokens(self):
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            cursor.execute(self.token_query)
+            return {str(row[0]).strip(): row[1] for row in cursor.fetchall() if row[0] and row[1]}
+        finally:
+            target.close()
+
+    def build_windows(self, data_inicio, data_fim):
+        # Half-open [start, end) windows of window_days days
+        bounds = list(pd.date_range(pd.Timestamp(data_inicio), pd.Timestamp(data_fim), freq=f'{self.window_days}D'))
+        if bounds[-1] < pd.Timestamp(data_fim):
+            bounds.append(pd.Timestamp(data_fim))
+        return [(a.strftime('%Y-%m-%d'), b.strftime('%Y-%m-%d')) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    async def run(self, data_inicio, data_fim, cnpjs=None):
+        """Ingests all CNPJs (default: read_cnpjs()) between data_inicio and data_fim. Returns the run metrics."""
+        start_time = time.time()
+        cnpjs = cnpjs if cnpjs is not None else await asyncio.to_thread(self.read_cnpjs)
+        tokens = self.tokens_autorizacao if self.tokens_autorizacao is not None else await asyncio.to_thread(self.read_tokens)
+        without_token = [cnpj for cnpj in cnpjs if not tokens.get(cnpj)]
+        if without_token:
+            print(f'Skipping {len(without_token)} CNPJs without tokenAutorizacao: ' + ', '.join(without_token[:5])
+                  + (' ...' if len(without_token) > 5 else ''))
+        cnpjs = [cnpj for cnpj in cnpjs if tokens.get(cnpj)]
+        await asyncio.to_thread(self.ensure_checkpoint_table)
+        done = await asyncio.to_thread(self.read_done_windows)
+
+        windows = self.build_windows(data_inicio, data_fim)
+        # A window is only skipped when the same [start, end) was finished: a shorter last window of an
+        # earlier run (ending at its data_fim) is fetched again in full
+        tasks = [(cnpj, tokens[cnpj], start, end) for cnpj in cnpjs for start, end in windows if (cnpj, start, end) not in done]
+        self.metrics = {'cnpjs': len(cnpjs), 'cnpjs_sem_token': len(without_token), 'windows': len(tasks),
+                        'skipped_windows': len(cnpjs) * len(windows) - len(tasks), 'failed_windows': 0, 'open_windows': 0,
+                        'notas': 0, 'itens': 0, 'notas_rejeitadas': 0, 'batches': 0, 'fetch_seconds': 0.0, 'write_seconds': 0.0}
+        self.rejected = []
+        print(f'Starting NF-e ingestion of {len(tasks)} CNPJ windows ({self.metrics["skipped_windows"]} already done) '
+              f'with {self.max_workers} workers...')
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        writer = asyncio.create_task(self.write_loop(queue))
+        # Workers share one iterator over the windows, so at most max_workers fetches are in flight
+        pending = iter(tasks)
+        fetchers = asyncio.gather(*(self.fetch_worker(queue, pending) for _ in range(self.max_workers)))
+        await asyncio.wait([fetchers, writer], return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            # The writer only returns on the end marker, so it failed: stop fetching and raise its error
+            fetchers.cancel()
+            await asyncio.gather(fetchers, return_exceptions=True)
+            writer.result()
+        await fetchers
+        await queue.put(None)
+        await writer
+
+        elapsed = time.time() - start_time
+        self.metrics['seconds'] = elapsed
+        self.metrics['notas_per_second'] = self.metrics['notas'] / elapsed if elapsed > 0 else 0.0
+        print(f'NF-e ingestion completed: {self.metrics["notas"]} notes, {self.metrics["itens"]} items in '
+              f'{elapsed:.2f} seconds ({self.metrics["notas_per_second"]:.1f} notes/s, '
+              f'{self.metrics["batches"]} batches, {self.metrics["failed_windows"]} failed windows, '
+              f'{self.metrics["notas_rejeitadas"]} rejected notes).')
+        return self.metrics
+
+    async def fetch_worker(self, queue, pending):
+        for cnpj, token, start, end in pending:
+            await self.fetch_window(queue, cnpj, token, start, end)
+
+    async def fetch_window(self, queue, cnpj, token, start, end):
+        fetch_start = time.time()
+        try:
+            payload = await self.client.consultar_nfs_por_cnpj(token, cnpj, start, end)
+        except Exception as e:
+            # The window keeps no checkpoint, so the next run retries it
+            self.metrics['failed_windows'] += 1
+            print(f'Erro ao consultar NFes do CNPJ {cnpj} [{start}, {end}): {e}')
+            return
+        self.metrics['fetch_seconds'] += time.time() - fetch_start
+
+        headers, items = [], []
+        for doc in iter_nfe_documents(payload):
+            header, doc_items = parse_nfe(doc)
+            if header is not None:
+                headers.append(header)
+                items.extend(doc_items)
+        await queue.put((cnpj, start, end, headers, items))
+
+    async def write_loop(self, queue):
+        pending_windows, headers, items = [], [], []
+        while True:
+            entry = await queue.get()
+            if entry is not None:
+                cnpj, start, end, window_headers, window_items = entry
+                pending_windows.append((cnpj, start, end, len(window_headers)))
+                headers.extend(window_headers)
+                items.extend(window_items)
+
+            if pending_windows and (entry is None or len(headers) >= self.batch_size):
+                await asyncio.to_thread(self.write_batch, headers, items, pending_windows)
+                pending_windows, headers, items = [], [], []
+
+            if entry is None:
+                return
+
+    def write_batch(self, headers, items, windows):
+        write_start = time.time()
+        notas, itens, rejected = to_typed_frames(headers, items)
+        if not rejected.empty:
+            print(f'Skipping {len(rejected)} invalid notes: ' + ', '.join(f'{r.chave_nf} ({r.motivo})' for r in rejected.head(5).itertuples())
+                  + (' ...' if len(rejected) > 5 else ''))
+
+        target = self.target_factory()
+        try:
+            conn = target.conn
+            cursor = conn.cursor()
+            try:
+                cursor.fast_executemany = True
+            except AttributeError:
+                pass  # Not a pyodbc cursor (e.g. sqlite3)
+
+            nota_ids = [int(i) for i in notas['id']]
+            for start in range(0, len(nota_ids), self.delete_chunk_size):
+                chunk = nota_ids[start:start + self.delete_chunk_size]
+                placeholders = ', '.join('?' for _ in chunk)
+                cursor.execute(f'DELETE FROM rec_ml_nota_fiscal_item WHERE nota_fiscal_ml_id IN ({placeholders})', chunk)
+                cursor.execute(f'DELETE FROM rec_ml_nota_fiscal WHERE id IN ({placeholders})', chunk)
+
+            if not notas.empty:
+                cursor.executemany(f"INSERT INTO rec_ml_nota_fiscal ({', '.join(NOTA_COLUMNS)}) "
+                                   f"VALUES ({', '.join('?' for _ in NOTA_COLUMNS)})", to_parameters(notas))
+            if not itens.empty:
+                cursor.executemany(f"INSERT INTO rec_ml_nota_fiscal_item ({', '.join(ITEM_COLUMNS)}) "
+                                   f"VALUES ({', '.join('?' for _ in ITEM_COLUMNS)})", to_parameters(itens))
+
+            now = datetime.datetime.now()
+            # A window ending today or later is still open: notes issued later today must be fetched on the next run
+            closed = [(cnpj, start, end, count) for cnpj, start, end, count in windows if end < now.strftime('%Y-%m-%d')]
+            if closed:
+                cursor.executemany(f'INSERT INTO {CHECKPOINT_TABLE} (cnpj, data_inicio, data_fim, notas, updated_at) VALUES (?, ?, ?, ?, ?)',
+                                   [(cnpj, start, end, count, now.strftime('%Y-%m-%d %H:%M:%S')) for cnpj, start, end, count in closed])
+            conn.commit()
+        except Exception:
+            target.conn.rollback()
+            raise
+        finally:
+            target.close()
+
+        elapsed = time.time() - write_start
+        self.metrics['notas'] += len(notas)
+        self.metrics['itens'] += len(itens)
+        self.metrics['notas_rejeitadas'] += len(rejected)
+        self.rejected.extend(rejected.to_dict('records'))
+        self.metrics['open_windows'] += len(windows) - len(closed)
+        self.metrics['batches'] += 1
+        self.metrics['write_seconds'] += elapsed
+        print(f'Wrote batch of {len(notas)} notes and {len(itens)} items ({len(windows)} CNPJ windows) in {elapsed:.2f} seconds')
+
+    def ensure_checkpoint_table(self):
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            try:
+                cursor.execute(f'SELECT 1 FROM {CHECKPOINT_TABLE} WHERE 1 = 0')
+            except Exception:
+                target.conn.rollback()
+                cursor.execute(f'CREATE TABLE {CHECKPOINT_TABLE} (cnpj VARCHAR(20) NOT NULL, data_inicio VARCHAR(10) NOT NULL, '
+                               f'data_fim VARCHAR(10) NOT NULL, notas INT, updated_at VARCHAR(19), PRIMARY KEY (cnpj, data_inicio, data_fim))')
+            target.conn.commit()
+        finally:
+            target.close()
+
+    def read_done_windows(self):
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            cursor.execute(f'SELECT cnpj, data_inicio, data_fim FROM {CHECKPOINT_TABLE}')
+            return {(row[0], row[1], row[2]) for row in cursor.fetchall()}
+        finally:
+            target.close()
+
+    def reset_checkpoints(self, cnpj=None):
+        """Forgets finished windows (all, or one CNPJ) so they are fetched again."""
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            if cnpj is None:
+                cursor.execute(f'DELETE FROM {CHECKPOINT_TABLE}')
+            else:
+                cursor.execute(f'DELETE FROM {CHECKPOINT_TABLE} WHERE cnpj = ?', [cnpj])
+            target.conn.commit()
+        finally:
+            target.close()
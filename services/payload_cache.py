@@ -0,0 +1,198 @@
+import zstandard as zstd
+import json
+from collections import Counter
+import os
+import threading
+import time
+from services.nfe_ingestion import is_nfe_document, nfe_access_key
+
+
+class PayloadCache:
+    """
+    Local store of SERPRO NF-e responses, keyed by CNPJ + period, with each invoice stored once by chave.
+
+    A response is split into its NF-e documents and a skeleton in which every document is replaced by
+    a {'$chave': ...} reference. Documents and skeletons are zstd-compressed and appended to a single
+    pack file, so overlapping periods share the same invoice bytes and there is no per-file block overhead.
+    index.json maps query keys and chaves to (offset, length) in the pack for O(1) lookups.
+
+    When the pack holds more than max_bytes of live data, the least recently used queries are evicted
+    (and the documents no other query references); the pack is compacted once half of it is dead.
+    Periods that include today are only served for open_period_ttl seconds.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 ** 2, level=10, open_period_ttl=3600):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.open_period_ttl = open_period_ttl
+
+        self._compressor = zstd.ZstdCompressor(level=level)
+        self._decompressor = zstd.ZstdDecompressor()
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+        self.pack_path = os.path.join(cache_dir, self.index['pack'])
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def query_key(self, cnpj, data_inicio=None, data_fim=None):
+        return f'{cnpj}|{data_inicio or ""}|{data_fim or ""}'
+
+    def get(self, cnpj, data_inicio=None, data_fim=None):
+        """Returns the cached response for the query, or None."""
+        key = self.query_key(cnpj, data_inicio, data_fim)
+        with self._lock:
+            entry = self.index['queries'].get(key)
+            if entry is None or self._expired(entry, data_fim):
+                self.stats['misses'] += 1
+                return None
+
+            skeleton = self._read(entry['skeleton'])
+            documents = {chave: self._read(self.index['docs'][chave]) for chave in entry['chaves']}
+            entry['last_access'] = time.time()
+            self.stats['hits'] += 1
+
+        return self._rebuild(skeleton, documents)
+
+    def put(self, cnpj, data_inicio, data_fim, payload):
+        key = self.query_key(cnpj, data_inicio, data_fim)
+        documents = {}
+        skeleton = self._split(payload, documents)
+
+        with self._lock:
+            with open(self.pack_path, 'ab') as pack:
+                for chave, document in documents.items():
+                    # One entry per invoice, shared by every period that returns it (latest version wins)
+                    self.index['docs'][chave] = self._append(pack, document)
+
+                now = time.time()
+                self.index['queries'][key] = {
+                    'skeleton': self._append(pack, skeleton),
+                    'chaves': list(documents.keys()),
+                    'created_at': now,
+                    'last_access': now
+                }
+
+            self._evict()
+            self._save_index()
+
+    def get_document(self, chave):
+        """Cached NF-e document by its access key, or None."""
+        with self._lock:
+            location = self.index['docs'].get(chave)
+            return self._read(location) if location is not None else None
+
+    def flush(self):
+        # get() only updates last_access in memory; persist it for LRU across runs
+        with self._lock:
+            self._save_index()
+
+    def size(self):
+        """Live (referenced) compressed bytes and raw JSON bytes they represent."""
+        locations = list(self.index['docs'].values()) + [q['skeleton'] for q in self.index['queries'].values()]
+        return sum(l[1] for l in locations), sum(l[2] for l in locations)
+
+    def _expired(self, entry, data_fim):
+        # A period still open (ends today or later) can gain invoices, so it is only cached briefly
+        if data_fim is None or str(data_fim)[:10] >= time.strftime('%Y-%m-%d'):
+            return time.time() - entry['created_at'] > self.open_period_ttl
+        return False
+
+    def _split(self, value, documents):
+        if is_nfe_document(value):
+            chave = nfe_access_key(value)
+            if chave:
+                documents[chave] = value
+                return {'$chave': chave}
+        if isinstance(value, list):
+            return [self._split(v, documents) for v in value]
+        if isinstance(value, dict):
+            return {k: self._split(v, documents) for k, v in value.items()}
+        return value
+
+    def _rebuild(self, value, documents):
+        if isinstance(value, dict):
+            if len(value) == 1 and '$chave' in value:
+                return documents[value['$chave']]
+            return {k: self._rebuild(v, documents) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._rebuild(v, documents) for v in value]
+        return value
+
+    def _append(self, pack, value):
+        raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        data = self._compressor.compress(raw)
+        offset = pack.tell()
+        pack.write(data)
+        return [offset, len(data), len(raw)]
+
+    def _read(self, location):
+        offset, length, _ = location
+        with open(self.pack_path, 'rb') as pack:
+            pack.seek(offset)
+            return json.loads(self._decompressor.decompress(pack.read(length)))
+
+    def _evict(self):
+        live_bytes, _ = self.size()
+        references = Counter(chave for q in self.index['queries'].values() for chave in q['chaves'])
+        queries = sorted(self.index['queries'].items(), key=lambda item: item[1]['last_access'])
+        for key, entry in queries:
+            if live_bytes <= self.max_bytes:
+                break
+            del self.index['queries'][key]
+            live_bytes -= entry['skeleton'][1]
+
+            for chave in entry['chaves']:
+                references[chave] -= 1
+                if references[chave] <= 0 and chave in self.index['docs']:
+                    live_bytes -= self.index['docs'].pop(chave)[1]
+
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if pack_size > 2 * live_bytes:
+            self._compact()
+
+    def _compact(self):
+        # Live entries are copied to a new pack generation; the index is switched to it before the old pack goes
+        generation = int(self.index['pack'].split('-')[1].split('.')[0]) + 1
+        new_pack = f'payloads-{generation}.pack'
+        new_path = os.path.join(self.cache_dir, new_pack)
+        with open(self.pack_path, 'rb') as source, open(new_path, 'wb') as target:
+            def copy(location):
+                offset, length, raw_length = location
+                source.seek(offset)
+                new_offset = target.tell()
+                target.write(source.read(length))
+                return [new_offset, length, raw_length]
+
+            for chave, location in self.index['docs'].items():
+                self.index['docs'][chave] = copy(location)
+            for entry in self.index['queries'].values():
+                entry['skeleton'] = copy(entry['skeleton'])
+
+        old_path = self.pack_path
+        self.index['pack'] = new_pack
+        self.pack_path = new_path
+        self._save_index()
+        os.remove(old_path)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            # An index without its pack cannot be trusted
+            if os.path.exists(os.path.join(self.cache_dir, index['pack'])):
+                return index
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('payloads-') and name.endswith('.pack'):
+                os.remove(os.path.join(self.cache_dir, name))
+        return {'pack': 'payloads-0.pack', 'queries': {}, 'docs': {}}
+
+    def _save_index(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.index, file, separators=(',', ':'))
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+
+
+class SnapshotCache:
+    """
+    Local Parquet snapshots of query results.
+
+    A snapshot is keyed by a hash of the rendered SQL, the target server/database and an optional
+    freshness token (watermark or time window), and expires after ttl seconds. Each entry is
+    <key>.parquet plus a <key>.json metadata file written after the data, so a half-written
+    snapshot is never served.
+    """
+
+    def __init__(self, cache_dir, file_service, default_ttl=86400):
+        self.cache_dir = cache_dir
+        self.file_service = file_service
+        self.default_ttl = default_ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, rendered_sql, database, freshness=None):
+        # Whitespace-only edits to the SQL file should not invalidate the snapshot
+        normalized_sql = ' '.join(rendered_sql.split())
+        payload = json.dumps({'sql': normalized_sql, 'database': database, 'freshness': freshness},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key, ttl=None, columns=None, filters=None):
+        """Returns the snapshot DataFrame, or None when it does not exist or is older than ttl."""
+        meta = self.get_metadata(key)
+        if meta is None:
+            return None
+
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl is not None and time.time() - meta['created_at'] > ttl:
+            self.invalidate(key)
+            return None
+
+        try:
+            return self.file_service.read_local_parquet(self._data_path(key), columns=columns, filters=filters)
+        except FileNotFoundError:
+            self.invalidate(key)
+            return None
+
+    def put(self, key, df, **metadata):
+        temp_path = self._data_path(key) + '.tmp'
+        self.file_service.write_local_parquet(df, temp_path)
+        os.replace(temp_path, self._data_path(key))
+
+        meta = dict(metadata, key=key, rows=len(df), created_at=time.time())
+        temp_path = self._meta_path(key) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file, default=str)
+        os.replace(temp_path, self._meta_path(key))
+
+    def get_metadata(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def invalidate(self, key=None):
+        """Drops one snapshot (or all of them when key is None)."""
+        if key is None:
+            keys = {name.split('.')[0] for name in os.listdir(self.cache_dir)}
+        else:
+            keys = [key]
+
+        for k in keys:
+            for path in (self._meta_path(k), self._data_path(k)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _data_path(self, key):
+        return os.path.join(self.cache_dir, key + '.parquet')
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
@@ -0,0 +1,238 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import os
+from services.geo_services import EARTH_RADIUS_KM, encode_geohash, geohash_grid, haversine_km
+
+GEOHASH_COLUMN = 'geohash'
+CELL_COLUMN = 'geo_cell'
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+MAX_ABS_LAT = 85.0  # Cells narrow to nothing near the poles; beyond this the ring count is unbounded
+
+
+class GeoGrid:
+    """
+    Geohash grid at a fixed precision. A cell key is the int64 (lat_int << lon_bits) | lon_int of the
+    geohash cell, so neighbour cells are plain integer offsets and joins are merges on int keys.
+    Points without coordinates get key -1.
+    """
+
+    def __init__(self, precision=6):
+        self.precision = precision
+        _, _, self.lat_bits, self.lon_bits = geohash_grid(np.zeros(0), np.zeros(0), precision)
+
+    def cell_height_km(self):
+        return 180.0 / (1 << self.lat_bits) * KM_PER_DEGREE
+
+    def rings_for_radius(self, max_km, max_abs_lat):
+        """
+        Neighbour rings needed so every point within max_km of a point with |lat| <= max_abs_lat is
+        in an adjacent cell. The longitude reach is exact: arcsin(sin(d / R) / cos(lat)).
+        """
+        if max_abs_lat > MAX_ABS_LAT:
+            raise Exception(f'Parâmetro latitude [inválido]: |lat| = {max_abs_lat:.2f}° acima de {MAX_ABS_LAT}°')
+
+        lat_rings = max_km / self.cell_height_km()
+        reach = min(1.0, np.sin(max_km / EARTH_RADIUS_KM) / np.cos(np.radians(max_abs_lat)))
+        lon_rings = np.degrees(np.arcsin(reach)) / (360.0 / (1 << self.lon_bits))
+        return max(1, int(np.ceil(max(lat_rings, lon_rings))))
+
+    def cell_keys(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        lat_int, lon_int, _, _ = geohash_grid(np.nan_to_num(lat), np.nan_to_num(lon), self.precision)
+        keys = (lat_int << self.lon_bits) | lon_int
+        keys[np.isnan(lat) | np.isnan(lon)] = -1
+        return keys
+
+    def neighbour_keys(self, keys, rings=1):
+        """
+        (len(keys), (2 * rings + 1) ** 2) array with the keys of the cells around each key (itself
+        included). Longitude wraps around the antimeridian; rows beyond the poles get -1.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        lat_int = (keys >> self.lon_bits)[:, None]
+        lon_int = (keys & ((1 << self.lon_bits) - 1))[:, None]
+
+        offsets = np.arange(-rings, rings + 1)
+        d_lat, d_lon = (a.ravel()[None, :] for a in np.meshgrid(offsets, offsets, indexing='ij'))
+        n_lat = lat_int + d_lat
+        n_lon = (lon_int + d_lon) % (1 << self.lon_bits)
+
+        neighbours = (n_lat << self.lon_bits) | n_lon
+        neighbours[(n_lat < 0) | (n_lat >= (1 << self.lat_bits)) | (keys[:, None] < 0)] = -1
+        return neighbours
+
+
+def valid_coordinates(lat, lon):
+    """
+    Mask of the points a CellIndex can join: finite, not the 0/0 "missing location" of the extracts and
+    with |lat| <= MAX_ABS_LAT.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return (np.isfinite(lat) & np.isfinite(lon) & ~((lat == 0) & (lon == 0))
+                & (np.abs(lat) <= MAX_ABS_LAT) & (np.abs(lon) <= 180))
+
+
+def assign_cells(df, precision=6, lat_col='latitude', lon_col='longitude'):
+    """
+    Adds the geohash string and int cell key columns (geohash, geo_cell) of every row of df.
+    """
+    lat = pd.to_numeric(df[lat_col], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+    lon = pd.to_numeric(df[lon_col], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+    # The extracts use 0/0 for a missing location (see trn.sql)
+    missing = np.isnan(lat) | np.isnan(lon) | ((lat == 0) & (lon == 0))
+    lat[missing] = np.nan
+    lon[missing] = np.nan
+
+    geohashes = encode_geohash(np.nan_to_num(lat), np.nan_to_num(lon), precision).astype(object)
+    geohashes[missing] = None
+    df[GEOHASH_COLUMN] = geohashes
+    df[CELL_COLUMN] = GeoGrid(precision).cell_keys(lat, lon)
+    return df
+
+
+class CellIndex:
+    """
+    Reference points (e.g. credenciados) bucketed by geohash cell: coordinates sorted by cell key plus
+    the distinct keys with their start/count, persisted as Parquet.
+
+    Distance joins expand each query point into its neighbour cells and look them up with one
+    searchsorted, so only points in adjacent cells are ever compared; the number of rings is derived
+    from max_km and the largest |lat| of the query and reference points, so no pair within max_km is missed.
+    Points outside valid_coordinates (missing, 0/0 or beyond MAX_ABS_LAT) never match.
+    """
+
+    def __init__(self, ids, lat, lon, precision=6):
+        self.grid = GeoGrid(precision)
+
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        keys = self.grid.cell_keys(lat, lon)
+        valid = (keys >= 0) & valid_coordinates(lat, lon)
+        order = np.argsort(keys[valid], kind='stable')
+
+        self.ids = np.asarray(ids)[valid][order]
+        self.lat = lat[valid][order]
+        self.lon = lon[valid][order]
+        self.keys = keys[valid][order]
+        self.cells, self.starts, self.counts = np.unique(self.keys, return_index=True, return_counts=True)
+        self.max_abs_lat = float(np.abs(self.lat).max()) if len(self.lat) else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_frame(cls, df, id_column, precision=6, lat_col='latitude', lon_col='longitude'):
+        coords = df[[id_column, lat_col, lon_col]].copy()
+        coords[lat_col] = pd.to_numeric(coords[lat_col], errors='coerce')
+        coords[lon_col] = pd.to_numeric(coords[lon_col], errors='coerce')
+        coords = coords.dropna()
+        coords = coords[(coords[lat_col] != 0) | (coords[lon_col] != 0)]
+        return cls(coords[id_column].to_numpy(), coords[lat_col].to_numpy(), coords[lon_col].to_numpy(),
+                   precision=precision)
+
+    def candidate_pairs(self, lat, lon, max_km, batch_size=200000):
+        """
+        All (query position, reference position, distance km) with distance <= max_km, as three
+        arrays. Reference positions index self.ids / self.lat / self.lon. Invalid query points (see
+        valid_coordinates) get no pairs instead of failing the whole join.
+        """
+        valid = valid_coordinates(lat, lon)
+        lat = np.where(valid, np.asarray(lat, dtype=np.float64), np.nan)
+        lon = np.where(valid, np.asarray(lon, dtype=np.float64), np.nan)
+        max_abs_lat = max(self.max_abs_lat, float(np.abs(lat[valid]).max()) if valid.any() else 0.0)
+        rings = self.grid.rings_for_radius(max_km, max_abs_lat)
+
+        query_parts, ref_parts, dist_parts = [], [], []
+        for start in range(0, len(lat), batch_size):
+            stop = min(start + batch_size, len(lat))
+            neighbours = self.grid.neighbour_keys(self.grid.cell_keys(lat[start:stop], lon[start:stop]), rings)
+
+            # Merge of neighbour keys against the distinct reference cells
+            flat = neighbours.ravel()
+            position = np.clip(np.searchsorted(self.cells, flat), 0, max(len(self.cells) - 1, 0))
+            hit = (flat >= 0) & (self.cells[position] == flat) if len(self.cells) else np.zeros(len(flat), dtype=bool)
+            query_pos = np.repeat(np.arange(start, stop), neighbours.shape[1])[hit]
+            cell_pos = position[hit]
+
+            # Every reference point of each hit cell: starts[cell] .. starts[cell] + counts[cell]
+            counts = self.counts[cell_pos]
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            ref_pos = np.repeat(self.starts[cell_pos], counts) + (np.arange(total) - first)
+            query_pos = np.repeat(query_pos, counts)
+
+            dist = haversine_km(lat[query_pos], lon[query_pos], self.lat[ref_pos], self.lon[ref_pos])
+            within = dist <= max_km
+            query_parts.append(query_pos[within])
+            ref_parts.append(ref_pos[within])
+            dist_parts.append(dist[within])
+
+        if not query_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(query_parts), np.concatenate(ref_parts), np.concatenate(dist_parts)
+
+    def nearest(self, lat, lon, max_km):
+        """
+        Closest reference point within max_km of every query point. Returns (distances_km, ids),
+        aligned with the query; NaN / None where nothing is within max_km or the point is invalid.
+        """
+        n = len(lat)
+        query_pos, ref_pos, dist = self.candidate_pairs(lat, lon, max_km)
+
+        distances = np.full(n, np.nan)
+        ids = np.full(n, None, dtype=object)
+        if len(dist):
+            # Sorted by (query, distance): the first pair of each query is its nearest
+            order = np.lexsort((dist, query_pos))
+            query_pos, ref_pos, dist = query_pos[order], ref_pos[order], dist[order]
+            first = np.r_[True, query_pos[1:] != query_pos[:-1]]
+            distances[query_pos[first]] = dist[first]
+            ids[query_pos[first]] = self.ids[ref_pos[first]]
+        return distances, ids
+
+    def save(self, path, metadata=None):
+        """Writes the index as Parquet (rows already in cell order); metadata is kept in the schema."""
+        table = pa.table({'id': self.ids, 'latitude': self.lat, 'longitude': self.lon, CELL_COLUMN: self.keys})
+        info = {'precision': self.grid.precision, **(metadata or {})}
+        table = table.replace_schema_metadata({'cell_index': json.dumps(info, default=str)})
+
+        temp_path = path + '.tmp'
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        table = pq.read_table(path)
+        info = cls.read_metadata(path)
+        return cls(table.column('id').to_numpy(zero_copy_only=False), table.column('latitude').to_numpy(),
+                   table.column('longitude').to_numpy(), precision=info['precision'])
+
+    @staticmethod
+    def read_metadata(path):
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata.get(b'cell_index', b'{}'))
+
+    @classmethod
+    def load_or_build(cls, path, df, id_column, precision=6, lat_col='latitude', lon_col='longitude'):
+        """
+        Loads the persisted index when it was built from the same points at the same precision,
+        otherwise builds it from df and saves it.
+        """
+        source_hash = str(pd.util.hash_pandas_object(df[[id_column, lat_col, lon_col]], index=False).sum())
+        if os.path.exists(path):
+            info = cls.read_metadata(path)
+            if info.get('precision') == precision and info.get('source_hash') == source_hash:
+                return cls.load(path)
+
+        index = cls.from_frame(df, id_column, precision, lat_col, lon_col)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        index.save(path, {'source_hash': source_hash, 'id_column': id_column})
+        return index
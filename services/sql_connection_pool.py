@@ -0,0 +1,150 @@
+from azure.identity import AzureCliCredential
+import struct
+from itertools import chain, repeat
+import threading
+import time
+
+SQL_COPT_SS_ACCESS_TOKEN = 1256
+SQL_TOKEN_SCOPE = "https://database.windows.net/.default"
+
+
+class AccessTokenCache:
+    """
+    Process-wide cache of the AAD access token used by Fabric Lakehouse connections.
+    The token is only requested again when it is within refresh_margin seconds of expiring.
+    """
+
+    def __init__(self, refresh_margin=300):
+        self.refresh_margin = refresh_margin
+        self._credential = None
+        self._token = None
+        self._attrs_before = None
+        self._lock = threading.Lock()
+
+    def get_attrs_before(self, scope=SQL_TOKEN_SCOPE):
+        """Returns the pyodbc attrs_before dict with the packed access token."""
+        with self._lock:
+            if self._token is None or time.time() >= self._token.expires_on - self.refresh_margin:
+                if self._credential is None:
+                    self._credential = AzureCliCredential()
+                self._token = self._credential.get_token(scope)
+
+                token_as_bytes = bytes(self._token.token, "UTF-8")
+                encoded_bytes = bytes(chain.from_iterable(zip(token_as_bytes, repeat(0))))
+                token_bytes = struct.pack("<i", len(encoded_bytes)) + encoded_bytes
+                self._attrs_before = {SQL_COPT_SS_ACCESS_TOKEN: token_bytes}
+
+            return self._attrs_before
+
+
+class SqlConnectionPool:
+    """
+    Pool of pyodbc connections for one (connection_type, host, database, user, credential fingerprint) key.
+    Idle connections are health-checked on checkout; new connections are opened with
+    exponential backoff. Connections released beyond max_size are closed.
+    """
+
+    def __init__(self, connect_fn, max_size=5, health_check_query="SELECT 1",
+                 max_attempts=5, base_delay=1.0, max_delay=30.0):
+        self.connect_fn = connect_fn
+        self.max_size = max_size
+        self.health_check_query = health_check_query
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                return self.connect_with_backoff()
+
+            if self.is_healthy(conn):
+                return conn
+
+            self.discard(conn)
+
+    def release(self, conn):
+        if conn is None:
+            return
+
+        try:
+            # Leave no open transaction behind for the next user
+            conn.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+
+        self.discard(conn)
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self.discard(conn)
+
+    def is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def connect_with_backoff(self):
+        exception = None
+        for attempt in range(self.max_attempts):
+            try:
+                return self.connect_fn()
+            except Exception as e:
+                exception = e
+                if attempt == self.max_attempts - 1:
+                    break
+                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+                print(f"Error connecting to SQL: {e}, retry attempt {attempt + 1} of {self.max_attempts} in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+        raise Exception(f"Could not connect after {self.max_attempts} attempts: {exception}")
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_token_cache = AccessTokenCache()
+
+
+def get_connection_pool(key, connect_fn, **kwargs):
+    """Returns the process-wide pool for key, creating it on first use."""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SqlConnectionPool(connect_fn, **kwargs)
+        return _pools[key]
+
+
+def get_access_token_cache():
+    return _token_cache
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
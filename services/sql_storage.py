@@ -1,14 +1,15 @@
 
-from azure.identity import AzureCliCredential
 from enum import Enum
-import struct
-from itertools import chain, repeat
 import pyodbc
 import pandas as pd
 import os, datetime, re
+import decimal
+import hashlib
 import time
+import uuid
 import warnings
 from dotenv import load_dotenv
+from services.sql_connection_pool import get_access_token_cache, get_connection_pool
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +17,13 @@ load_dotenv()
 # Ignore the specific UserWarning from pandas
 warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
 
+# Low-cardinality text columns converted to categoricals when streaming query results
+DEFAULT_CATEGORICAL_COLUMNS = ['status', 'nome_serv', 'cidade']
+
+# SQL Server integer types by the precision pyodbc reports in cursor.description
+# (NOT NULL dtype, nullable dtype)
+SQL_INTEGER_DTYPES = {3: ('uint8', 'UInt8'), 5: ('int16', 'Int16'), 10: ('int32', 'Int32'), 19: ('int64', 'Int64')}
+
 class ConnectionType(Enum):
     SQL_SERVER = "sql_server"
     FABRIC_LAKEHOUSE = "fabric_lakehouse"
@@ -26,7 +34,8 @@ class SqlStorage:
                  port=None, 
                  database=None, 
                  username=None, 
-                 password=None):
+                 password=None,
+                 pooled=False):
         
         self.connection_type = connection_type
         self.host = host
@@ -36,19 +45,17 @@ class SqlStorage:
         self.password = password
         self.odbc_driver_version = os.getenv("ODBC_DRIVER_VERSION", "18") 
         self.conn = None  
+        self.pooled = pooled  # Check connections out of the process-wide pool instead of opening new ones
+        self.pool = None
         
         if self.host is None or self.database is None:
             raise ValueError(f"Host and database must be provided for database connection {e}")
 
         try: 
             if connection_type == ConnectionType.FABRIC_LAKEHOUSE:
-                # Initialize for Azure Fabric Lakehouse with token-based authentication
-                self.credential = AzureCliCredential()
-                token_object = self.credential.get_token("https://database.windows.net/.default")
-                token_as_bytes = bytes(token_object.token, "UTF-8")
-                encoded_bytes = bytes(chain.from_iterable(zip(token_as_bytes, repeat(0))))
-                token_bytes = struct.pack("<i", len(encoded_bytes)) + encoded_bytes
-                self.attrs_before = {1256: token_bytes}  # SQL_COPT_SS_ACCESS_TOKEN attribute
+                # Initialize for Azure Fabric Lakehouse with token-based authentication; the token
+                # is set by open_connection() from the process-wide cache (refreshed before it expires)
+                self.attrs_before = None
                 
                 self.connection_string = (
                     f"Driver={{ODBC Driver {self.odbc_driver_version} for SQL Server}};"
@@ -84,24 +91,40 @@ class SqlStorage:
             
         self.connect()
 
+    def pool_key(self):
+        # The connection string carries the auth mode and password: storages with different credentials never share connections
+        credential_fingerprint = hashlib.sha256(self.connection_string.encode('utf-8')).hexdigest()
+        return (self.connection_type, self.host, self.database, self.username, credential_fingerprint)
+
     def connect(self):
         try:
-            if self.connection_type == ConnectionType.FABRIC_LAKEHOUSE:
-                self.conn = pyodbc.connect(
-                    self.connection_string,
-                    attrs_before=self.attrs_before
-                )
-                print("Connection successful to Lakehouse")
-
-            elif self.connection_type == ConnectionType.SQL_SERVER:
-                self.conn = pyodbc.connect(self.connection_string)
-                print("Connection successful to MSSQL")
+            if self.pooled:
+                self.pool = get_connection_pool(self.pool_key(), self.open_connection)
+                self.conn = self.pool.checkout()
+            else:
+                self.conn = self.open_connection()
                 
         except Exception as e:
             msg = f"Error occurred during connection: {str(e)}" 
             print(msg)
             raise Exception(msg)
 
+    def open_connection(self):
+        if self.connection_type == ConnectionType.FABRIC_LAKEHOUSE:
+            # Fetch attrs_before on every physical connection so an expired token is never reused
+            self.attrs_before = get_access_token_cache().get_attrs_before()
+            conn = pyodbc.connect(
+                self.connection_string,
+                attrs_before=self.attrs_before
+            )
+            print("Connection successful to Lakehouse")
+            return conn
+
+        elif self.connection_type == ConnectionType.SQL_SERVER:
+            conn = pyodbc.connect(self.connection_string)
+            print("Connection successful to MSSQL")
+            return conn
+
     def sanitize_table_name(self, table_name: str) -> str:
         """
         Replaces invalid SQL Server characters in a table name with "_".
@@ -139,6 +162,111 @@ class SqlStorage:
             print(msg)
             raise Exception(msg)
 
+    def iter_query(self, query, chunk_size=50000, categorical_cols=DEFAULT_CATEGORICAL_COLUMNS, downcast_numerics=True):
+        """
+        Execute a SQL query and yield the result as DataFrames of up to chunk_size rows.
+        Rows are pulled with cursor.fetchmany, so peak memory is bounded by the chunk size
+        instead of the result size. Column dtypes are decided once from the cursor metadata and
+        applied to every chunk (see plan_chunk_dtypes), so the chunks can be concatenated with
+        concat_chunks without upcasting.
+        """
+        if self.conn is None:
+            self.connect()
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.arraysize = chunk_size
+            cursor.execute(query)
+            columns = [column[0] for column in cursor.description]
+            dtypes = self.plan_chunk_dtypes(cursor.description, categorical_cols, downcast_numerics)
+            categories = {}
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                df = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+                yield self.apply_chunk_dtypes(df, dtypes, categories)
+
+        except Exception as e:
+            msg = f"Error executing query: {e}"
+            print(msg)
+            raise Exception(msg)
+        finally:
+            cursor.close()
+
+    def plan_chunk_dtypes(self, description, categorical_cols=DEFAULT_CATEGORICAL_COLUMNS, downcast_numerics=True):
+        """
+        Target dtype per column position, from cursor.description: decimal (money/numeric) -> float64,
+        as pd.read_sql does; listed columns -> 'category'; integers -> the width of the SQL type
+        (tinyint/smallint/int/bigint by precision), nullable Int when the column allows NULL.
+        None keeps the dtype pandas infers (e.g. sqlite3, which reports no type metadata).
+        """
+        categorical_cols = set(categorical_cols or [])
+        dtypes = []
+        for column in description:
+            name, type_code, precision, null_ok = column[0], column[1], column[4], column[6]
+            if name in categorical_cols:
+                dtypes.append('category')
+            elif type_code is decimal.Decimal:
+                dtypes.append('float64')
+            elif type_code is int and downcast_numerics and precision in SQL_INTEGER_DTYPES:
+                not_null_dtype, nullable_dtype = SQL_INTEGER_DTYPES[precision]
+                dtypes.append(not_null_dtype if null_ok is False else nullable_dtype)
+            else:
+                dtypes.append(None)
+        return dtypes
+
+    def apply_chunk_dtypes(self, df, dtypes, categories):
+        """
+        Applies the dtypes of plan_chunk_dtypes to one chunk. Columns are handled by position because
+        queries like "t.*, cr.*" repeat column names. categories holds the categories seen so far per
+        column and only grows, so every chunk's categories extend the previous chunks' ones.
+        """
+        for i, dtype in enumerate(dtypes):
+            if dtype is None:
+                continue
+            series = df.iloc[:, i]
+
+            if dtype == 'category':
+                known = categories.setdefault(i, [])
+                seen = set(known)
+                known.extend(v for v in pd.unique(series.dropna()) if v not in seen)
+                series = series.astype(pd.CategoricalDtype(list(known)))
+            elif dtype == 'float64':
+                series = series.astype(float)
+            else:
+                series = series.astype(dtype)
+
+            df.isetitem(i, series)
+
+        return df
+
+    def concat_chunks(self, chunks):
+        """
+        Concatenates iter_query chunks into one DataFrame. Categorical columns are aligned to the last
+        chunk's categories (a superset of the earlier ones), so they stay categorical.
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return pd.DataFrame()
+
+        last = chunks[-1]
+        for chunk in chunks[:-1]:
+            for i in range(chunk.shape[1]):
+                if isinstance(chunk.iloc[:, i].dtype, pd.CategoricalDtype):
+                    chunk.isetitem(i, chunk.iloc[:, i].cat.set_categories(last.iloc[:, i].cat.categories))
+        return pd.concat(chunks, ignore_index=True)
+
+    def export_query_to_csv(self, query, csv_path, chunk_size=50000, sep=','):
+        """Stream a query result to a CSV file chunk by chunk. Returns the number of rows written."""
+        total_rows = 0
+        with open(csv_path, 'w', encoding='utf-8', newline='') as output:
+            for df in self.iter_query(query, chunk_size=chunk_size):
+                df.to_csv(output, index=False, header=total_rows == 0, sep=sep)
+                total_rows += len(df)
+        return total_rows
+
     def upload_dataframe_to_table(self, df, table_name):
         
         if self.conn is None:
@@ -171,6 +299,107 @@ class SqlStorage:
             print(msg)
             raise Exception(msg)
 
+    def upload_dataframe_to_table_bulk(self, df, table_name, batch_size=10000, use_staging=True, merge_keys=None):
+        """
+        Bulk version of upload_dataframe_to_table using fast_executemany and batched commits.
+        Parameters are generated chunk by chunk (never the whole frame as a list) with typed input sizes.
+
+        With use_staging the rows are loaded into '<table>_stg' first and then published in one
+        transaction, so readers never see an empty table during the reload:
+          - merge_keys=None: the staging table is swapped in place of the target (sp_rename);
+          - merge_keys=[...]: the staging rows are MERGEd into the existing target on those keys.
+        """
+        if self.conn is None:
+            self.connect()
+
+        table_name = self.sanitize_table_name(table_name)
+        use_staging = use_staging or bool(merge_keys)
+        load_table = f"{table_name}_stg" if use_staging else table_name
+
+        column_definitions = ", ".join([f"{col} {self.map_dtype_to_sql(dtype)}" for col, dtype in df.dtypes.items()])
+        input_sizes = [self.map_dtype_to_input_size(dtype) for dtype in df.dtypes]
+        insert_query = f"INSERT INTO {load_table} VALUES ({', '.join(['?' for _ in df.columns])})"
+
+        try:
+            start_time = time.time()
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {load_table};")
+                cursor.execute(f"CREATE TABLE {load_table} ({column_definitions});")
+            self.conn.commit()
+
+            total_rows = 0
+            with self.conn.cursor() as cursor:
+                cursor.fast_executemany = True
+                for batch in self.iter_parameter_batches(df, batch_size):
+                    cursor.setinputsizes(input_sizes)
+                    cursor.executemany(insert_query, batch)
+                    self.conn.commit()
+                    total_rows += len(batch)
+                    print(f"Uploaded {total_rows} of {len(df)} rows to '{load_table}'")
+
+            if use_staging:
+                if merge_keys:
+                    self.merge_staging_table(load_table, table_name, list(df.columns), merge_keys)
+                else:
+                    self.swap_staging_table(load_table, table_name)
+
+            print(f"Data successfully uploaded to table '{table_name}' in {time.time() - start_time:.2f} seconds")
+
+        except Exception as e:
+            self.conn.rollback()
+            msg = f"Error occurred during bulk upload: {str(e)}"
+            print(msg)
+            raise Exception(msg)
+
+    def iter_parameter_batches(self, df, batch_size=10000):
+        # Convert only one batch at a time to Python values (NaN/NaT -> None)
+        for start in range(0, len(df), batch_size):
+            chunk = df.iloc[start:start + batch_size].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            yield list(chunk.itertuples(index=False, name=None))
+
+    def map_dtype_to_input_size(self, dtype):
+        # Parameter types for cursor.setinputsizes, matching map_dtype_to_sql
+        if pd.api.types.is_integer_dtype(dtype):
+            return (pyodbc.SQL_INTEGER, 0, 0)
+        elif pd.api.types.is_float_dtype(dtype):
+            return (pyodbc.SQL_DOUBLE, 0, 0)
+        elif pd.api.types.is_bool_dtype(dtype):
+            return (pyodbc.SQL_BIT, 0, 0)
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            return (pyodbc.SQL_TYPE_TIMESTAMP, 0, 0)
+        else:
+            return (pyodbc.SQL_WVARCHAR, 255, 0)
+
+    def swap_staging_table(self, staging_table, table_name):
+        # Publish the staging table atomically in place of the target. The previous table is renamed to a
+        # unique backup name, so the only table dropped is the one this call renamed
+        old_table = f"{table_name}_old_{uuid.uuid4().hex[:12]}"
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL EXEC sp_rename '{table_name}', '{old_table}';"
+            )
+            cursor.execute(f"EXEC sp_rename '{staging_table}', '{table_name}';")
+            cursor.execute(f"IF OBJECT_ID('{old_table}', 'U') IS NOT NULL DROP TABLE {old_table};")
+        self.conn.commit()
+
+    def merge_staging_table(self, staging_table, table_name, columns, merge_keys):
+        # Upsert the staging rows into the target; a missing target is simply the staging table renamed
+        on_clause = " AND ".join([f"t.{key} = s.{key}" for key in merge_keys])
+        update_clause = ", ".join([f"t.{col} = s.{col}" for col in columns if col not in merge_keys])
+        insert_columns = ", ".join(columns)
+        insert_values = ", ".join([f"s.{col}" for col in columns])
+
+        merge_query = f"MERGE {table_name} AS t USING {staging_table} AS s ON {on_clause} "
+        if update_clause:
+            merge_query += f"WHEN MATCHED THEN UPDATE SET {update_clause} "
+        merge_query += f"WHEN NOT MATCHED BY TARGET THEN INSERT ({insert_columns}) VALUES ({insert_values});"
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"IF OBJECT_ID('{table_name}', 'U') IS NULL EXEC sp_rename '{staging_table}', '{table_name}';")
+            cursor.execute(f"IF OBJECT_ID('{staging_table}', 'U') IS NOT NULL BEGIN {merge_query} DROP TABLE {staging_table}; END")
+        self.conn.commit()
+
     def upload_csv_to_table(self, csv_path, table_name):
         # Load CSV into DataFrame and call `upload_dataframe_to_table`
         df = pd.read_csv(csv_path)
@@ -178,8 +407,13 @@ class SqlStorage:
 
     def close(self):
         if self.conn:
-            self.conn.close()
-            print('Connection closed')
+            if self.pooled and self.pool is not None:
+                self.pool.release(self.conn)
+                print('Connection returned to pool')
+            else:
+                self.conn.close()
+                print('Connection closed')
+            self.conn = None
 
     def generate_sequential_table_name(self, prefix):
         today_str = datetime.datetime.now().strftime("%d_%m_%Y")
@@ -0,0 +1,19 @@
+import sqlite3
+
+
+class SqliteStorage:
+    """
+    Local stand-in for SqlStorage (same conn/close() surface) backed by sqlite3, used to run the
+    transfer engine and the NF-e ingestion without SQL Server.
+    """
+
+    dialect = 'sqlite'  # SQL Server storages have no dialect attribute
+
+    def __init__(self, path=':memory:'):
+        # Threads of the transfer engine each open their own storage, so the connection is not shared
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
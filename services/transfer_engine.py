@@ -0,0 +1,282 @@
+import datetime
+import decimal
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHECKPOINT_TABLE = 'transfer_checkpoint'
+STAGING_SUFFIX = '_transfer_staging'
+
+
+class TransferEngine:
+    """
+    Source -> target table copy on top of SqlStorage, replacing the bcp queryout/in script.
+
+    Each table is streamed with cursor.fetchmany and written with batched parameter inserts
+    (fast_executemany on pyodbc), several tables run in parallel (max_workers), and progress is
+    checkpointed in the target database (transfer_checkpoint) in the same transaction as every
+    batch, so a failed run resumes after the last committed key without duplicating rows.
+
+    Table spec: {'table': name, 'target_table': name, 'key_column': 'id', 'where': 'SQL filter',
+    'mode': 'append' | 'replace'}. 'replace' loads into <target_table>_transfer_staging (resumable
+    like any other table) and only then replaces the target rows (matching where) with the staged
+    ones in a single transaction, so a failed run leaves the target table untouched.
+    """
+
+    def __init__(self, source_factory, target_factory, job_name='default', batch_size=10000,
+                 max_workers=4, create_missing_tables=False):
+        self.source_factory = source_factory  # () -> SqlStorage-like object (conn, close())
+        self.target_factory = target_factory
+        self.job_name = job_name  # Checkpoints are scoped by job, e.g. the date window being copied
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.create_missing_tables = create_missing_tables
+
+        self.results = []
+
+    def run(self, tables):
+        """Transfers all tables and returns one result dict per table (rows, bytes, seconds, rows/s, MB/s, status)."""
+        tables = [{'table': t} if isinstance(t, str) else t for t in tables]
+        self.ensure_checkpoint_table()
+
+        start_time_main = time.time()
+        print(f'Starting transfer of {len(tables)} tables with {self.max_workers} workers (job {self.job_name})...')
+
+        self.results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.transfer_table, spec): spec['table'] for spec in tables}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'table': futures[future], 'status': 'failed', 'error': str(e)}
+                    print(f"Failed to transfer data for table: {futures[future]}: {e}")
+                self.results.append(result)
+
+        total_rows = sum(r.get('rows', 0) for r in self.results)
+        failed = [r['table'] for r in self.results if r['status'] == 'failed']
+        print(f'Data transfer completed: {total_rows} rows in {time.time() - start_time_main:.2f} seconds'
+              + (f', failed tables: {", ".join(failed)}' if failed else '.'))
+        return self.results
+
+    def transfer_table(self, spec):
+        table = spec['table']
+        target_table = spec.get('target_table', table)
+        key_column = spec.get('key_column', 'id')
+        where = spec.get('where')
+
+        source = self.source_factory()
+        target = self.target_factory()
+        try:
+            checkpoint = self.read_checkpoint(target.conn, table)
+            if checkpoint and checkpoint['status'] == 'done':
+                print(f'Skipping table {table}: already transferred in job {self.job_name}')
+                return {'table': table, 'status': 'skipped', 'rows': checkpoint['rows']}
+
+            last_key = checkpoint['last_key'] if checkpoint else None
+            rows_done = checkpoint['rows'] if checkpoint else 0
+            if checkpoint:
+                print(f'Resuming table {table} after {key_column} = {last_key} ({rows_done} rows already copied)')
+
+            query, params = self.build_source_query(table, key_column, where, last_key)
+            source_cursor = source.conn.cursor()
+            source_cursor.execute(query, params)
+            columns = [column[0] for column in source_cursor.description]
+            if key_column not in columns:
+                raise Exception(f'Parâmetro key_column [inválido]: {key_column} não existe na tabela {table}')
+
+            if self.create_missing_tables:
+                self.ensure_target_table(target, target_table, source_cursor.description)
+
+            replace = spec.get('mode', 'append') == 'replace'
+            load_table = target_table + STAGING_SUFFIX if replace else target_table
+            if replace and checkpoint is None:
+                self.create_staging_table(target, target_table, load_table)
+
+            insert_query = f"INSERT INTO {load_table} ({', '.join(columns)}) VALUES ({', '.join(['?' for _ in columns])})"
+            key_position = columns.index(key_column)
+
+            target_cursor = target.conn.cursor()
+            try:
+                target_cursor.fast_executemany = True
+            except AttributeError:
+                pass  # Not a pyodbc cursor (e.g. sqlite3)
+
+            start_time = time.time()
+            rows = 0
+            total_bytes = 0
+            while True:
+                batch = source_cursor.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                batch = [tuple(row) for row in batch]
+
+                target_cursor.executemany(insert_query, batch)
+                last_key = batch[-1][key_position]
+                rows += len(batch)
+                total_bytes += self.estimate_batch_bytes(batch)
+
+                # Rows and checkpoint are committed together: a crash never loses or repeats a batch
+                self.write_checkpoint(target.conn, table, last_key, rows_done + rows, 'in_progress')
+                target.conn.commit()
+
+            if replace:
+                # Target rows swapped for the staged ones in the same transaction as the 'done' checkpoint
+                with_where = f' WHERE {where}' if where else ''
+                column_list = ', '.join(columns)
+                target_cursor.execute(f'DELETE FROM {target_table}{with_where}')
+                target_cursor.execute(f'INSERT INTO {target_table} ({column_list}) SELECT {column_list} FROM {load_table}')
+            self.write_checkpoint(target.conn, table, last_key, rows_done + rows, 'done')
+            target.conn.commit()
+            source_cursor.close()
+            if replace:
+                target_cursor.execute(f'DROP TABLE {load_table}')
+                target.conn.commit()
+
+            elapsed = time.time() - start_time
+            result = {
+                'table': table,
+                'status': 'done',
+                'rows': rows,
+                'bytes': total_bytes,
+                'seconds': elapsed,
+                'rows_per_second': rows / elapsed if elapsed > 0 else 0.0,
+                'mb_per_second': total_bytes / 1024 ** 2 / elapsed if elapsed > 0 else 0.0
+            }
+            print(f"Successfully transferred data for table: {table}: {rows} rows, {total_bytes / 1024 ** 2:.1f} MB "
+                  f"in {elapsed:.2f} seconds ({result['rows_per_second']:.0f} rows/s, {result['mb_per_second']:.2f} MB/s)")
+            return result
+
+        except Exception:
+            target.conn.rollback()
+            raise
+        finally:
+            source.close()
+            target.close()
+
+    def build_source_query(self, table, key_column, where, last_key):
+        # Keyset pagination on key_column: ordered scan that can restart after the last committed key
+        conditions = [f'({where})'] if where else []
+        params = []
+        if last_key is not None:
+            conditions.append(f'{key_column} > ?')
+            params.append(last_key)
+
+        query = f'SELECT * FROM {table}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += f' ORDER BY {key_column}'
+        return query, params
+
+    def estimate_batch_bytes(self, batch):
+        # Payload size estimated from a sample of the batch (text/binary length, 8 bytes for other values)
+        sample = batch[:100]
+        sample_bytes = 0
+        for row in sample:
+            for value in row:
+                if isinstance(value, (str, bytes, bytearray)):
+                    sample_bytes += len(value)
+                elif value is not None:
+                    sample_bytes += 8
+        return int(sample_bytes * len(batch) / len(sample))
+
+    def ensure_checkpoint_table(self):
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            try:
+                cursor.execute(f'SELECT 1 FROM {CHECKPOINT_TABLE} WHERE 1 = 0')
+            except Exception:
+                target.conn.rollback()
+                cursor.execute(
+                    f'CREATE TABLE {CHECKPOINT_TABLE} (job_name NVARCHAR(255), table_name NVARCHAR(255), '
+                    f'last_key NVARCHAR(255), key_type NVARCHAR(16), rows_copied BIGINT, status NVARCHAR(32), updated_at NVARCHAR(32))'
+                )
+            target.conn.commit()
+        finally:
+            target.close()
+
+    def read_checkpoint(self, conn, table):
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT last_key, key_type, rows_copied, status FROM {CHECKPOINT_TABLE} '
+                       f'WHERE job_name = ? AND table_name = ?', [self.job_name, table])
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return None
+
+        last_key, key_type, rows_copied, status = row
+        if last_key is not None and key_type == 'int':
+            last_key = int(last_key)
+        return {'last_key': last_key, 'rows': int(rows_copied or 0), 'status': status}
+
+    def write_checkpoint(self, conn, table, last_key, rows, status):
+        key_type = 'int' if isinstance(last_key, int) else 'str'
+        if isinstance(last_key, datetime.datetime):
+            last_key = last_key.isoformat(sep=' ')
+        values = [None if last_key is None else str(last_key), key_type, rows, status,
+                  datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
+
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE {CHECKPOINT_TABLE} SET last_key = ?, key_type = ?, rows_copied = ?, status = ?, updated_at = ? '
+                       f'WHERE job_name = ? AND table_name = ?', values + [self.job_name, table])
+        if cursor.rowcount == 0:
+            cursor.execute(f'INSERT INTO {CHECKPOINT_TABLE} (last_key, key_type, rows_copied, status, updated_at, job_name, table_name) '
+                           f'VALUES (?, ?, ?, ?, ?, ?, ?)', values + [self.job_name, table])
+
+    def reset_checkpoints(self, tables=None):
+        """Forgets the progress of this job (all tables or the given ones)."""
+        target = self.target_factory()
+        try:
+            cursor = target.conn.cursor()
+            if tables is None:
+                cursor.execute(f'DELETE FROM {CHECKPOINT_TABLE} WHERE job_name = ?', [self.job_name])
+            else:
+                for table in tables:
+                    cursor.execute(f'DELETE FROM {CHECKPOINT_TABLE} WHERE job_name = ? AND table_name = ?', [self.job_name, table])
+            target.conn.commit()
+        finally:
+            target.close()
+
+    def ensure_target_table(self, storage, table, description):
+        cursor = storage.conn.cursor()
+        try:
+            cursor.execute(f'SELECT 1 FROM {table} WHERE 1 = 0')
+            return
+        except Exception:
+            storage.conn.rollback()
+
+        column_definitions = ', '.join(f'{column[0]} {self.map_type_code_to_sql(column[1])}' for column in description)
+        if self.is_sqlite(storage):
+            column_definitions = column_definitions.replace('(MAX)', '')
+        cursor.execute(f'CREATE TABLE {table} ({column_definitions})')
+        storage.conn.commit()
+
+    def create_staging_table(self, storage, table, staging_table):
+        # Empty copy of the target table's columns; leftovers of an abandoned run are dropped first
+        cursor = storage.conn.cursor()
+        if self.is_sqlite(storage):
+            cursor.execute(f'DROP TABLE IF EXISTS {staging_table}')
+            cursor.execute(f'CREATE TABLE {staging_table} AS SELECT * FROM {table} WHERE 1 = 0')
+        else:
+            cursor.execute(f"IF OBJECT_ID('{staging_table}', 'U') IS NOT NULL DROP TABLE {staging_table}")
+            cursor.execute(f'SELECT * INTO {staging_table} FROM {table} WHERE 1 = 0')
+        storage.conn.commit()
+
+    def is_sqlite(self, storage):
+        return getattr(storage, 'dialect', None) == 'sqlite'
+
+    def map_type_code_to_sql(self, type_code):
+        # cursor.description type codes are Python types on pyodbc (None on sqlite3)
+        if type_code is bool:
+            return 'BIT'
+        if type_code is int:
+            return 'BIGINT'
+        if type_code is float:
+            return 'FLOAT'
+        if type_code is decimal.Decimal:
+            return 'DECIMAL(38, 10)'
+        if type_code in (datetime.datetime, datetime.date):
+            return 'DATETIME2'
+        if type_code in (bytes, bytearray):
+            return 'VARBINARY(MAX)'
+        return 'NVARCHAR(MAX)'
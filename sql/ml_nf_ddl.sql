@@ -6,6 +6,11 @@ create table rec_ml_chave_busca_cred
 alter table rec_ml_chave_busca_cred add constraint  pk_rec_ml_chave_busca_cred primary key (codigo_captura, nome_abrev)
 go
 
+create table rec_ml_token_autorizacao
+(cnpj varchar(20) not null primary key,
+ token_autorizacao varchar(255) not null)
+go
+
 create table rec_ml_nota_fiscal 
 (id bigint not null primary key,
  chave_nf varchar(100) not null,
@@ -32,4 +37,13 @@ create table rec_ml_transacao_nf
  nota_fiscal_ml_id bigint not null)
 go
  alter table rec_ml_transacao_nf add constraint  pk_transacao_nf_ml primary key (transacao_id, nota_fiscal_ml_id)
- go
\ No newline at end of file
+ go
+create table rec_ml_ingestao_checkpoint
+(cnpj varchar(20) not null,
+ data_inicio varchar(10) not null,
+ data_fim varchar(10) not null,
+ notas int,
+ updated_at varchar(19))
+go
+alter table rec_ml_ingestao_checkpoint add constraint  pk_rec_ml_ingestao_checkpoint primary key (cnpj, data_inicio, data_fim)
+go
@@ -265,4 +265,5 @@ select top {sample_size} *
 from trn t
 where t.anofabricacaocorreto = 1 and t.anomodelocorreto = 1
 and anofabricacao > 1900 and anomodelo > 1900 and idade_equipamento > -1
+{partition_filter}
 order by data desc 
\ No newline at end of file
@@ -17,6 +17,7 @@ INNER JOIN servico s (NOLOCK) ON s.id = t.servico_id
 -- Filters
 WHERE 1 = 1
   AND t.versao_aplicativo = 'mobile'
+  {partition_filter}
 -- Optional filter for a specific credenciado_id
 -- AND t.credenciado_id = 73557
 ORDER BY t.data_hora_transacao_inicio DESC;
\ No newline at end of file
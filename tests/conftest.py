@@ -0,0 +1,4 @@
+import os, sys
+
+# Root scripts (api.py, populator.py, ...) and the services package are imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
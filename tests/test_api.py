@@ -0,0 +1,198 @@
+import asyncio
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from api import AsyncRateLimiter, AsyncTokenCache, SerproAsyncClient
+
+
+class MockSerpro:
+    """Local SERPRO stand-in: /token issues tok1, tok2, ...; /nf/{cnpj} behaves per CNPJ."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.token_calls = 0
+        self.requests = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.times = []
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/token', self.token)
+        app.router.add_get('/nf/{cnpj}', self.nf)
+        return app
+
+    async def token(self, request):
+        self.token_calls += 1
+        return web.json_response({'access_token': f'tok{self.token_calls}', 'expires_in': 3600})
+
+    async def nf(self, request):
+        cnpj = request.match_info['cnpj']
+        attempt = self.requests[cnpj] = self.requests.get(cnpj, 0) + 1
+        self.times.append(time.monotonic())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if cnpj == '503' and attempt <= 2:
+                return web.Response(status=503, text='Service Unavailable')
+            if cnpj == '429' and attempt == 1:
+                return web.Response(status=429, text='Too Many Requests', headers={'Retry-After': '0.2'})
+            if cnpj == '401' and request.headers['Authorization'] == 'Bearer tok1':
+                return web.Response(status=401, text='Invalid Credentials')
+            if cnpj == '500':
+                return web.Response(status=500, text='Internal Server Error')
+            if cnpj == '400':
+                return web.Response(status=400, text='Bad Request')
+            return web.json_response({'cnpj': cnpj, 'token': request.query.get('token')})
+        finally:
+            self.in_flight -= 1
+
+
+async def with_client(mock, test, **client_kwargs):
+    server = TestServer(mock.app())
+    await server.start_server()
+    try:
+        base_url = f'http://{server.host}:{server.port}'
+        kwargs = dict(consumer_key='key', consumer_secret='secret', token_url=f'{base_url}/token',
+                      nf_url=base_url + '/nf/{cnpj}?token={tokenAutorizacao}',
+                      token_file=None, use_cache=False, base_delay=0.01, max_delay=1.0)
+        kwargs.update(client_kwargs)
+        async with SerproAsyncClient(**kwargs) as client:
+            return await test(client)
+    finally:
+        await server.close()
+
+
+def test_retries_5xx_with_backoff():
+    mock = MockSerpro()
+    delays = []
+
+    async def test(client):
+        retry_delay = client._retry_delay
+        client._retry_delay = lambda attempt, retry_after=None: delays.append((attempt, retry_after)) or retry_delay(attempt, retry_after)
+        return await client.consultar_nfs_por_cnpj('auth', '503')
+
+    result = asyncio.run(with_client(mock, test))
+
+    assert result == {'cnpj': '503', 'token': 'auth'}
+    assert mock.requests['503'] == 3
+    assert [attempt for attempt, _ in delays] == [0, 1]
+
+
+def test_backoff_delay_is_bounded_and_honours_retry_after():
+    client = SerproAsyncClient(consumer_key='key', consumer_secret='secret', nf_url='http://x', token_file=None,
+                               use_cache=False, base_delay=0.5, max_delay=4.0)
+    for attempt in range(6):
+        assert 0 <= client._retry_delay(attempt) <= min(4.0, 0.5 * 2 ** attempt)
+    assert client._retry_delay(0, '2') == 2.0
+    assert client._retry_delay(0, '120') == 4.0
+
+
+def test_429_waits_for_retry_after():
+    mock = MockSerpro()
+
+    async def test(client):
+        start = time.monotonic()
+        result = await client.consultar_nfs_por_cnpj('auth', '429')
+        return result, time.monotonic() - start, client.stats
+
+    result, elapsed, stats = asyncio.run(with_client(mock, test))
+
+    assert result['cnpj'] == '429'
+    assert mock.requests['429'] == 2
+    assert elapsed >= 0.2
+    assert stats['retries'] == 1
+
+
+def test_gives_up_after_max_attempts():
+    mock = MockSerpro()
+
+    async def test(client):
+        return await client.consultar_nfs_por_cnpjs([{'tokenAutorizacao': 'auth', 'cnpj': '500'},
+                                                     {'tokenAutorizacao': 'auth', 'cnpj': '400'}])
+
+    results = asyncio.run(with_client(mock, test, max_attempts=3))
+
+    assert isinstance(results['500'], Exception) and mock.requests['500'] == 3
+    # Other 4xx are not retried
+    assert isinstance(results['400'], Exception) and mock.requests['400'] == 1
+
+
+def test_401_refreshes_token_once_for_all_requests():
+    mock = MockSerpro()
+
+    async def test(client):
+        await client.tokens.get_token()  # tok1, rejected by the server
+        clientes = [{'tokenAutorizacao': 'auth', 'cnpj': '401'} for _ in range(5)]
+        results = await asyncio.gather(*(client.consultar_nfs_por_cnpj(c['tokenAutorizacao'], c['cnpj']) for c in clientes))
+        return results, client.tokens.refresh_count
+
+    results, refresh_count = asyncio.run(with_client(mock, test))
+
+    assert all(r['cnpj'] == '401' for r in results)
+    # Concurrent 401s share one renewal instead of a token stampede
+    assert mock.token_calls == 2
+    assert refresh_count == 2
+
+
+def test_semaphore_limits_concurrency():
+    mock = MockSerpro(delay=0.05)
+
+    async def test(client):
+        clientes = [{'tokenAutorizacao': 'auth', 'cnpj': str(i)} for i in range(20)]
+        return await client.consultar_nfs_por_cnpjs(clientes)
+
+    results = asyncio.run(with_client(mock, test, max_concurrency=3, rate_per_second=1000))
+
+    assert len(results) == 20 and all(isinstance(r, dict) for r in results.values())
+    assert mock.max_in_flight == 3
+
+
+def test_rate_limiter_holds_under_concurrency():
+    mock = MockSerpro()
+    rate = 20
+
+    async def test(client):
+        clientes = [{'tokenAutorizacao': 'auth', 'cnpj': str(i)} for i in range(50)]
+        start = time.monotonic()
+        await client.consultar_nfs_por_cnpjs(clientes)
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(with_client(mock, test, max_concurrency=50, rate_per_second=rate))
+
+    # A burst of `rate`, then `rate` per second: 50 requests need at least (50 - 20) / 20 = 1.5 s
+    assert elapsed >= (50 - rate) / rate * 0.95
+    # No 1-second window holds more than burst + rate requests
+    times = sorted(mock.times)
+    assert max(sum(1 for t in times if t0 <= t < t0 + 1.0) for t0 in times) <= 2 * rate
+
+
+def test_async_rate_limiter_spacing():
+    async def acquire_all():
+        limiter = AsyncRateLimiter(rate=50, burst=1)
+        stamps = []
+        await asyncio.gather(*(limiter.acquire() for _ in range(11)))
+        for _ in range(5):
+            await limiter.acquire()
+            stamps.append(time.monotonic())
+        return stamps
+
+    stamps = asyncio.run(acquire_all())
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert min(gaps) >= 0.018
+
+
+def test_token_cache_refreshes_before_expiry():
+    calls = []
+
+    async def fetch_token():
+        calls.append(1)
+        return {'access_token': f'tok{len(calls)}', 'expires_in': 30}
+
+    async def get_twice():
+        cache = AsyncTokenCache(fetch_token, refresh_margin=60, token_file=None)
+        return await cache.get_token(), await cache.get_token()
+
+    # expires_in below refresh_margin: every call renews
+    assert asyncio.run(get_twice()) == ('tok1', 'tok2')
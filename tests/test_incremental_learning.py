@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from analysis_generators._incremental_learning import IncrementalLearning
+
+MODELS = ['sgd_classifier', 'perceptron', 'multinomial_nb']
+
+
+def make_frame(n=3000, seed=0):
+    # tipo follows modelo, and custo_km separates the two tipos: learnable from either feature set
+    rng = np.random.default_rng(seed)
+    modelo = rng.choice(['m1', 'm2', 'm3', 'm4'], n)
+    tipo = np.where(np.isin(modelo, ['m1', 'm2']), 'leve', 'pesado')
+    return pd.DataFrame({
+        'modelo': modelo,
+        'cidade': rng.choice(['SP', 'RJ', 'BH'], n),
+        'custo_km': np.where(tipo == 'leve', 0.5, 2.0) + rng.normal(0, 0.1, n),
+        'tipoequipamento': tipo,
+    })
+
+
+def chunks(df, size):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+
+def test_fit_records_progressive_metrics_per_chunk(tmp_path):
+    df = make_frame()
+    path = str(tmp_path / 'custo_km.csv')
+    df.to_csv(path, index=False)
+    learner = IncrementalLearning(categorical_cols=['modelo', 'cidade'], numerical_cols=['custo_km'],
+                                  target_col='tipoequipamento', n_features=2 ** 10, chunk_size=500)
+
+    learner.fit(path)
+    metrics = learner.metrics_frame()
+
+    assert list(learner.classes) == ['leve', 'pesado']
+    assert metrics['chunk'].tolist() == list(range(6))
+    assert metrics['rows'].sum() == len(df)
+    # The first chunk is only learned from; every later chunk is scored before the models see it
+    assert metrics.loc[0, [f'{m}_accuracy' for m in MODELS]].isna().all()
+    for model in MODELS:
+        assert (metrics.loc[1:, f'{model}_accuracy'] > 0.95).all()
+
+    predictions = pd.concat(learner.predict(path))
+    assert (predictions['sgd_classifier_pred'] == df['tipoequipamento']).mean() > 0.95
+
+
+def test_fit_without_categorical_columns():
+    df = make_frame()
+    learner = IncrementalLearning(numerical_cols=['custo_km'], target_col='tipoequipamento', n_features=2 ** 10)
+
+    learner.fit(chunks(df, 1000), classes=['leve', 'pesado'])
+    metrics = learner.metrics_frame()
+
+    assert len(metrics) == 3
+    assert (metrics.loc[1:, 'sgd_classifier_accuracy'] > 0.95).all()
+
+
+def test_iterable_source_needs_classes():
+    learner = IncrementalLearning(categorical_cols=['modelo'], target_col='tipoequipamento')
+    with pytest.raises(ValueError):
+        learner.fit(chunks(make_frame(100), 50))
+
+
+def test_at_least_one_feature_column_is_required():
+    with pytest.raises(Exception):
+        IncrementalLearning(target_col='tipoequipamento')
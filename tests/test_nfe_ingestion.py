@@ -0,0 +1,206 @@
+import asyncio
+import datetime
+from services.nfe_ingestion import NfeIngestionPipeline, CHECKPOINT_TABLE
+from services.sqlite_storage import SqliteStorage
+
+# Same NOT NULL constraints as sql/ml_nf_ddl.sql
+DDL = [
+    'CREATE TABLE rec_ml_nota_fiscal (id BIGINT NOT NULL PRIMARY KEY, chave_nf VARCHAR(100) NOT NULL, '
+    'cnpj_fornecedor VARCHAR(20) NOT NULL, data_emissao DATETIME NOT NULL, valor_total MONEY)',
+    'CREATE TABLE rec_ml_nota_fiscal_item (id BIGINT NOT NULL PRIMARY KEY, nota_fiscal_ml_id BIGINT NOT NULL, '
+    'ncm VARCHAR(100), descricao VARCHAR(100), quantidade MONEY, valor_unitario MONEY, desconto MONEY, '
+    'aliq_icms MONEY, valor_icms MONEY, valor_total MONEY)',
+]
+
+
+def nfe(chave, cnpj='11222333000181', dh_emi='2024-10-02T10:00:00-03:00', cpf=None, n_items=2):
+    emit = {'CPF': cpf} if cpf else {'CNPJ': cnpj}
+    det = [{'@nItem': str(i), 'prod': {'NCM': '27101259', 'xProd': f'Diesel S10 {i}', 'qCom': '10.0', 'vUnCom': '6.10',
+                                       'vProd': '61.00'},
+            'imposto': {'ICMS': {'ICMS60': {'pICMS': '0', 'vICMS': '0'}}}} for i in range(1, n_items + 1)]
+    return {'nfeProc': {'NFe': {'infNFe': {'@Id': f'NFe{chave}', 'ide': {'dhEmi': dh_emi}, 'emit': emit, 'det': det,
+                                           'total': {'ICMSTot': {'vNF': f'{61.0 * n_items:.2f}'}}}},
+                        'protNFe': {'infProt': {'chNFe': chave}}}}
+
+
+class FakeSerproClient:
+    """Stands in for SerproAsyncClient: payloads per CNPJ, optional failures per (cnpj, start)."""
+
+    def __init__(self, documents, failures=None):
+        self.documents = documents
+        self.failures = set(failures or [])
+        self.calls = []
+        self.tokens = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def consultar_nfs_por_cnpj(self, token_autorizacao, cnpj, data_inicio=None, data_fim=None):
+        self.calls.append((cnpj, data_inicio, data_fim))
+        self.tokens[cnpj] = token_autorizacao
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if (cnpj, data_inicio) in self.failures:
+                raise Exception('503 - Service Unavailable')
+            return {'documentos': self.documents.get((cnpj, data_inicio), [])}
+        finally:
+            self.in_flight -= 1
+
+
+def make_target(tmp_path):
+    path = str(tmp_path / 'nfe.db')
+    storage = SqliteStorage(path)
+    for statement in DDL:
+        storage.conn.execute(statement)
+    storage.conn.commit()
+    storage.close()
+    return lambda: SqliteStorage(path)
+
+
+def count(target_factory, table):
+    storage = target_factory()
+    try:
+        return storage.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        storage.close()
+
+
+def tokens(*cnpjs):
+    return {cnpj: f'token-{cnpj}' for cnpj in cnpjs}
+
+
+def run(pipeline, data_inicio, data_fim, cnpjs):
+    return asyncio.run(pipeline.run(data_inicio, data_fim, cnpjs=cnpjs))
+
+
+def test_chave_nf_is_written_once(tmp_path):
+    target = make_target(tmp_path)
+    shared = nfe('35241011222333000181550010000000011000000011')
+    documents = {
+        ('111', '2024-10-01'): [shared, nfe('35241011222333000181550010000000021000000021')],
+        ('222', '2024-10-01'): [shared],  # Same note returned for another CNPJ
+    }
+    pipeline = NfeIngestionPipeline(FakeSerproClient(documents), target, tokens('111', '222'), window_days=7, batch_size=1)
+
+    metrics = run(pipeline, '2024-10-01', '2024-10-08', ['111', '222'])
+
+    assert metrics['failed_windows'] == 0
+    assert count(target, 'rec_ml_nota_fiscal') == 2
+    assert count(target, 'rec_ml_nota_fiscal_item') == 4
+
+
+def test_rerun_resumes_after_failed_window(tmp_path):
+    target = make_target(tmp_path)
+    documents = {
+        ('111', '2024-10-01'): [nfe('35241011222333000181550010000000011000000011')],
+        ('111', '2024-10-08'): [nfe('35241011222333000181550010000000021000000021')],
+    }
+    client = FakeSerproClient(documents, failures=[('111', '2024-10-08')])
+    pipeline = NfeIngestionPipeline(client, target, tokens('111'), window_days=7)
+
+    metrics = run(pipeline, '2024-10-01', '2024-10-15', ['111'])
+    assert metrics['failed_windows'] == 1
+    assert count(target, 'rec_ml_nota_fiscal') == 1
+
+    client.failures.clear()
+    client.calls.clear()
+    metrics = run(pipeline, '2024-10-01', '2024-10-15', ['111'])
+
+    # Only the failed window is fetched again, and nothing is duplicated
+    assert client.calls == [('111', '2024-10-08', '2024-10-15')]
+    assert metrics['skipped_windows'] == 1
+    assert count(target, 'rec_ml_nota_fiscal') == 2
+    assert count(target, 'rec_ml_nota_fiscal_item') == 4
+    assert count(target, CHECKPOINT_TABLE) == 2
+
+
+def test_truncated_last_window_is_fetched_again(tmp_path):
+    target = make_target(tmp_path)
+    client = FakeSerproClient({('111', '2024-10-01'): [nfe('35241011222333000181550010000000011000000011')]})
+    pipeline = NfeIngestionPipeline(client, target, tokens('111'), window_days=7)
+
+    run(pipeline, '2024-10-01', '2024-10-04', ['111'])
+    client.calls.clear()
+    run(pipeline, '2024-10-01', '2024-10-08', ['111'])
+
+    # [10-01, 10-04) was done, but [10-01, 10-08) was not
+    assert client.calls == [('111', '2024-10-01', '2024-10-08')]
+    assert count(target, 'rec_ml_nota_fiscal') == 1
+
+
+def test_invalid_documents_are_skipped_and_counted(tmp_path):
+    target = make_target(tmp_path)
+    documents = {('111', '2024-10-01'): [
+        nfe('35241011222333000181550010000000011000000011'),
+        nfe('35241011222333000181550010000000021000000021', cpf='12345678909'),
+        nfe('35241011222333000181550010000000031000000031', dh_emi='sem data'),
+    ]}
+    pipeline = NfeIngestionPipeline(FakeSerproClient(documents), target, tokens('111'), window_days=7)
+
+    metrics = run(pipeline, '2024-10-01', '2024-10-08', ['111'])
+
+    assert metrics['notas'] == 1
+    assert metrics['notas_rejeitadas'] == 2
+    assert {r['motivo'] for r in pipeline.rejected} == {'emitente sem CNPJ', 'data_emissao ausente ou inválida'}
+    assert count(target, 'rec_ml_nota_fiscal') == 1
+    assert count(target, 'rec_ml_nota_fiscal_item') == 2
+    # The window still completes, so the valid note is not fetched again
+    assert count(target, CHECKPOINT_TABLE) == 1
+
+
+def test_each_cnpj_is_queried_with_its_own_token(tmp_path):
+    target = make_target(tmp_path)
+    client = FakeSerproClient({})
+    pipeline = NfeIngestionPipeline(client, target, tokens('111', '222'), window_days=7)
+
+    metrics = run(pipeline, '2024-10-01', '2024-10-08', ['111', '222', '333'])
+
+    assert client.tokens == {'111': 'token-111', '222': 'token-222'}
+    assert metrics['cnpjs'] == 2 and metrics['cnpjs_sem_token'] == 1
+
+
+def test_tokens_are_read_from_the_token_table(tmp_path):
+    target = make_target(tmp_path)
+    storage = target()
+    storage.conn.execute('CREATE TABLE rec_ml_token_autorizacao (cnpj VARCHAR(20) NOT NULL PRIMARY KEY, token_autorizacao VARCHAR(255) NOT NULL)')
+    storage.conn.execute("INSERT INTO rec_ml_token_autorizacao VALUES ('111', 'token-da-tabela')")
+    storage.conn.commit()
+    storage.close()
+    client = FakeSerproClient({})
+
+    run(NfeIngestionPipeline(client, target, window_days=7), '2024-10-01', '2024-10-08', ['111'])
+
+    assert client.tokens == {'111': 'token-da-tabela'}
+
+
+def test_fetches_are_bounded_by_max_workers(tmp_path):
+    target = make_target(tmp_path)
+    cnpjs = [str(i) for i in range(10)]
+    client = FakeSerproClient({})
+    pipeline = NfeIngestionPipeline(client, target, tokens(*cnpjs), window_days=7, max_workers=3, queue_size=2)
+
+    metrics = run(pipeline, '2024-10-01', '2024-10-29', cnpjs)
+
+    assert len(client.calls) == 40
+    assert client.max_in_flight == 3
+    assert count(target, CHECKPOINT_TABLE) == metrics['windows'] == 40
+
+
+def test_window_ending_today_is_not_checkpointed(tmp_path):
+    target = make_target(tmp_path)
+    today = datetime.date.today()
+    start = (today - datetime.timedelta(days=10)).strftime('%Y-%m-%d')
+    middle = (today - datetime.timedelta(days=3)).strftime('%Y-%m-%d')
+    client = FakeSerproClient({('111', middle): [nfe('35241011222333000181550010000000011000000011')]})
+    pipeline = NfeIngestionPipeline(client, target, tokens('111'), window_days=7)
+
+    metrics = run(pipeline, start, today, ['111'])
+    assert metrics['open_windows'] == 1
+    assert count(target, CHECKPOINT_TABLE) == 1
+
+    # The open window is fetched again and its notes are not duplicated
+    client.calls.clear()
+    run(pipeline, start, today, ['111'])
+    assert client.calls == [('111', middle, today.strftime('%Y-%m-%d'))]
+    assert count(target, 'rec_ml_nota_fiscal') == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from analysis_generators._row_classifier import RowClassifier
+
+
+def statistical_frame(n=2000, seed=0):
+    # Values drawn around the rule thresholds (count 5/50, stddev 0.1, ...), plus exact boundary values
+    rng = np.random.default_rng(seed)
+    avg = rng.choice([0.0, 0.05, 0.2, 1.0, 10.0], n) + rng.random(n)
+    df = pd.DataFrame({
+        'count': rng.choice([0, 4, 5, 6, 50, 51, 200], n),
+        'stddev': rng.choice([0.0, 0.05, 0.1, 0.5, 3.0], n),
+        'avg': avg,
+        'median': avg * rng.choice([0.9, 0.97, 1.0, 1.2], n),
+        'min': avg * rng.choice([0.0, 0.1, 0.5, 0.9], n),
+        'max': avg * rng.choice([1.0, 1.2, 1.5, 2.0, 6.0], n),
+    })
+    df['sum'] = df['avg'] * df['count'] * rng.choice([0.9, 1.0, 1.1], n)
+    df.loc[::97, 'avg'] = np.nan
+    return df
+
+
+def ml_frame(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'consensus_count': rng.integers(0, 4, n),
+        'trend_detected': rng.choice(['Consistent Trend', 'Inconsistent Trend', 'No Trend'], n),
+        'model_agreement': rng.integers(0, 4, n),
+        'relationship': rng.choice(['Clear Relationship', 'Potential Anomaly', 'Unclear'], n),
+        'performance_reliability': rng.choice([0.0, 0.3, 0.4, 0.5, 0.7, 0.9], n),
+    })
+
+
+def test_statistical_frame_matches_row_classifier():
+    classifier = RowClassifier()
+    df = statistical_frame()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rows = [classifier.classify_statistical_row(row) for _, row in df.iterrows()]
+    frame = classifier.classify_statistical_frame(df)
+
+    assert frame['description_code'].tolist() == [code for _, _, code in rows]
+    assert frame['weight_score'].tolist() == [weight for weight, _, _ in rows]
+    assert frame['description'].tolist() == [description for _, description, _ in rows]
+
+
+def test_ml_frame_matches_row_classifier():
+    classifier = RowClassifier()
+    df = ml_frame()
+
+    rows = [classifier.classify_ml_row(row) for _, row in df.iterrows()]
+    frame = classifier.classify_ml_frame(df)
+
+    assert frame['description_code'].tolist() == [r['description_code'] for r in rows]
+    assert frame['ml_weight_score'].tolist() == [r['ml_weight_score'] for r in rows]
+    assert frame['ml_good_or_bad'].tolist() == [r['ml_good_or_bad'] for r in rows]
+
+
+def test_every_mask_agrees_with_its_lambda():
+    # Rule by rule, not only the first match, so a shadowed rule cannot drift unnoticed
+    classifier = RowClassifier()
+    for lookups, df in ((classifier.stat_condition_lookups, statistical_frame(500, seed=1)),
+                        (classifier.ml_condition_lookups, ml_frame(500, seed=1))):
+        for condition in lookups:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                expected = [bool(condition['lambda'](row)) for _, row in df.iterrows()]
+            assert np.asarray(condition['mask'](df), dtype=bool).tolist() == expected, condition['description_code']
@@ -0,0 +1,37 @@
+import numpy as np
+from services.geo_services import haversine_km
+from services.spatial_buckets import CellIndex
+
+
+def brute_force_nearest(ref_lat, ref_lon, lat, lon, max_km):
+    dist = haversine_km(lat[:, None], lon[:, None], ref_lat[None, :], ref_lon[None, :])
+    best = dist.argmin(axis=1)
+    nearest = dist[np.arange(len(lat)), best]
+    return np.where(nearest <= max_km, nearest, np.nan)
+
+
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    ref_lat, ref_lon = -23.5 + rng.random(300) * 0.5, -46.6 + rng.random(300) * 0.5
+    lat, lon = -23.5 + rng.random(500) * 0.5, -46.6 + rng.random(500) * 0.5
+    index = CellIndex(np.arange(300), ref_lat, ref_lon, precision=6)
+
+    distances, ids = index.nearest(lat, lon, max_km=2)
+
+    np.testing.assert_allclose(distances, brute_force_nearest(ref_lat, ref_lon, lat, lon, 2))
+    found = ~np.isnan(distances)
+    np.testing.assert_allclose(haversine_km(lat[found], lon[found], ref_lat[ids[found].astype(int)], ref_lon[ids[found].astype(int)]),
+                               distances[found])
+
+
+def test_invalid_query_points_get_nan_without_failing_the_join():
+    index = CellIndex(['a', 'b', 'polar'], [-23.5, -23.51, 89.0], [-46.6, -46.61, 0.0], precision=6)
+    lat = np.array([-23.5001, 0.0, 88.0, np.nan, -23.52])
+    lon = np.array([-46.6001, 0.0, 0.0, 1.0, -46.6])
+
+    distances, ids = index.nearest(lat, lon, max_km=5)
+
+    # 0/0 (missing location), beyond 85° and NaN rows are skipped; the reference point beyond 85° is left out
+    assert len(index) == 2
+    assert ids.tolist() == ['a', None, None, None, 'b']
+    assert np.isnan(distances[1:4]).all() and not np.isnan(distances[[0, 4]]).any()
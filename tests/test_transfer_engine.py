@@ -0,0 +1,113 @@
+from services.sqlite_storage import SqliteStorage
+from services.transfer_engine import CHECKPOINT_TABLE, STAGING_SUFFIX, TransferEngine
+
+ROWS = [(i, f'item {i}', i * 1.5) for i in range(1, 11)]
+
+
+def make_db(tmp_path, name, rows=None):
+    path = str(tmp_path / name)
+    storage = SqliteStorage(path)
+    storage.conn.execute('CREATE TABLE item (id BIGINT, nome NVARCHAR(100), valor FLOAT)')
+    if rows:
+        storage.conn.executemany('INSERT INTO item VALUES (?, ?, ?)', rows)
+    storage.conn.commit()
+    storage.close()
+    return lambda: SqliteStorage(path)
+
+
+def query(factory, sql):
+    storage = factory()
+    try:
+        return storage.conn.execute(sql).fetchall()
+    finally:
+        storage.close()
+
+
+def execute(factory, sql):
+    storage = factory()
+    try:
+        storage.conn.execute(sql)
+        storage.conn.commit()
+    finally:
+        storage.close()
+
+
+def fail_after_first_batch(engine, target):
+    # The second batch's checkpoint update aborts, rolling back the batch with it
+    engine.ensure_checkpoint_table()
+    execute(target, f'CREATE TRIGGER fail_batch BEFORE UPDATE ON {CHECKPOINT_TABLE} WHEN NEW.rows_copied > 3 '
+                    f"BEGIN SELECT RAISE(ABORT, 'connection lost'); END")
+
+
+def test_keyset_pagination_copies_every_row_in_batches(tmp_path):
+    source = make_db(tmp_path, 'source.db', list(reversed(ROWS)))
+    target = make_db(tmp_path, 'target.db')
+    engine = TransferEngine(source, target, job_name='job', batch_size=3)
+
+    results = engine.run([{'table': 'item', 'where': 'id > 2'}])
+
+    assert results[0]['status'] == 'done' and results[0]['rows'] == 8
+    assert query(target, 'SELECT id, nome, valor FROM item ORDER BY id') == ROWS[2:]
+    assert query(target, f'SELECT last_key, rows_copied, status FROM {CHECKPOINT_TABLE}') == [('10', 8, 'done')]
+    assert engine.build_source_query('item', 'id', 'id > 2', 7) == ('SELECT * FROM item WHERE (id > 2) AND id > ? ORDER BY id', [7])
+
+    # A finished table is skipped on the next run of the same job
+    assert engine.run(['item'])[0]['status'] == 'skipped'
+    assert len(query(target, 'SELECT id FROM item')) == 8
+
+
+def test_failed_run_resumes_after_last_committed_key(tmp_path):
+    source = make_db(tmp_path, 'source.db', ROWS)
+    target = make_db(tmp_path, 'target.db')
+    engine = TransferEngine(source, target, job_name='job', batch_size=3)
+    fail_after_first_batch(engine, target)
+
+    assert engine.run(['item'])[0]['status'] == 'failed'
+    assert query(target, 'SELECT id FROM item ORDER BY id') == [(1,), (2,), (3,)]
+    assert query(target, f'SELECT last_key, rows_copied, status FROM {CHECKPOINT_TABLE}') == [('3', 3, 'in_progress')]
+
+    execute(target, 'DROP TRIGGER fail_batch')
+    results = engine.run(['item'])
+
+    assert results[0]['status'] == 'done' and results[0]['rows'] == 7
+    assert query(target, 'SELECT id, nome, valor FROM item ORDER BY id') == ROWS
+    assert query(target, f'SELECT last_key, rows_copied, status FROM {CHECKPOINT_TABLE}') == [('10', 10, 'done')]
+
+
+def test_replace_mode_keeps_target_until_the_copy_completes(tmp_path):
+    stale = [(100, 'old', 0.0), (101, 'old', 0.0)]
+    source = make_db(tmp_path, 'source.db', ROWS)
+    target = make_db(tmp_path, 'target.db', stale)
+    engine = TransferEngine(source, target, job_name='job', batch_size=3)
+    fail_after_first_batch(engine, target)
+
+    assert engine.run([{'table': 'item', 'mode': 'replace'}])[0]['status'] == 'failed'
+    assert query(target, 'SELECT id, nome, valor FROM item ORDER BY id') == stale
+    assert query(target, f'SELECT id FROM item{STAGING_SUFFIX} ORDER BY id') == [(1,), (2,), (3,)]
+
+    execute(target, 'DROP TRIGGER fail_batch')
+    results = engine.run([{'table': 'item', 'mode': 'replace'}])
+
+    assert results[0]['status'] == 'done'
+    assert query(target, 'SELECT id, nome, valor FROM item ORDER BY id') == ROWS
+    assert query(target, f"SELECT name FROM sqlite_master WHERE name = 'item{STAGING_SUFFIX}'") == []
+
+
+def test_replace_mode_with_where_only_replaces_matching_rows(tmp_path):
+    source = make_db(tmp_path, 'source.db', ROWS)
+    target = make_db(tmp_path, 'target.db', [(1, 'kept', 0.0), (9, 'old', 0.0), (50, 'old', 0.0)])
+    engine = TransferEngine(source, target, job_name='job', batch_size=4)
+
+    assert engine.run([{'table': 'item', 'mode': 'replace', 'where': 'id >= 5'}])[0]['status'] == 'done'
+    assert query(target, 'SELECT id, nome FROM item ORDER BY id') == [(1, 'kept')] + [(i, f'item {i}') for i in range(5, 11)]
+
+
+def test_missing_target_table_is_created(tmp_path):
+    source = make_db(tmp_path, 'source.db', ROWS)
+    target_path = str(tmp_path / 'empty.db')
+    target = lambda: SqliteStorage(target_path)
+    engine = TransferEngine(source, target, job_name='job', batch_size=4, create_missing_tables=True)
+
+    assert engine.run([{'table': 'item', 'mode': 'replace'}])[0]['status'] == 'done'
+    # sqlite3 reports no column types, so the created columns are all text
+    assert query(target, 'SELECT CAST(id AS INTEGER), nome FROM item ORDER BY CAST(id AS INTEGER)') == [row[:2] for row in ROWS]
@@ -0,0 +1,45 @@
+import os
+import datetime
+from dotenv import load_dotenv
+from services.sql_storage import ConnectionType, SqlStorage
+from services.transfer_engine import TransferEngine
+load_dotenv()
+
+# Tables copied from SINGESTAO to the results database; transacao follows the date window,
+# the other tables are reloaded in full (mode 'replace')
+TABLES = ['transacao', 'bandeira_produto', 'cartao', 'cliente', 'cliente_interno', 'contrato_cliente',
+          'contrato_credenciado', 'contrato_credenciado_servico', 'credenciado', 'detalhe_item_pedido_carga',
+          'item_pedido_carga', 'operacao_adquirencia', 'operacao_adquirencia_produto', 'operacao_emissao',
+          'operacao_emissao_produto', 'operador', 'pedido_carga', 'portador', 'produto', 'recurso_cliente', 'rota']
+
+days = int(os.getenv('TRANSFER_DAYS', 7))
+end_date = datetime.date.today()
+start_date = end_date - datetime.timedelta(days=days)
+
+def create_storage(prefix):
+    return lambda: SqlStorage(
+        connection_type=ConnectionType.SQL_SERVER,
+        host=os.getenv(f'{prefix}_SQL_HOSTNAME'),
+        port=os.getenv(f'{prefix}_SQL_PORT', 1433),
+        database=os.getenv(f'{prefix}_SQL_DATABASE'),
+        username=os.getenv(f'{prefix}_SQL_USERNAME'),
+        password=os.getenv(f'{prefix}_SQL_PASSWORD'),
+        pooled=True)
+
+tables = []
+for table in TABLES:
+    if table == 'transacao':
+        tables.append({'table': table, 'key_column': 'id', 'mode': 'append',
+                       'where': f"data_hora_transacao_inicio >= '{start_date}' AND data_hora_transacao_inicio < '{end_date}'"})
+    else:
+        tables.append({'table': table, 'key_column': 'id', 'mode': 'replace'})
+
+if __name__ == '__main__':
+    engine = TransferEngine(
+        source_factory=create_storage('SOURCE'),
+        target_factory=create_storage('TARGET'),
+        job_name=f'{start_date}_{end_date}',
+        batch_size=int(os.getenv('TRANSFER_BATCH_SIZE', 10000)),
+        max_workers=int(os.getenv('TRANSFER_MAX_WORKERS', 4)))
+
+    engine.run(tables)